@@ -10,9 +10,10 @@ from scripts.utils import collector, inspector
 from scripts.dataset_uploading import main as upload_data
 from scripts.dataset_uploading import dataset_langs
 from scripts.datasets_to_tokens import convert_to_tokens, get_global_token_counts
-from scripts.get_word_info import collect_info
+from scripts.get_word_info import iter_collect_info
 from scripts.visualize_interactive_graph import export_graph_to_html
 from scripts.word_magnitude import influential_words
+from src.profiling import ParseProfiler
 from src.utils import convert_language, export_to_json, flatten_dict
 
 os.system("cls")
@@ -22,9 +23,17 @@ deorphanization_level = 2
 limit = 3 if EXPERIMENTAL else 10
 vocab_file = 'json/collected.txt'
 top_k = 3 if EXPERIMENTAL else 0
+# Time each parsing phase, cProfile 1% of the pages, and write the slowest pages to json/slowest_pages.txt.
+PROFILE = False
+# Write flushed batches to the database on a background thread while crawling goes on.
+ASYNC_WRITES = True
 
 if not os.path.isdir('./json'):
     os.mkdir('json')
+if PROFILE:
+    parser.profiler = ParseProfiler(top_n=25, sample_rate=.01)
+if ASYNC_WRITES:
+    collector.start_writer(max_queue=4)
 
 
 datasets = None
@@ -99,16 +108,18 @@ if PHASE <= 3:
         vocab.set_description(f"[Started at {datetime.now().strftime('%H:%M:%S')}] - ({fix_ar_display(word)})")
         word = get_word_info_prep(word.strip())
 
-        result = collect_info(word, lang, wait_time=.1, save_to_db=True, existing_vocab=existing_vocab_)
-        
-        result_len = {k: len(result[k]) for k in result}
+        # save_word buffers each page as soon as it is parsed; the batch is flushed
+        # after every word, to the background writer when there is one.
+        result_len = {}
+        for result in iter_collect_info(word, lang, wait_time=.1, save_to_db=True, existing_vocab=existing_vocab_):
+            for k in result:
+                result_len[k] = result_len.get(k, 0) + len(result[k])
+        collector.flush()
+        if collector.writer is not None:
+            result_len.update(queued=collector.writer.depth, lag=f"{collector.writer.lag:.1f}s")
         vocab.set_postfix(result_len)
         existing_vocab_.append(e['token'])
 
-        # export_to_json(result, "results.json")
-        collector.insert_word_data(**result)
-        collector.update_word_data(**result)
-
 if PHASE <= 4:
     SUPPORTED_LANGS = {'arabic', 'english'}
     for rd, default_lang in enumerate(['english', None], start=1):
@@ -143,8 +154,10 @@ if PHASE <= 4:
                                 save_orphan=False, # (rd == deorphanization_level), 
                                 save_mentions=False
                             )
+        # The next round reads the orphan nodes this one wrote.
+        collector.sync()
 
-    # collector.flush()
+collector.close()
 
 
 
@@ -154,3 +167,6 @@ if PHASE <= 4:
 
 if PHASE <= 6:
     export_graph_to_html('graph.html')
+
+if parser.profiler is not None:
+    parser.profiler.dump('json/slowest_pages.txt')
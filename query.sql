@@ -24,14 +24,14 @@ CREATE TABLE IF NOT EXISTS `{dataset_table}` (
 --
 
 CREATE TABLE IF NOT EXISTS `{word_table}` (
-  `id` varchar(64) NOT NULL,
+  `id` {id_type} NOT NULL,
   `word` varchar(255) DEFAULT NULL,
   `query` varchar(255) DEFAULT NULL,
   `language` varchar(255) DEFAULT NULL,
   `etymology` text DEFAULT NULL,
   `wikiUrl` text DEFAULT NULL,
   `isDerived` BOOLEAN,
-  PRIMARY KEY (`id`(64))
+  PRIMARY KEY (`id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 -- ALTER TABLE `{word_table}` ADD INDEX(`word`);
 -- --------------------------------------------------------
@@ -41,13 +41,13 @@ CREATE TABLE IF NOT EXISTS `{word_table}` (
 --
 
 CREATE TABLE IF NOT EXISTS `{definitions_table}` (
-  `id` varchar(64) NOT NULL,
-  `wordId` varchar(64) NOT NULL,
+  `id` {id_type} NOT NULL,
+  `wordId` {id_type} NOT NULL,
   `partOfSpeech` varchar(16) NOT NULL,
   `text` varchar(1024) NOT NULL,
   `headword` varchar(256) NOT NULL , 
   -- `dialect` varchar(255) DEFAULT NULL,
-  PRIMARY KEY (`id`(64)),
+  PRIMARY KEY (`id`),
   CONSTRAINT fk_wordId FOREIGN KEY (wordId)  
   REFERENCES {word_table}(id)  
   ON DELETE CASCADE  
@@ -61,12 +61,12 @@ CREATE TABLE IF NOT EXISTS `{definitions_table}` (
 --
 
 CREATE TABLE IF NOT EXISTS `appendix` (
-  `id` varchar(64) NOT NULL,
+  `id` {id_type} NOT NULL,
   `label` varchar(255) NOT NULL,
   `description` varchar(1024) DEFAULT NULL,
   `wikiUrl` varchar(255) DEFAULT NULL,
   `category` varchar(255) DEFAULT NULL ,
-  PRIMARY KEY (`id`(64))
+  PRIMARY KEY (`id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
 -- --------------------------------------------------------
@@ -76,8 +76,8 @@ CREATE TABLE IF NOT EXISTS `appendix` (
 --
 
 CREATE TABLE IF NOT EXISTS `{definitions_table}_apx` (
-  `definitionId` varchar(64) NOT NULL,
-  `appendixId` varchar(64) NOT NULL , 
+  `definitionId` {id_type} NOT NULL,
+  `appendixId` {id_type} NOT NULL , 
   CONSTRAINT fk_definitionId FOREIGN KEY (definitionId)  
   REFERENCES {definitions_table}(id)  
   ON DELETE CASCADE  
@@ -95,8 +95,8 @@ CREATE TABLE IF NOT EXISTS `{definitions_table}_apx` (
 --
 
 CREATE TABLE IF NOT EXISTS `{edge_table}` (
-  `headDefinitionId` varchar(64) NOT NULL,
-  `wordId` varchar(64) DEFAULT NULL,
+  `headDefinitionId` {id_type} NOT NULL,
+  `wordId` {id_type} DEFAULT NULL,
   `relationshipType` varchar(64) DEFAULT NULL , 
   CONSTRAINT fk_definitionIdRel FOREIGN KEY (headDefinitionId)  
   REFERENCES {definitions_table}(id)  
@@ -116,7 +116,7 @@ CREATE TABLE IF NOT EXISTS `{edge_table}` (
 --
 
 CREATE TABLE IF NOT EXISTS `categories` (
-  `id` VARCHAR(64) NOT NULL , 
+  `id` {id_type} NOT NULL , 
   `title` TEXT NOT NULL , 
   `text` TEXT NOT NULL , 
   `sourceList` VARCHAR(64) NOT NULL , 
@@ -131,8 +131,8 @@ CREATE TABLE IF NOT EXISTS `categories` (
 --
 
 CREATE TABLE IF NOT EXISTS `word_categories` (
-  `wordId` varchar(64) NOT NULL,
-  `categoryId` varchar(64) NOT NULL , 
+  `wordId` {id_type} NOT NULL,
+  `categoryId` {id_type} NOT NULL , 
   CONSTRAINT fk_wordCatgId FOREIGN KEY (wordId)  
   REFERENCES {word_table}(id)  
   ON DELETE CASCADE  
@@ -150,7 +150,7 @@ CREATE TABLE IF NOT EXISTS `word_categories` (
 --
 CREATE TABLE IF NOT EXISTS `examples` (
     id INT PRIMARY KEY AUTO_INCREMENT,
-    definitionId varchar(64) NOT NULL , 
+    definitionId {id_type} NOT NULL , 
     quotation TEXT NOT NULL,
     transliteration TEXT NULL,
     translation TEXT NULL,
@@ -0,0 +1,276 @@
+"""
+Compare the ways the collector writes to MySQL: UPDATE then INSERT, upsert,
+and bulk load (LOAD DATA LOCAL INFILE), on rows parsed from tests/html_test_files.
+With `--binary-database`, also compare the GraphBuilder join queries over
+varchar(64) hex ids and BINARY(32) ids. Without a database, the same joins
+run on SQLite over TEXT and BLOB keys, as a rough proxy of that comparison.
+
+    python -m scripts.benchmark_db --offline
+    python -m scripts.benchmark_db --database knowledge_graph_bench --scale 200
+    python -m scripts.benchmark_db --database kg_bench_hex --binary-database kg_bench_bin --scale 200
+
+The tables of these databases are created if needed and TRUNCATED before
+every run: use scratch databases. Bulk loading needs
+`SET GLOBAL local_infile = 1` on the server.
+"""
+
+import argparse
+import copy
+import hashlib
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.append('.')
+from scripts.benchmark_parser import load_corpus, make_parser
+import src.collector
+from src.collector import Collector
+from src.database import MySQLClient, write_tsv
+from src.utils import hash_id, hex_id
+
+
+# Columns holding ids of rows written by the collector, salted per copy so
+# that every copy of the corpus is new to the database.
+ID_COLUMNS = ['id', 'wordId', 'definitionId', 'headDefinitionId']
+
+
+def corpus_records(corpus=None):
+    corpus = load_corpus() if corpus is None else corpus
+    parser = make_parser(engine='lxml')
+    return [parser.fetch(word, language=languages, old_id=old_id) for word, old_id, languages in corpus]
+
+
+def corpus_batch(records, binary_ids=False):
+    """The rows `Collector.save_word` produces for the parsed pages `records`, as one batch."""
+    collector = Collector(None, binary_ids=binary_ids)
+    batch = {}
+    for page in records:
+        for table, rows in collector.save_word(copy_records(page), save_to_db=False).items():
+            batch.setdefault(table, []).extend(rows)
+    return batch
+
+
+def copy_records(page):
+    # save_word pops keys out of the records it is given.
+    return copy.deepcopy(page)
+
+
+def scaled_batch(batch, scale):
+    """`scale` copies of `batch`, with the ids of each copy salted so they do not collide."""
+    scaled = {table: [] for table in batch}
+    for n in range(scale):
+        salt = {}
+        for table, rows in batch.items():
+            for row in rows:
+                row = dict(row)
+                for column in ID_COLUMNS:
+                    if row.get(column) is not None:
+                        key = (n, row[column])
+                        if key not in salt:
+                            digest = hashlib.sha256(f"{n} {hex_id(row[column])}".encode())
+                            salt[key] = digest.digest() if isinstance(row[column], bytes) else digest.hexdigest()
+                        row[column] = salt[key]
+                scaled[table].append(row)
+    return scaled
+
+
+def count_rows(batch):
+    return sum(len(rows) for rows in batch.values())
+
+
+def bench_tsv(batch, rounds=5):
+    """Time writing the batch as LOAD DATA files, the client side of a bulk load."""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for rows in batch.values():
+            if rows:
+                columns = sorted(set().union(*[row.keys() for row in rows]))
+                write_tsv(rows, columns, io.StringIO())
+    elapsed = (time.perf_counter() - start) / rounds
+    print(f"{'tsv':>12}: {count_rows(batch) / elapsed:10.0f} rows/s serialized")
+    return {"rows_per_second": count_rows(batch) / elapsed}
+
+
+def bench_hashing(records, rounds=3):
+    """
+    Time `save_word` over the corpus with the memoized `hash_id` and with plain
+    sha256, and report how many of the hashed strings were repeats.
+    """
+    results = {}
+    uncached = hash_id.__wrapped__
+    for label, hash_function in [('sha256', uncached), ('memoized', hash_id)]:
+        hash_id.cache_clear()
+        src.collector.hash_id = hash_function
+        try:
+            collector = Collector(None)
+            pages = [[copy_records(page) for page in records] for _ in range(rounds)]
+            start = time.perf_counter()
+            for round_pages in pages:
+                for page in round_pages:
+                    collector.save_word(page, save_to_db=False)
+            elapsed = (time.perf_counter() - start) / rounds
+        finally:
+            src.collector.hash_id = hash_id
+        results[label] = {"save_word_ms": 1000 * elapsed}
+        print(f"{label:>12}: save_word over the corpus in {1000 * elapsed:7.1f} ms")
+    info = hash_id.cache_info()
+    results['hit_rate'] = info.hits / max(info.hits + info.misses, 1)
+    print(f"{'':>12}  {100 * results['hit_rate']:.0f}% of the hashed strings were hashed before")
+    return results
+
+
+# The queries GraphBuilder runs to build the graph.
+JOIN_QUERIES = ['word2word', 'def2word', 'def2def', 'get_vocab', 'get_category_relations', 'get_appendix_relations']
+
+
+# The tables and keys of query.sql that the GraphBuilder joins go through, and
+# those joins, for SQLite. InnoDB tables are clustered on their primary key
+# and foreign keys are indexed, hence WITHOUT ROWID tables and the indexes.
+SQLITE_TABLES = {
+    "words": ("CREATE TABLE words (id {key} PRIMARY KEY, word TEXT, language TEXT, wikiUrl TEXT) WITHOUT ROWID",
+              ["id", "word", "language", "wikiUrl"]),
+    "definitions": ("CREATE TABLE definitions (id {key} PRIMARY KEY, wordId {key}, partOfSpeech TEXT, headword TEXT, "
+                    "text TEXT) WITHOUT ROWID", ["id", "wordId", "partOfSpeech", "headword", "text"]),
+    "related_words": ("CREATE TABLE relationships (headDefinitionId {key}, wordId {key}, relationshipType TEXT)",
+                      ["headDefinitionId", "wordId", "relationshipType"]),
+    "categories": ("CREATE TABLE word_categories (wordId {key}, categoryId {key})", ["wordId", "categoryId"]),
+    "appendices": ("CREATE TABLE definitions_apx (definitionId {key}, appendixId {key})", ["definitionId", "appendixId"]),
+}
+SQLITE_INDEXES = [
+    "CREATE INDEX fk_wordId ON definitions (wordId)",
+    "CREATE INDEX fk_definitionIdRel ON relationships (headDefinitionId)",
+    "CREATE INDEX fk_wordIdRel ON relationships (wordId)",
+    "CREATE INDEX fk_wordCatgId ON word_categories (wordId)",
+    "CREATE INDEX fk_definitionId ON definitions_apx (definitionId)",
+]
+SQLITE_JOINS = {
+    "def2word": "SELECT hdef.headword, hdef.partOfSpeech, hdef.wordId, r.relationshipType, tdef.headword, tdef.partOfSpeech, "
+                "tdef.wordId FROM relationships r JOIN definitions hdef ON hdef.id = r.headDefinitionId "
+                "LEFT JOIN definitions tdef ON tdef.wordId = r.wordId",
+    "def2def": "SELECT hdef.wordId, hdef.headword, r.relationshipType, tdef.headword, tdef.wordId, tdef.text "
+               "FROM definitions tdef JOIN relationships r ON tdef.wordId = r.wordId "
+               "JOIN definitions hdef ON hdef.id = r.headDefinitionId",
+    "get_vocab": "SELECT d.partOfSpeech, w.* FROM words w JOIN definitions d ON w.id = d.wordId",
+    "get_category_relations": "SELECT w.id, d.partOfSpeech, w.word, wc.categoryId FROM word_categories wc "
+                              "JOIN definitions d ON d.wordId = wc.wordId JOIN words w ON w.id = wc.wordId",
+    "get_appendix_relations": "SELECT w.id, d.partOfSpeech, w.word, apx.appendixId FROM definitions_apx apx "
+                              "JOIN definitions d ON apx.definitionId = d.id JOIN words w ON w.id = d.wordId",
+}
+
+
+def bench_sqlite_joins(records, scale, rounds=3):
+    """
+    Load the same rows into two SQLite files, with TEXT hex keys and with BLOB
+    digest keys, and time the GraphBuilder joins and the file sizes. A proxy
+    for `bench_joins` when there is no MySQL server: only the key format changes.
+    """
+    results = {}
+    for label, binary_ids, key in [("hex", False, "TEXT"), ("binary", True, "BLOB")]:
+        batch = scaled_batch(corpus_batch(records, binary_ids=binary_ids), scale)
+        batch['words'] = batch['words'] + batch['orph_nodes']
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, f"{label}.sqlite")
+            conn = sqlite3.connect(path)
+            for table, (create, columns) in SQLITE_TABLES.items():
+                conn.execute(create.format(key=key))
+                name = create.split()[2]
+                conn.executemany(f"INSERT OR IGNORE INTO {name} VALUES ({', '.join('?' * len(columns))})",
+                                 [tuple(row.get(column) for column in columns) for row in batch[table]])
+            for index in SQLITE_INDEXES:
+                conn.execute(index)
+            conn.commit()
+            conn.execute("ANALYZE")
+            conn.execute("VACUUM")
+            results[label] = {}
+            for query, sql in SQLITE_JOINS.items():
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    conn.execute(sql).fetchall()
+                results[label][query] = (time.perf_counter() - start) / rounds
+            conn.close()
+            results[label]["file_bytes"] = os.path.getsize(path)
+        print(f"{'sqlite ' + label:>14}: " + ", ".join(f"{query} {1000 * results[label][query]:.0f} ms" for query in SQLITE_JOINS))
+        print(f"{'':>14}  file {results[label]['file_bytes'] / 1024 ** 2:.1f} MiB")
+    return results
+
+
+def bench_joins(databases, records, scale, rounds=3):
+    """
+    Load the same rows into each database, one per id format, and time the
+    GraphBuilder join queries and the size of the tables and indexes.
+    `databases` maps a label to (connection, binary_ids).
+    """
+    from src.graph import GraphBuilder
+
+    results = {}
+    for label, (conn, binary_ids) in databases.items():
+        collector = Collector(conn, binary_ids=binary_ids)
+        collector.create_tables()
+        collector.erase_db()
+        collector.write(**scaled_batch(corpus_batch(records, binary_ids=binary_ids), scale))
+        conn.execute("ANALYZE TABLE " + ", ".join(collector.id_tables()))
+        builder = GraphBuilder(conn)
+        results[label] = {}
+        for query in JOIN_QUERIES:
+            start = time.perf_counter()
+            for _ in range(rounds):
+                getattr(builder, query)()
+            results[label][query] = (time.perf_counter() - start) / rounds
+        sizes = conn.execute(f"SELECT SUM(DATA_LENGTH) AS data, SUM(INDEX_LENGTH) AS indexes FROM INFORMATION_SCHEMA.TABLES "
+                             f"WHERE TABLE_SCHEMA = '{conn.db}'")[0]
+        results[label].update(data_bytes=int(sizes['data']), index_bytes=int(sizes['indexes']))
+        print(f"{label:>12}: " + ", ".join(f"{query} {1000 * results[label][query]:.0f} ms" for query in JOIN_QUERIES))
+        print(f"{'':>12}  data {sizes['data'] / 1024 ** 2:.1f} MiB, indexes {sizes['indexes'] / 1024 ** 2:.1f} MiB")
+    return results
+
+
+def bench_modes(conn, batch, modes=('update+insert', 'upsert', 'bulk')):
+    results = {}
+    for mode in modes:
+        collector = Collector(conn, upsert=mode != 'update+insert')
+        collector.create_tables()
+        collector.erase_db()
+        # Rows are copied: MySQLClient.execute writes its keyword arguments into the rows it is given.
+        rows = {table: [dict(row) for row in table_rows] for table, table_rows in batch.items()}
+        start = time.perf_counter()
+        if mode == 'bulk':
+            with collector.bulk_mode():
+                collector.write(**rows)
+        else:
+            collector.write(**rows)
+        elapsed = time.perf_counter() - start
+        results[mode] = {"seconds": elapsed, "rows_per_second": count_rows(batch) / elapsed}
+        report = f", constraint violations {collector.bulk_report}" if mode == 'bulk' else ""
+        print(f"{mode:>14}: {elapsed:8.2f} s, {count_rows(batch) / elapsed:10.0f} rows/s{report}")
+    return results
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--host', default='localhost')
+    arg_parser.add_argument('--user', default='root')
+    arg_parser.add_argument('--password', default='')
+    arg_parser.add_argument('--database', help="Scratch database, truncated before every mode.")
+    arg_parser.add_argument('--binary-database', help="Second scratch database, with BINARY(32) ids, for the join benchmark.")
+    arg_parser.add_argument('--scale', type=int, default=100, help="Copies of the corpus rows to write.")
+    arg_parser.add_argument('--offline', action='store_true', help="Without a database: time the client side, and the joins on SQLite.")
+    args = arg_parser.parse_args()
+
+    records = corpus_records()
+    batch = scaled_batch(corpus_batch(records), args.scale)
+    print(f"{count_rows(batch)} rows: " + ", ".join(f"{table} {len(rows)}" for table, rows in batch.items()))
+    bench_tsv(batch)
+    bench_hashing(records)
+    if args.offline:
+        bench_sqlite_joins(records, args.scale)
+    else:
+        if args.database is None:
+            arg_parser.error("--database is required, unless --offline is given")
+        conn = MySQLClient(args.host, args.user, args.password, args.database, local_infile=True)
+        bench_modes(conn, batch)
+        if args.binary_database is not None:
+            binary_conn = MySQLClient(args.host, args.user, args.password, args.binary_database, local_infile=True)
+            bench_joins({"hex": (conn, False), "binary": (binary_conn, True)}, records, args.scale)
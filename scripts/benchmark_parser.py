@@ -0,0 +1,399 @@
+"""
+Offline parser benchmarks, replayed over the pages in tests/html_test_files.
+
+    python -m scripts.benchmark_parser
+    python -m scripts.benchmark_parser --suite corpus --save baseline.json
+    python -m scripts.benchmark_parser --suite corpus --compare baseline.json
+"""
+
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from urllib import parse
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.append('.')
+from src.core import WiktionaryParser
+from src.engines import ENGINES
+from src.glossary import GlossaryMatcher
+from src.utils import write_ndjson
+
+current_dir = os.path.dirname(__file__)
+html_test_files_dir = os.path.abspath(os.path.join(current_dir, '..', 'tests', 'html_test_files'))
+
+corpus_languages = {
+    'ἀγγελία': ['ancient greek'],
+    'video': ['latin'],
+    'house': ['english', 'swedish'],
+    'seg': ['norwegian bokmål'],
+    'aldersblandet': ['norwegian bokmål'],
+    'by': ['norwegian bokmål'],
+    'for': ['norwegian bokmål'],
+    'admiral': ['norwegian bokmål'],
+    'heis': ['norwegian bokmål'],
+    'konkurs': ['norwegian bokmål'],
+    'pantergaupe': ['norwegian bokmål'],
+    'maldivisk': ['norwegian bokmål'],
+}
+
+
+class OfflineResponse:
+    def __init__(self, content: bytes):
+        self.content = content
+        self.text = content.decode('utf-8')
+        self.status_code = 200
+
+
+class OfflineSession:
+    """Stands in for `requests.Session`, serving pages from html_test_files."""
+    def __init__(self, files_dir=html_test_files_dir):
+        self.files_dir = files_dir
+        self.calls = 0
+
+    def get(self, url, params=None, **kwargs):
+        self.calls += 1
+        word = parse.unquote(parse.urlparse(url).path.split('/')[-1])
+        old_id = (params or {}).get('oldid')
+        with open(os.path.join(self.files_dir, f'{word}-{old_id}.html'), 'rb') as f:
+            return OfflineResponse(f.read())
+
+    def close(self):
+        pass
+
+
+def load_corpus(files_dir=html_test_files_dir):
+    """Return (word, old_id, languages) for every revision-pinned page in `files_dir`."""
+    corpus = []
+    for filename in sorted(os.listdir(files_dir)):
+        name, ext = os.path.splitext(filename)
+        word, _, old_id = name.rpartition('-')
+        if ext != '.html' or not old_id.isdigit():
+            continue
+        corpus.append((word, int(old_id), corpus_languages.get(word, ['english'])))
+    return corpus
+
+
+def make_parser(**kwargs):
+    parser = WiktionaryParser(**kwargs)
+    parser.session = OfflineSession()
+    return parser
+
+
+def replay(parser, corpus, fields=None):
+    pages = 0
+    for word, old_id, languages in corpus:
+        for language in languages:
+            parser.fetch(word, language=language, old_id=old_id, fields=fields)
+            pages += 1
+    return pages
+
+
+def bench_engines(corpus=None, rounds=3):
+    corpus = load_corpus() if corpus is None else corpus
+    results = {}
+    for engine in ENGINES:
+        parser = make_parser(engine=engine)
+        replay(parser, corpus[:1])
+        start = time.perf_counter()
+        pages = 0
+        for _ in range(rounds):
+            pages += replay(parser, corpus)
+        elapsed = time.perf_counter() - start
+        results[engine] = pages / elapsed
+        print(f"{engine:>12}: {results[engine]:7.2f} pages/s")
+    return results
+
+
+def bench_slicing(corpus=None, engine='lxml'):
+    """Compare parsing only the requested language sections against parsing whole pages."""
+    corpus = load_corpus() if corpus is None else corpus
+    results = {}
+    for slice_languages in [False, True]:
+        parser = make_parser(engine=engine, slice_languages=slice_languages)
+        tracemalloc.start()
+        start = time.perf_counter()
+        pages = replay(parser, corpus)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        label = 'sliced' if slice_languages else 'full page'
+        results[label] = {"pages_per_second": pages / elapsed, "peak_bytes": peak}
+        print(f"{label:>12}: {pages / elapsed:7.2f} pages/s, peak {peak / 1024 ** 2:6.1f} MiB")
+    return results
+
+
+def bench_fields(corpus=None, engine='lxml', rounds=3, fields=('definitions', 'related')):
+    """
+    Compare extracting every field against extracting only `fields`.
+    Tree building is the same for both, so only extraction time is reported.
+    """
+    corpus = load_corpus() if corpus is None else corpus
+    parser = make_parser(engine=engine)
+    pages = [(parser.download(parser.url.format(word, parser.use_printable), old_id), word, languages)
+             for word, old_id, languages in corpus]
+    results = {}
+    for label, projection in [('all fields', None), ('+'.join(fields), frozenset(fields))]:
+        elapsed = 0
+        for _ in range(rounds):
+            for html, word, languages in pages:
+                for language in languages:
+                    ctx = parser.load_html(html, word=word, languages=[language])
+                    ctx.fields = projection
+                    start = time.perf_counter()
+                    parser.get_word_data(ctx, language)
+                    elapsed += time.perf_counter() - start
+        results[label] = elapsed / rounds
+        print(f"{label:>20}: {1000 * results[label]:7.1f} ms extraction per corpus replay")
+    return results
+
+def definition_lines(corpus=None):
+    """Return (text, glossary labels) for every definition line of the corpus."""
+    corpus = load_corpus() if corpus is None else corpus
+    parser = make_parser(engine='lxml')
+    lines = []
+    mine_element = parser.mine_element
+
+    def record(element, **kwargs):
+        text = element.text.strip()
+        data, headword = mine_element(element, **kwargs)
+        if data is not None:
+            lines.append((text, data['appendix_tags']))
+        return data, headword
+
+    parser.mine_element = record
+    replay(parser, corpus)
+    return lines
+
+
+def strip_labels_per_line(text, labels):
+    # What mine_element did before GlossaryMatcher: one regex built per label and line.
+    for k in labels:
+        text = re.sub(re.compile(f'(\\({k}\\)|{k})'.replace('+', '\\+')), '', text).strip()
+    return text
+
+
+def bench_glossary(lines=None, rounds=200):
+    """Time stripping glossary labels out of real definition lines."""
+    lines = definition_lines() if lines is None else lines
+    matcher = GlossaryMatcher.default()
+    results = {}
+    for label, strip in [('per line', strip_labels_per_line), ('matcher', matcher.strip)]:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for text, labels in lines:
+                strip(text, labels)
+        elapsed = time.perf_counter() - start
+        results[label] = elapsed / (rounds * len(lines))
+        print(f"{label:>12}: {1e6 * results[label]:6.2f} us per definition line")
+    return results
+
+
+def bench_records(corpus=None, engine='lxml', rounds=5):
+    """
+    Memory held by parsed results, as dicts (`to_json`) and as `WordData` records,
+    scaled to 10k parsed words, and the time to write them as NDJSON.
+    """
+    corpus = load_corpus() if corpus is None else corpus
+    parser = make_parser(engine=engine)
+    pages = [(parser.download(parser.url.format(word, parser.use_printable), old_id), word, languages)
+             for word, old_id, languages in corpus]
+    results = {}
+    for label, as_records in [('dicts', False), ('records', True)]:
+        gc.collect()
+        tracemalloc.start()
+        held = []
+        words = 0
+        for _ in range(rounds):
+            for html, word, languages in pages:
+                held += parser.stamp_records(parser.parse_html(html, lang=languages, word=word, as_records=as_records), word)
+                words += 1
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        start = time.perf_counter()
+        write_ndjson(held, io.StringIO())
+        elapsed = time.perf_counter() - start
+        results[label] = {"bytes_per_10k_words": size / words * 10000, "ndjson_seconds": elapsed}
+        print(f"{label:>12}: {size / words * 10000 / 1024 ** 2:7.1f} MiB per 10k words, NDJSON written in {1000 * elapsed:.1f} ms")
+    return results
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, or None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=current_dir, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_corpus(corpus=None, engine='html.parser', rounds=5, warmup=1):
+    """
+    Replay every page of the corpus through `fetch` with an offline session.
+
+    Latencies cover the whole `fetch` call (session, tree build and extraction)
+    and are measured without tracemalloc. A separate traced replay gives the
+    bytes allocated per page: the peak of traced memory during the page, above
+    what was allocated before it. Peak RSS is the peak of the whole process
+    so far, so run one engine per process to compare engines on it.
+    """
+    corpus = load_corpus() if corpus is None else corpus
+    parser = make_parser(engine=engine)
+    pages = [(word, old_id, language) for word, old_id, languages in corpus for language in languages]
+    for _ in range(warmup):
+        for word, old_id, language in pages:
+            parser.fetch(word, language=language, old_id=old_id)
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for word, old_id, language in pages:
+            page_start = time.perf_counter()
+            parser.fetch(word, language=language, old_id=old_id)
+            latencies.append(time.perf_counter() - page_start)
+    elapsed = time.perf_counter() - start
+
+    allocations = {}
+    gc.collect()
+    tracemalloc.start()
+    for word, old_id, language in pages:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        parser.fetch(word, language=language, old_id=old_id)
+        _, peak = tracemalloc.get_traced_memory()
+        allocations[f'{word} ({language})'] = peak - before
+    tracemalloc.stop()
+
+    results = {
+        "engine": engine,
+        "pages": len(pages),
+        "rounds": rounds,
+        "pages_per_second": len(latencies) / elapsed,
+        "latency_ms": {f"p{q}": 1000 * percentile(latencies, q) for q in [50, 90, 95, 99]},
+        "latency_ms_max": 1000 * max(latencies),
+        "peak_rss_bytes": peak_rss(),
+        "allocated_bytes_per_page": statistics.mean(allocations.values()),
+        "allocated_bytes_by_page": allocations,
+    }
+    latency = ', '.join(f"{k} {v:.1f}" for k, v in results['latency_ms'].items())
+    print(f"{engine:>12}: {results['pages_per_second']:7.2f} pages/s, latency ms {latency}")
+    if results['peak_rss_bytes'] is not None:
+        print(f"{'':>12}  peak RSS {results['peak_rss_bytes'] / 1024 ** 2:.1f} MiB, "
+              f"{results['allocated_bytes_per_page'] / 1024 ** 2:.2f} MiB allocated per page")
+    return results
+
+
+def save_baseline(results, path):
+    baseline = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "results": results,
+    }
+    with open(path, 'w', encoding='utf8') as f:
+        json.dump(baseline, f, indent=2, ensure_ascii=False)
+    return baseline
+
+
+# Metrics compared against a baseline, and whether a higher value is better.
+BASELINE_METRICS = {
+    "pages_per_second": True,
+    "latency_ms.p50": False,
+    "latency_ms.p95": False,
+    "latency_ms.p99": False,
+    "peak_rss_bytes": False,
+    "allocated_bytes_per_page": False,
+}
+
+
+def compare_baseline(results, path, tolerance=0.1):
+    """
+    Print every metric of `results` next to the saved baseline at `path`.
+    Return the metrics that got worse by more than `tolerance`.
+    """
+    with open(path, 'r', encoding='utf8') as f:
+        baseline = json.load(f)
+    print(f"baseline: revision {baseline.get('revision')}, {baseline.get('created')}")
+    regressions = {}
+    for engine, current in results.items():
+        previous = baseline['results'].get(engine)
+        if previous is None:
+            continue
+        for metric, higher_is_better in BASELINE_METRICS.items():
+            old, new = previous, current
+            for key in metric.split('.'):
+                old, new = old.get(key), new.get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = ' REGRESSION' if worse > tolerance else ''
+            print(f"{engine:>12} {metric:>24}: {old:12.2f} -> {new:12.2f} ({100 * change:+.1f}%){flag}")
+            if flag:
+                regressions[f'{engine}.{metric}'] = change
+    return regressions
+
+
+SUITES = ['engines', 'slicing', 'fields', 'glossary', 'records', 'corpus']
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--suite', choices=SUITES, action='append', help="Run only these suites (default: all).")
+    arg_parser.add_argument('--engine', action='append', help="Engines replayed by the corpus suite (default: all).")
+    arg_parser.add_argument('--rounds', type=int, default=5, help="Replays of the corpus suite.")
+    arg_parser.add_argument('--save', help="Write the corpus suite results to this JSON baseline.")
+    arg_parser.add_argument('--compare', help="Compare the corpus suite results against this JSON baseline.")
+    arg_parser.add_argument('--tolerance', type=float, default=0.1, help="Relative change reported as a regression.")
+    args = arg_parser.parse_args()
+    suites = args.suite or SUITES
+
+    if 'engines' in suites:
+        bench_engines()
+    if 'slicing' in suites:
+        bench_slicing()
+    if 'fields' in suites:
+        bench_fields()
+    if 'glossary' in suites:
+        bench_glossary()
+    if 'records' in suites:
+        bench_records()
+    if 'corpus' in suites:
+        corpus_results = {engine: bench_corpus(engine=engine, rounds=args.rounds) for engine in (args.engine or ENGINES)}
+        if args.compare:
+            regressions = compare_baseline(corpus_results, args.compare, tolerance=args.tolerance)
+            if regressions:
+                sys.exit(1)
+        if args.save:
+            save_baseline(corpus_results, args.save)
@@ -2,67 +2,67 @@ import re
 import time
 import tqdm
 
-from src.utils import convert_language, export_to_json
+from src.utils import convert_language
 from .utils import *
 import json
 
 
 
-def collect_info(word, lang, wait_time=0, save_to_db=True, existing_vocab=[], include_dialects=True):
-    results = {}
-
+def iter_collect_info(word, lang, wait_time=0, save_to_db=True, existing_vocab=[], include_dialects=True):
+    """
+    Yield the `collector.save_word` output of every page fetched for `word`, then
+    of every orphan node deorphanized from it, as soon as each page is parsed.
+    Orphans that are not deorphanized are left in the 'orph_nodes' of the page
+    they were found on.
+    """
     no_spaces_word = re.sub('\s', '_', word)
     if word != no_spaces_word: #If word has space, e.q to saying word is an entity
-        fetched_data = {word: parser.fetch(no_spaces_word, query=word, language=lang, include_dialects=include_dialects)}
+        fetched_data = [(word, parser.fetch(no_spaces_word, query=word, language=lang, include_dialects=include_dialects))]
     else:
         if type(word) != str:
             prepped_word = '_'.join(word) #[0]
         else:
             prepped_word = word
         # print(f"Fetching all potentials for {prepped_word} ({lang})")
-        fetched_data = parser.fetch_all_potential(prepped_word, query=word, language=lang, include_dialects=include_dialects)
-        export_to_json(fetched_data, "fetched_data.json")
-
+        fetched_data = parser.iter_fetch_all_potential(prepped_word, query=word, language=lang, include_dialects=include_dialects)
 
-    for k in fetched_data:
-        element = fetched_data[k]
+    deorph_pbar = tqdm.tqdm(leave=False, position=1)
+    for _, element in fetched_data:
         e = collector.save_word(element, save_to_db=save_to_db, save_mentions=True)
-        for k in e:
-            results[k] = results.get(k, []) + e.get(k, [])
-        export_to_json(e, "e.json")
-        # collector.insert_word_data(**results)
-
-    if wait_time > 0:
-        time.sleep(wait_time)
-
-    #In-place deorphanization
-    
-    deorph_pbar = tqdm.tqdm(total=len(results['orph_nodes']), leave=False, position=1)
-    orph_nodes = []
-    for orph in results['orph_nodes']:
-        if orph.get('wikiUrl') is None or orph.get('word') in existing_vocab:
-            orph_nodes.append(orph)
-            continue
+        orph_nodes = []
+        to_deorphanize = []
+        for orph in e.get('orph_nodes', []):
+            if orph.get('wikiUrl') is None or orph.get('word') in existing_vocab:
+                orph_nodes.append(orph)
+                continue
+
+            if orph.get('language') is None:
+                orph['language'] = "english"
+            else:
+                orph['language'] = convert_language(orph['language'])
+            to_deorphanize.append(orph)
+        e['orph_nodes'] = orph_nodes
+        yield e
+
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+        #In-place deorphanization
+        for orph, sibling_word_data in parser.iter_deorphanize(to_deorphanize):
+            deorph_pbar.set_description_str(f"Deorphanizing '{fix_ar_display(orph.get('word'))}' ({len(collector.batch):2>d} in stack)")
+            deorph_pbar.set_postfix(orph)
+            yield collector.save_word(sibling_word_data, save_to_db=save_to_db, save_orphan=False, save_mentions=False)
+            deorph_pbar.update(1)
+    deorph_pbar.close()
 
-        if orph.get('language') is None:
-            orph['language'] = "english"
-        else:
-            orph['language'] = convert_language(orph['language'])
-
-        deorph_pbar.set_description_str(f"Deorphanizing '{fix_ar_display(orph.get('word'))}' ({len(collector.batch):2>d} in stack)")
-        deorph_pbar.set_postfix(orph)
-        deorph_pbar.refresh()
-
-        sibling_word_data = parser.deorphanize(**orph)
-
-        deorph_element = collector.save_word(sibling_word_data, save_to_db=save_to_db, save_orphan=False, save_mentions=False)
-        for k in deorph_element:
-            results[k] = results.get(k, []) + deorph_element.get(k, [])
 
-        deorph_pbar.update(1)
-
-    results['orph_nodes'] = orph_nodes
-    # collector.insert_word_data(**results)
+def collect_info(word, lang, wait_time=0, save_to_db=True, existing_vocab=[], include_dialects=True):
+    results = {}
+    for e in iter_collect_info(word, lang, wait_time=wait_time, save_to_db=save_to_db,
+                               existing_vocab=existing_vocab, include_dialects=include_dialects):
+        for k in e:
+            results.setdefault(k, []).extend(e.get(k, []))
+    results.setdefault('orph_nodes', [])
     return results
 
 
@@ -0,0 +1,36 @@
+"""
+Ingest a Wiktionary HTML dump into the database without touching the network.
+
+    python -m scripts.ingest_dump enwiktionary-NS0-ENTERPRISE-HTML.json.tar.gz --languages arabic "egyptian arabic"
+
+Dumps are NDJSON files (or tar archives of them, optionally bz2/gzip) with one
+page per line, in the Wikimedia Enterprise layout or as {"title", "html",
+"oldid"} records. Both rendered pages and Parsoid HTML are understood. XML
+dumps are not: their pages are wikitext.
+"""
+
+import argparse
+
+from scripts.utils import collector
+from src.dump import DumpIngestor
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('dump')
+    arg_parser.add_argument('--titles', default=None, help="file with one title per line")
+    arg_parser.add_argument('--languages', nargs='*', default=None)
+    arg_parser.add_argument('--workers', type=int, default=None)
+    args = arg_parser.parse_args()
+
+    titles = None
+    if args.titles is not None:
+        with open(args.titles, 'r', encoding='utf8') as f:
+            titles = [line.strip() for line in f if line.strip()]
+
+    ingestor = DumpIngestor(collector, languages=args.languages, titles=titles, workers=args.workers,
+                            save_to_db=True, save_mentions=True)
+    print(ingestor.ingest(args.dump, verbose=1))
+    if ingestor.failed:
+        print(f"Extraction failed for: {', '.join(ingestor.failed[:20])}")
+    collector.close()
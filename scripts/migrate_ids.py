@@ -0,0 +1,28 @@
+"""
+Convert the ids of an existing database between varchar(64) hex digests and
+BINARY(32) digests, in place. Back the database up first.
+
+    python -m scripts.migrate_ids --database knowledge_graph
+    python -m scripts.migrate_ids --database knowledge_graph --to-hex
+"""
+
+import argparse
+import sys
+
+sys.path.append('.')
+from src.collector import Collector
+from src.database import MySQLClient
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--host', default='localhost')
+    arg_parser.add_argument('--user', default='root')
+    arg_parser.add_argument('--password', default='')
+    arg_parser.add_argument('--database', required=True)
+    arg_parser.add_argument('--to-hex', action='store_true', help="Convert BINARY(32) ids back to hex digests.")
+    args = arg_parser.parse_args()
+
+    conn = MySQLClient(args.host, args.user, args.password, args.database)
+    migrated = Collector(conn).migrate_ids(binary=not args.to_hex)
+    print(f"{len(migrated)} columns migrated: {', '.join(migrated) or '-'}")
@@ -18,7 +18,7 @@ parser = WiktionaryParser()
 # conn = pymysql.connect(host="localhost", user="root", password="", db="knowledge_graph")
 conn = MySQLClient(host="localhost", user="root", password="", db="knowledge_graph")
 builder = GraphBuilder(conn)
-collector = Collector(conn, auto_flush_after=200)
+collector = Collector(conn, auto_flush_after=200, max_rows=20000, max_bytes=16 * 1024 ** 2)
 inspector = SchemaInspector(conn)
 
 get_word_info_prep = Preprocessor(stemmer=stem.ARLSTem(), return_type="str")
@@ -1,5 +1,5 @@
 from .utils import WordData, Definition, RelatedWord
-from .core import PARTS_OF_SPEECH, RELATIONS, WiktionaryParser
+from .core import PARTS_OF_SPEECH, RELATIONS, FIELDS, WiktionaryParser
 from .preprocessing import *
 __all__ = [
     'WordData',
@@ -7,6 +7,7 @@ __all__ = [
     'RelatedWord',
     'PARTS_OF_SPEECH',
     'RELATIONS',
+    'FIELDS',
     'WiktionaryParser',
     'Normalizer',
     'Preprocessor'
@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+
+class PageCache(object):
+    """
+    On-disk cache of downloaded pages, keyed by (title, oldid, printable).
+
+    Pages are stored zlib-compressed in a SQLite file. Once the stored size goes
+    over `max_bytes`, the least recently used pages are evicted. Pages older than
+    `ttl` seconds are treated as missing, except revision-pinned pages (fetched
+    with an `oldid`) which never expire since their content cannot change.
+    """
+    def __init__(self, path, max_bytes=512 * 1024 ** 2, ttl=7 * 24 * 3600, compression_level=6):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.compression_level = compression_level
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "bytes_read": 0, "bytes_written": 0}
+
+        dirname = os.path.dirname(self.path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "title TEXT NOT NULL, oldid TEXT NOT NULL, printable TEXT NOT NULL, "
+            "body BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL, pinned INTEGER NOT NULL, "
+            "PRIMARY KEY (title, oldid, printable))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed)")
+        self._conn.commit()
+        self.stored_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+
+    @staticmethod
+    def key(title, old_id=None, printable=None):
+        return (title, '' if old_id is None else str(old_id), '' if printable is None else str(printable))
+
+    def get(self, title, old_id=None, printable=None):
+        key = self.key(title, old_id, printable)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, size, created, pinned FROM pages WHERE title=? AND oldid=? AND printable=?", key
+            ).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            body, size, created, pinned = row
+            if not pinned and self.ttl is not None and now - created > self.ttl:
+                self.__delete(key, size)
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            self._conn.execute("UPDATE pages SET accessed=? WHERE title=? AND oldid=? AND printable=?", (now,) + key)
+            self._conn.commit()
+            self.stats['hits'] += 1
+            self.stats['bytes_read'] += size
+        return zlib.decompress(body).decode('utf-8')
+
+    def put(self, title, html, old_id=None, printable=None):
+        key = self.key(title, old_id, printable)
+        body = zlib.compress(html.encode('utf-8'), self.compression_level)
+        size = len(body)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            previous = self._conn.execute(
+                "SELECT size FROM pages WHERE title=? AND oldid=? AND printable=?", key
+            ).fetchone()
+            if previous is not None:
+                self.stored_bytes -= previous[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                key + (body, size, now, now, int(old_id is not None))
+            )
+            self.stored_bytes += size
+            self.stats['bytes_written'] += size
+            self.__evict()
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.commit()
+            self.stored_bytes = 0
+
+    def close(self):
+        self._conn.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def __delete(self, key, size):
+        self._conn.execute("DELETE FROM pages WHERE title=? AND oldid=? AND printable=?", key)
+        self._conn.commit()
+        self.stored_bytes -= size
+
+    def __evict(self):
+        if self.max_bytes is None:
+            return
+        while self.stored_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT title, oldid, printable, size FROM pages ORDER BY accessed LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for title, oldid, printable, size in rows:
+                if self.stored_bytes <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM pages WHERE title=? AND oldid=? AND printable=?", (title, oldid, printable))
+                self.stored_bytes -= size
+                self.stats['evictions'] += 1
@@ -10,21 +10,108 @@ import tqdm
 import copy
 from nltk.stem import *
 import itertools
-import hashlib
+from contextlib import contextmanager
 
 from src.database import MySQLClient
 
-from .utils import flatten_dict
+from .utils import flatten_dict, hash_id, hex_id, WordData
+from .writer import BackgroundWriter
+
+
+def row_size(row):
+    """Rough size of a row once sent to MySQL: the length of its strings, 8 bytes for anything else."""
+    return sum(len(v) if isinstance(v, str) else 8 for v in row.values())
+
+
+class TableBuffer(object):
+    """
+    Rows waiting to be written to one table.
+
+    Appends are O(1). With `key`, a row whose key is already buffered is
+    dropped, keeping the first one, like `INSERT IGNORE` would.
+    """
+    def __init__(self, key=None):
+        self.key = key
+        self.rows = []
+        self.keys = set()
+        self.bytes = 0
+        self.duplicates = 0
+
+    def extend(self, rows):
+        for row in rows:
+            if self.key is not None:
+                key = row.get(self.key)
+                if key in self.keys:
+                    self.duplicates += 1
+                    continue
+                self.keys.add(key)
+            self.rows.append(row)
+            self.bytes += row_size(row)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class BatchBuffer(object):
+    """
+    The `save_word` results waiting to be flushed, kept as one `TableBuffer`
+    per result key. `len()` is the number of results added since the last drain.
+    """
+    KEYS = {"words": "id", "orph_nodes": "id", "definitions": "id"}
+
+    def __init__(self, max_rows=None, max_bytes=None):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.tables = {}
+        self.results = 0
+
+    def table(self, name):
+        if name not in self.tables:
+            self.tables[name] = TableBuffer(self.KEYS.get(name))
+        return self.tables[name]
+
+    def add(self, result):
+        for name, rows in result.items():
+            self.table(name).extend(rows)
+        self.results += 1
+
+    def full(self):
+        """Whether any table went over its row or byte budget."""
+        return any((self.max_rows is not None and len(table) >= self.max_rows) or
+                   (self.max_bytes is not None and table.bytes >= self.max_bytes)
+                   for table in self.tables.values())
+
+    def drain(self):
+        """Return the buffered rows of every table, and empty the buffer."""
+        rows = {name: table.rows for name, table in self.tables.items()}
+        self.tables = {}
+        self.results = 0
+        return rows
+
+    def __len__(self):
+        return self.results
 
 
 class Collector:
+    # Merge rules of `MySQLClient.upsert` for the words table. A parsed word
+    # replaces what is stored, except that `isDerived` only goes from 1 to 0:
+    # once a word's own page was parsed it is never an orphan again. An orphan
+    # node only fills the columns that are still empty.
+    WORD_MERGE = {"id": "keep", "isDerived": "min"}
+    ORPHAN_MERGE = {"id": "keep", "isDerived": "min", "etymology": "fill", "query": "fill",
+                    "word": "fill", "wikiUrl": "fill", "language": "fill"}
+
     def __init__(self, conn, 
                  word_table="words", 
                  dataset_table="data", 
                  edge_table="relationships",
                  definitions_table="definitions",
                  force_edge_tail_constraint=True,
-                 auto_flush_after = 10
+                 auto_flush_after = 10,
+                 max_rows=None,
+                 max_bytes=None,
+                 upsert=True,
+                 binary_ids=False
                 ):
 
         self.conn: MySQLClient = conn
@@ -34,7 +121,15 @@ class Collector:
         self.definitions_table = definitions_table
         self.edge_table = edge_table
 
-        self.batch = []
+        # Flushed after `auto_flush_after` words, or as soon as a table holds
+        # `max_rows` rows or `max_bytes` bytes.
+        self.batch = BatchBuffer(max_rows=max_rows, max_bytes=max_bytes)
+        self.writer = None
+        self.upsert = upsert
+        self.bulk = False
+        self.bulk_report = None
+        # Ids are stored as BINARY(32) digests instead of varchar(64) hex digests.
+        self.binary_ids = binary_ids
         self.auto_flush_after = auto_flush_after
         self.force_edge_tail_constraint = force_edge_tail_constraint
 
@@ -43,7 +138,7 @@ class Collector:
 
         self.base_url = "https://en.wiktionary.org/"
     def reset_db(self):
-        self.__create_tables()
+        self.create_tables()
         with open('appendix.json', 'w', encoding='utf8') as f:
             f.write(json.dumps(self.__get_appendix_data(), indent=2, ensure_ascii=False))
 
@@ -53,15 +148,20 @@ class Collector:
     @staticmethod
     def apply_hash(text):
         # return text
-        return hashlib.sha256(text.encode()).hexdigest()
-    
-    def __create_tables(self):
+        return hash_id(text)
+
+    def hash(self, text):
+        """The id of `text`, in the id format of this collector."""
+        return hash_id(text, self.binary_ids)
+
+    def create_tables(self):
         # Define the table names
         table_names = {
             "word_table": self.word_table,
             "dataset_table": self.dataset_table,
             "definitions_table": self.definitions_table,
             "edge_table": self.edge_table,
+            "id_type": "BINARY(32)" if self.binary_ids else "varchar(64)",
         }
 
         # Load and format the SQL script from the file
@@ -112,7 +212,7 @@ class Collector:
                         }
                         # apx_unique_hash = '_'.join([str(apx[k]) for k in sorted(apx)])
                         apx_unique_hash = label
-                        apx['id'] = Collector.apply_hash(apx_unique_hash)
+                        apx['id'] = self.hash(apx_unique_hash)
                         res.append(apx)
                     
         self.conn.insert("appendix", res, ignore=True)
@@ -137,7 +237,7 @@ class Collector:
                     # hasSubcat = "CategoryTreeBullet" in tree_bullet.get('class')
                     a_data = {
                         "sourceList": k,
-                        "id": Collector.apply_hash(a.get_text()),
+                        "id": self.hash(a.get_text()),
                         "title": a.get("title"),
                         "text": a.get_text(),
                         "wikiUrl": a.get("href"),
@@ -153,6 +253,73 @@ class Collector:
         self.conn.insert("categories", data, ignore=True)
         return data
 
+    def id_tables(self):
+        return [self.word_table, self.definitions_table, "appendix", f"{self.definitions_table}_apx",
+                self.edge_table, "categories", "word_categories", "examples"]
+
+    def migrate_ids(self, binary=True):
+        """
+        Convert the id columns of an existing database between varchar(64) hex
+        digests and BINARY(32) digests, keeping every id and foreign key.
+
+        Foreign keys are dropped, each id column goes through VARBINARY(64)
+        while UNHEX (or HEX) rewrites it, and the foreign keys are added back.
+        Nothing is changed if an id is not a 64-digit hex digest. Use a
+        collector with the matching `binary_ids` afterwards.
+        """
+        db = self.conn.db
+        tables = ', '.join([f"'{t}'" for t in self.id_tables()])
+        source_type = ("varchar", 64) if binary else ("binary", 32)
+        columns = [
+            c for c in self.conn.execute(
+                "SELECT TABLE_NAME, COLUMN_NAME, IS_NULLABLE, COLUMN_KEY, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH "
+                f"FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = '{db}' AND TABLE_NAME IN ({tables}) "
+                "AND (COLUMN_NAME = 'id' OR COLUMN_NAME LIKE BINARY '%Id')"
+            )
+            if (c['DATA_TYPE'].lower(), c['CHARACTER_MAXIMUM_LENGTH']) == source_type
+        ]
+        if binary:
+            for c in columns:
+                invalid = self.conn.execute(
+                    f"SELECT COUNT(*) AS n FROM {c['TABLE_NAME']} WHERE {c['COLUMN_NAME']} IS NOT NULL "
+                    f"AND {c['COLUMN_NAME']} NOT REGEXP '^[0-9a-f]{{64}}$'"
+                )[0]['n']
+                if invalid:
+                    raise ValueError(f"{invalid} values of {c['TABLE_NAME']}.{c['COLUMN_NAME']} are not sha256 hex digests")
+
+        foreign_keys = self.conn.execute(
+            "SELECT k.CONSTRAINT_NAME, k.TABLE_NAME, k.COLUMN_NAME, k.REFERENCED_TABLE_NAME, k.REFERENCED_COLUMN_NAME, "
+            "r.UPDATE_RULE, r.DELETE_RULE FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE k "
+            "JOIN INFORMATION_SCHEMA.REFERENTIAL_CONSTRAINTS r "
+            "ON r.CONSTRAINT_SCHEMA = k.CONSTRAINT_SCHEMA AND r.CONSTRAINT_NAME = k.CONSTRAINT_NAME "
+            f"WHERE k.TABLE_SCHEMA = '{db}' AND k.TABLE_NAME IN ({tables}) AND k.REFERENCED_TABLE_NAME IS NOT NULL"
+        )
+        for fk in foreign_keys:
+            self.conn.execute(f"ALTER TABLE {fk['TABLE_NAME']} DROP FOREIGN KEY {fk['CONSTRAINT_NAME']}")
+
+        target_type = "BINARY(32)" if binary else "varchar(64) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci"
+        convert = "UNHEX({column})" if binary else "LOWER(HEX({column}))"
+        for c in tqdm.tqdm(columns, desc="Migrating ids", leave=False):
+            table, column = c['TABLE_NAME'], c['COLUMN_NAME']
+            null = "NULL" if c['IS_NULLABLE'] == 'YES' else "NOT NULL"
+            self.conn.execute(f"ALTER TABLE {table} MODIFY {column} VARBINARY(64) {null}")
+            self.conn.execute(f"UPDATE {table} SET {column} = {convert.format(column=column)} WHERE {column} IS NOT NULL")
+            if c['COLUMN_KEY'] == 'PRI':
+                self.conn.execute(f"ALTER TABLE {table} DROP PRIMARY KEY, MODIFY {column} {target_type} {null}, ADD PRIMARY KEY ({column})")
+            else:
+                self.conn.execute(f"ALTER TABLE {table} MODIFY {column} {target_type} {null}")
+
+        for fk in foreign_keys:
+            self.conn.execute(
+                f"ALTER TABLE {fk['TABLE_NAME']} ADD CONSTRAINT {fk['CONSTRAINT_NAME']} FOREIGN KEY ({fk['COLUMN_NAME']}) "
+                f"REFERENCES {fk['REFERENCED_TABLE_NAME']} ({fk['REFERENCED_COLUMN_NAME']}) "
+                f"ON DELETE {fk['DELETE_RULE']} ON UPDATE {fk['UPDATE_RULE']}"
+            )
+        self.binary_ids = binary
+        self.conn.schema_info = {}
+        self.conn.binary_columns = {}
+        return [f"{c['TABLE_NAME']}.{c['COLUMN_NAME']}" for c in columns]
+
     def erase_db(self, recreate_database=False):
         if recreate_database:
             self.reset_db()
@@ -227,10 +394,10 @@ class Collector:
 
                 rw_list[i]['raw_text'] = rw_list[i].pop('def_text', None)
                 #gugus
-                # headDefinitionId = Collector.apply_hash(self.hash_def_by.format(**rw_list[i]))
+                # headDefinitionId = self.hash(self.hash_def_by.format(**rw_list[i]))
                 # rw_list[i]['headDefinitionId'] = headDefinitionId
                 rw_list[i]['word'] = rw_list[i].pop('words')
-                rw_list[i]['wordId'] = Collector.apply_hash(self.hash_word_by.format(**rw_list[i]))
+                rw_list[i]['wordId'] = self.hash(self.hash_word_by.format(**rw_list[i]))
                 
             related_words += rw_list
      
@@ -253,8 +420,9 @@ class Collector:
             definition[i].update(definition[i].get("text", {}))
             definition[i]['pos'] = definition[i].get('pos', element.get('partOfSpeech'))
             #Get a unique hash that encodes word, its POS and its explanation (to disambiguate verbal form from nominal form)
-            unique_w_hash = self.hash_def_by.format(**definition[i])
-            unique_w_hash = Collector.apply_hash(unique_w_hash)
+            # The word id is hashed in hex in both id formats, so a definition keeps its id across them.
+            unique_w_hash = self.hash_def_by.format(**dict(definition[i], wordId=hex_id(word_id)))
+            unique_w_hash = self.hash(unique_w_hash)
             
             for k_ in ["raw_text"]:
                 definition[i].pop(k_, None)
@@ -266,7 +434,7 @@ class Collector:
             
             appendix = {
                 "appendixId": [
-                    Collector.apply_hash(e) for e in appendix
+                    self.hash(e) for e in appendix
                 ], #FOREIGN KEY
                 "appendixLabel": appendix
             }
@@ -276,14 +444,13 @@ class Collector:
 
             definition[i]['id'] = unique_w_hash #PRIMARY KEY
 
-            for m in range(len(mentions_)):
-                mentions_[m]['definitionId'] = unique_w_hash
+            # Mentions and examples are copied: they belong to the fetched records.
+            mentions_ = [dict(m, definitionId=unique_w_hash) for m in mentions_]
 
             for a in range(len(appendix)):
                 appendix[a]['definitionId'] = unique_w_hash
             
-            for e in range(len(def_examples)):
-                def_examples[e]['definitionId'] = unique_w_hash
+            def_examples = [dict(e, definitionId=unique_w_hash) for e in def_examples]
 
             def_id = definition[i].get('def_k')
             hashes[def_id] = hashes.get(def_id, []) + [unique_w_hash]
@@ -307,12 +474,23 @@ class Collector:
         categories = []
 
         for row in fetched_data:
-            word = {
-                k: row.get(k) for k in ['id', 'etymology', 'language', "query", 'word', 'wikiUrl', 'isDerived']
-            }
+            if isinstance(row, WordData):
+                # Fields are read off the record, which is left as it is. Definitions
+                # still become dicts, one at a time, for flatten_dict and the hashing.
+                word = {
+                    k: getattr(row, k, None) for k in ['id', 'etymology', 'language', "query", 'word', 'wikiUrl', 'isDerived']
+                }
+                categories_ = row.categories if row.categories is not None else []
+                row_definitions = (definition.to_json() for definition in row.definition_list)
+            else:
+                word = {
+                    k: row.get(k) for k in ['id', 'etymology', 'language', "query", 'word', 'wikiUrl', 'isDerived']
+                }
+                categories_ = row.pop('categories', [])
+                row_definitions = row.get("definitions", [])
             
             word_str = word['word']
-            word_id = Collector.apply_hash(self.hash_word_by.format(**word))
+            word_id = self.hash(self.hash_word_by.format(**word))
             word['wikiUrl'] = word['wikiUrl'] if word['wikiUrl'] is not None else f"/wiki/{word_str}"
             #Row may appear with its actual id if the 
             if word['id'] is None:
@@ -323,10 +501,9 @@ class Collector:
             words.append(word)
                         
             #Isolate categories in their own table
-            categories_ = row.pop('categories', [])
             categories_ = {
                 "categoryId": [
-                    Collector.apply_hash(e) for e in categories_
+                    self.hash(e) for e in categories_
                 ], #FOREIGN KEY,
                 "categoryLabel": categories_
             }
@@ -334,7 +511,7 @@ class Collector:
             categories_ = flatten_dict(categories_)
             categories += categories_
 
-            for element in row.get("definitions", []):
+            for element in row_definitions:
                 element['language'] = word['language']
 
                 # Related words
@@ -360,7 +537,7 @@ class Collector:
                         onode['query'] = word_str
                         onode['etymology'] = None
                         onode['language'] = word.get("language")
-                        onode['id'] = Collector.apply_hash(self.hash_word_by.format(**onode))
+                        onode['id'] = self.hash(self.hash_word_by.format(**onode))
                         onode['isDerived'] = 1
                         orph_nodes.append(onode)
 
@@ -369,7 +546,7 @@ class Collector:
                     for m in mentions:
                         mnode = copy.deepcopy(m)
                         mnode.update({
-                            "id": Collector.apply_hash(self.hash_word_by.format(**m)),
+                            "id": self.hash(self.hash_word_by.format(**m)),
                             "query": word.get("word"),
                             "etymology": None,
                         })
@@ -408,23 +585,89 @@ class Collector:
         if save_to_db:
             # self.save_word_data(**res)
             if self.auto_flush_after > 0 :
-                self.batch.append(res)
-                if self.auto_flush_after <= len(self.batch):
+                self.batch.add(res)
+                if self.auto_flush_after <= len(self.batch) or self.batch.full():
                     self.flush()
 
         return res #fetched_data #related_words
     
     def flush(self):
-        res = {}
-        for b in tqdm.tqdm(self.batch, position=0, leave=False):
-            for k in b:
-                res[k] = res.get(k, []) + b[k]
+        """Write the buffered rows, or hand them to the background writer when there is one."""
+        if not len(self.batch):
+            return None
+        res = self.batch.drain()
+        if self.writer is not None:
+            self.writer.submit(res)
+            return None
         print('Flushing...', end='')
+        affected_rows = self.write(**res)
+        print(affected_rows)
+        return affected_rows
+
+    def write(self, bulk=None, **res):
+        if self.bulk if bulk is None else bulk:
+            return {"load": self.bulk_load_word_data(**res)}
+        if self.upsert:
+            return {"upsert": self.upsert_word_data(**res)}
         updated_rows = self.update_word_data(**res)
         inserted_rows = self.insert_word_data(**res)
-        affected_rows = {"insert": inserted_rows, "update": updated_rows}
-        print(affected_rows)
-        self.batch = []
+        return {"insert": inserted_rows, "update": updated_rows}
+
+    def start_writer(self, connect=None, max_queue=4):
+        """
+        Write flushed batches on a background thread, with its own connection,
+        so that fetching and parsing go on while the database works.
+        `connect()` returns that connection; by default it opens one with the
+        settings of `self.conn`. See `BackgroundWriter` for queueing and errors.
+        """
+        if self.writer is not None:
+            return self.writer
+        if connect is None:
+            connect = lambda: MySQLClient(self.conn.host, self.conn.user, self.conn.password, self.conn.db,
+                                          local_infile=getattr(self.conn, 'local_infile', False))
+        writer_collector = copy.copy(self)
+        writer_collector.conn = connect()
+        writer_collector.batch = None
+        self.writer = BackgroundWriter(lambda res: writer_collector.write(bulk=self.bulk, **res), max_queue=max_queue)
+        return self.writer
+
+    def sync(self):
+        """Flush the buffered rows and wait until they are in the database."""
+        self.flush()
+        if self.writer is not None:
+            self.writer.wait()
+
+    @contextmanager
+    def bulk_mode(self, validate=True, delete_dangling=True):
+        """
+        Write with `MySQLClient.bulk_load` (LOAD DATA LOCAL INFILE) instead of
+        row-wise statements, for first-time loads of large batches. Foreign key
+        and unique checks are off while each batch loads; when the block ends,
+        the constraints of the collector's tables are validated, rows whose
+        foreign key points nowhere are deleted (INSERT IGNORE would have
+        skipped them), and what was found is kept in `bulk_report`.
+        The connection must be opened with `local_infile=True`.
+        """
+        self.sync()
+        self.bulk = True
+        try:
+            yield self
+            self.sync()
+        finally:
+            self.bulk = False
+        if validate:
+            tables = [self.word_table, self.definitions_table, "examples", f"{self.definitions_table}_apx",
+                      "word_categories", self.edge_table]
+            self.bulk_report = self.conn.validate_constraints(tables=tables, delete=delete_dangling)
+
+    def close(self):
+        """Flush the buffered rows and, with a background writer, wait until everything is written."""
+        try:
+            self.flush()
+        finally:
+            if self.writer is not None:
+                writer, self.writer = self.writer, None
+                writer.close()
 
     def update_word_data(self, words=[],  orph_nodes=[], **kwargs):
         # Updating to database
@@ -435,6 +678,42 @@ class Collector:
         updated_rows = {k: sum(v) for k, v in updated_rows.items()}
         return updated_rows
 
+    @staticmethod
+    def new_orphans(words, orph_nodes):
+        """The orphan nodes that are not parsed words of the same batch, marked as derived."""
+        word_ids = {word['id'] for word in words}
+        return [dict(node, isDerived=1) for node in orph_nodes if node['id'] not in word_ids]
+
+    def upsert_word_data(self, words=[], orph_nodes=[], **kwargs):
+        """
+        Write words and orphan nodes once each, with `MySQLClient.upsert`, instead
+        of an UPDATE and an INSERT per row, then insert the other tables.
+        Orphan nodes that are also parsed words of the same batch are skipped.
+        """
+        orph_nodes = self.new_orphans(words, orph_nodes)
+        word_rows = self.conn.upsert(self.word_table, words, merge=self.WORD_MERGE)
+        word_rows += self.conn.upsert(self.word_table, orph_nodes, merge=self.ORPHAN_MERGE)
+        upserted_rows = self.insert_word_data(**kwargs)
+        upserted_rows[self.word_table] = sum(word_rows)
+        return upserted_rows
+
+    def bulk_load_word_data(self, words=[], orph_nodes=[], definitions=[], related_words=[], appendices=[], categories=[], examples=[], **kwargs):
+        """
+        Write a batch with LOAD DATA, with foreign key and unique checks off.
+        Words and orphan nodes are merged with the same rules as `upsert_word_data`.
+        """
+        orph_nodes = self.new_orphans(words, orph_nodes)
+        loaded_rows = {}
+        with self.conn.checks_disabled():
+            loaded_rows[self.word_table] = self.conn.bulk_load(self.word_table, words, merge=self.WORD_MERGE)
+            loaded_rows[self.word_table] += self.conn.bulk_load(self.word_table, orph_nodes, merge=self.ORPHAN_MERGE)
+            loaded_rows[self.definitions_table] = self.conn.bulk_load(self.definitions_table, definitions)
+            loaded_rows["examples"] = self.conn.bulk_load("examples", examples)
+            loaded_rows[f"{self.definitions_table}_apx"] = self.conn.bulk_load(f"{self.definitions_table}_apx", appendices)
+            loaded_rows["word_categories"] = self.conn.bulk_load("word_categories", categories)
+            loaded_rows[self.edge_table] = self.conn.bulk_load(self.edge_table, related_words)
+        return {k: sum(v) for k, v in loaded_rows.items()}
+
     def insert_word_data(self, words=[], definitions=[], related_words=[], appendices=[], orph_nodes=[], categories=[], examples=[], insert=True, update=True):
         # Inserting into database
         inserted_rows = {}
@@ -1,10 +1,15 @@
 import re, requests
-from .utils import WordData, Definition, RelatedWord
-from bs4 import BeautifulSoup
-from itertools import zip_longest
+import bisect
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from urllib import parse
+from .utils import WordData, Definition, RelatedWord, intern_label
+from .sections import SectionIndex, slice_languages
+from .engines import get_engine
+from .glossary import GlossaryMatcher
+from .profiling import NO_PHASE
 import exrex
 import tqdm
-import copy
 from string import digits
 
 PARTS_OF_SPEECH = [
@@ -24,54 +29,124 @@ RELATIONS = [
 EXCLUDED_APPENDICES = [
     "obsolete"
 ]
-def is_subheading(child, parent):
-    child_headings = child.split(".")
-    parent_headings = parent.split(".")
-    if len(child_headings) <= len(parent_headings):
-        return False
-    for child_heading, parent_heading in zip(child_headings, parent_headings):
-        if child_heading != parent_heading:
-            return False
-    return True
+FIELDS = [
+    "definitions", "related", "examples",
+    "etymologies", "pronunciations", "categories",
+]
+class ParseContext(object):
+    """Per-page parsing state, so a single parser can serve concurrent fetches."""
+    def __init__(self, soup, sections, language=None, word=None, url=None, fields=None):
+        self.soup = soup
+        self.sections = sections
+        self.language = language
+        self.word = word
+        self.url = url
+        self.fields = fields
+        self.categories = None
+
+    def wants(self, field):
+        return self.fields is None or field in self.fields
+
+
+def section_key(number):
+    """'1.2.10' -> (1, 2, 10), so that section numbers compare numerically."""
+    return tuple(int(n) for n in number.split('.') if n)
 
 class WiktionaryParser(object):
-    def __init__(self):
+    # (section kind, handler) in the order the handlers run. Handlers edit the
+    # tree as they read it (relation labels, glossary tags, superscripts), so
+    # this order is part of the output: relation lists are read before the
+    # definitions they refer to lose their labels. Examples are mined along
+    # with the definitions, by `mine_element`.
+    SECTION_HANDLERS = [
+        ('related', 'parse_related_section'),
+        ('nyms', 'parse_nyms_section'),
+        ('definitions', 'parse_definition'),
+        ('etymologies', 'parse_etymology'),
+        ('pronunciations', 'parse_pronunciation'),
+    ]
+
+    def __init__(self, engine=None, cache=None, max_concurrency=8, title_index=None, variant_index=None, slice_languages=True, glossary=None, profiler=None):
         self.__base_url = "https://en.wiktionary.org"
         self.url = self.__base_url + "/wiki/{}?printable={}"
-        self.soup = None
+        self.engine = get_engine(engine)
+        self.cache = cache
+        self.title_index = title_index
+        self.variant_index = variant_index
+        self.max_concurrency = max_concurrency
+        self.slice_languages = slice_languages
+        self.glossary = glossary if glossary is not None else GlossaryMatcher.default()
+        self.profiler = profiler
         self.session = requests.Session()
-        self.session.mount("http://", requests.adapters.HTTPAdapter(max_retries = 2))
-        self.session.mount("https://", requests.adapters.HTTPAdapter(max_retries = 2))
+        self.session.mount("http://", requests.adapters.HTTPAdapter(max_retries = 2, pool_maxsize=max_concurrency))
+        self.session.mount("https://", requests.adapters.HTTPAdapter(max_retries = 2, pool_maxsize=max_concurrency))
+        self._io_executor = None
+        self._parse_executor = None
         self.language = 'english'
         self.use_printable = 'yes'
-        self.current_word = None
-        self.current_url = None
-        self.PARTS_OF_SPEECH = copy.copy(PARTS_OF_SPEECH)
-        self.RELATIONS = copy.copy(RELATIONS)
-        self.EXCLUDED_APPENDICES = copy.copy(EXCLUDED_APPENDICES)
-        self.INCLUDED_ITEMS = self.RELATIONS + self.PARTS_OF_SPEECH + ['etymology', 'pronunciation']
+        # Configuration is kept in frozensets and replaced, never mutated, so
+        # concurrent parses always see a consistent snapshot.
+        self.PARTS_OF_SPEECH = frozenset(PARTS_OF_SPEECH)
+        self.RELATIONS = frozenset(RELATIONS)
+        self.EXCLUDED_APPENDICES = frozenset(EXCLUDED_APPENDICES)
+        # Rank of each label in the configured lists, included labels last, for
+        # the pages whose sections are looked up by title.
+        self.SECTION_ORDER = {label: rank for rank, label in enumerate(PARTS_OF_SPEECH + RELATIONS)}
+        self.__update_included_items()
+
+    def __update_included_items(self):
+        self.INCLUDED_ITEMS = self.RELATIONS | self.PARTS_OF_SPEECH | {'etymology', 'pronunciation'}
+
+    def __rank(self, label):
+        if label not in self.SECTION_ORDER:
+            self.SECTION_ORDER = {**self.SECTION_ORDER, label: len(self.SECTION_ORDER)}
 
     def include_part_of_speech(self, part_of_speech):
-        part_of_speech = part_of_speech.lower()
-        if part_of_speech not in self.PARTS_OF_SPEECH:
-            self.PARTS_OF_SPEECH.append(part_of_speech)
-            self.INCLUDED_ITEMS.append(part_of_speech)
+        self.__rank(part_of_speech.lower())
+        self.PARTS_OF_SPEECH = self.PARTS_OF_SPEECH | {part_of_speech.lower()}
+        self.__update_included_items()
 
     def exclude_part_of_speech(self, part_of_speech):
         part_of_speech = part_of_speech.lower()
-        self.PARTS_OF_SPEECH.remove(part_of_speech)
-        self.INCLUDED_ITEMS.remove(part_of_speech)
+        if part_of_speech not in self.PARTS_OF_SPEECH:
+            raise ValueError(f"'{part_of_speech}' is not an included part of speech")
+        self.PARTS_OF_SPEECH = self.PARTS_OF_SPEECH - {part_of_speech}
+        self.__update_included_items()
 
     def include_relation(self, relation):
-        relation = relation.lower()
-        if relation not in self.RELATIONS:
-            self.RELATIONS.append(relation)
-            self.INCLUDED_ITEMS.append(relation)
+        self.__rank(relation.lower())
+        self.RELATIONS = self.RELATIONS | {relation.lower()}
+        self.__update_included_items()
 
     def exclude_relation(self, relation):
         relation = relation.lower()
-        self.RELATIONS.remove(relation)
-        self.INCLUDED_ITEMS.remove(relation)
+        if relation not in self.RELATIONS:
+            raise ValueError(f"'{relation}' is not an included relation")
+        self.RELATIONS = self.RELATIONS - {relation}
+        self.__update_included_items()
+
+    # Settings that `config` carries besides the constructor options.
+    SETTINGS = ['language', 'PARTS_OF_SPEECH', 'RELATIONS', 'EXCLUDED_APPENDICES', 'INCLUDED_ITEMS', 'SECTION_ORDER']
+
+    def config(self):
+        """
+        Everything that decides how this parser reads a page, to rebuild an
+        equivalent parser elsewhere (e.g. in a worker process) with
+        `from_config`. Options only used to fetch pages (cache, title and
+        variant indexes, concurrency, profiler) are left out.
+        """
+        config = {'engine': self.engine, 'slice_languages': self.slice_languages, 'glossary': self.glossary}
+        config.update({name: getattr(self, name) for name in self.SETTINGS})
+        return config
+
+    @classmethod
+    def from_config(cls, config):
+        config = dict(config)
+        settings = {name: config.pop(name) for name in cls.SETTINGS if name in config}
+        parser = cls(**config)
+        for name, value in settings.items():
+            setattr(parser, name, value)
+        return parser
 
     def set_default_language(self, language=None):
         if language is not None:
@@ -80,55 +155,92 @@ class WiktionaryParser(object):
     def get_default_language(self):
         return self.language
 
-    def clean_html(self):
+    def clean_html(self, soup):
         unwanted_classes = ['sister-wikipedia', 'thumb', 'reference', 'cited-source']
-        for tag in self.soup.find_all(True, {'class': unwanted_classes}):
+        for tag in soup.find_all(True, {'class': unwanted_classes}):
             tag.extract()
 
+    def phase(self, name):
+        """Time the phase `name` with the profiler, if there is one."""
+        return NO_PHASE if self.profiler is None else self.profiler.phase(name)
+
+    def page(self, word=None, url=None):
+        return NO_PHASE if self.profiler is None else self.profiler.page(word, url)
+
     def remove_digits(self, string):
         return string.translate(str.maketrans('', '', digits)).strip()
 
     def count_digits(self, string):
         return len(list(filter(str.isdigit, string)))
 
-    def get_id_list(self, contents, content_type):
-        if content_type == 'etymologies':
-            checklist = ['etymology']
-        elif content_type == 'pronunciation':
-            checklist = ['pronunciation']
-        elif content_type == 'definitions':
-            checklist = self.PARTS_OF_SPEECH
-            if self.language == 'chinese':
-                checklist += self.current_word
-        elif content_type == 'related':
-            checklist = self.RELATIONS
-        else:
-            return None
-        id_list = []
-        if len(contents) == 0:
-            return [('1', x.title(), x) for x in checklist if self.soup.find('span', {'id': x.title()})]
-        for content_tag in contents:
-            content_index = content_tag.find_previous().text
-            text_to_check = self.remove_digits(content_tag.text).strip().lower()
-            if text_to_check in checklist:
-                content_id = content_tag.parent['href'].replace('#', '')
-                id_list.append((content_index, content_id, text_to_check))
-        return id_list
-
-    def get_word_data(self, language, include_dialects=True):
-        contents = self.soup.find_all('span', {'class': 'toctext'})
-        word_contents = []
+    def get_checklists(self, ctx):
+        """Return, for each section kind, the lowercased titles that belong to it."""
+        parts_of_speech = self.PARTS_OF_SPEECH
+        if ctx.language == 'chinese' and ctx.word:
+            parts_of_speech = parts_of_speech | set(ctx.word)
+        return {
+            'related': self.RELATIONS,
+            'definitions': parts_of_speech,
+            'etymologies': {'etymology'},
+            'pronunciations': {'pronunciation'},
+        }
+
+    def dispatch_sections(self, ctx, word_contents):
+        """
+        Walk `word_contents` once, in document order, and queue every section
+        for the handlers of its kind. Queue entries are (index, section, title).
+        """
+        queues = {kind: [] for kind, _ in self.SECTION_HANDLERS}
+        checklists = self.get_checklists(ctx)
+        if len(word_contents) == 0:
+            # Without a table of contents, sections are looked up by title in the
+            # order of the configured lists, then the characters of a Chinese word.
+            order = self.SECTION_ORDER
+            word = ctx.word or ''
+            for kind, checklist in checklists.items():
+                titles = sorted(checklist, key=lambda x: (order.get(x, len(order) + word.find(x)), x))
+                queues[kind] = [('1', ctx.sections.get(x.title()), x) for x in titles if x.title() in ctx.sections]
+            return queues
+        for content in word_contents:
+            section = ctx.sections.get(content.id)
+            text_to_check = self.remove_digits(content.title).strip().lower()
+            for kind, checklist in checklists.items():
+                if text_to_check in checklist:
+                    queues[kind].append((content.number, section, text_to_check))
+            queues['nyms'].append((content.number, section, text_to_check))
+        return queues
+
+    def extract_sections(self, ctx, word_contents):
+        word_data = {'related': [], 'definitions': [], 'etymologies': [], 'pronunciations': []}
+        queues = self.dispatch_sections(ctx, word_contents)
+        for kind, handler_name in self.SECTION_HANDLERS:
+            handler = getattr(self, handler_name)
+            with self.phase(handler_name):
+                for index, section, title in queues[kind]:
+                    handler(ctx, index, section, title, word_data)
+        if not ctx.wants('related'):
+            word_data['related'] = []
+        return word_data
+
+    def get_language_sections(self, ctx, language, include_dialects=True):
         start_indices = []
-        json_obj_list = []
-        for content in contents:
-            ctl = content.text.lower()
+        for content in ctx.sections.toc:
+            ctl = content.title.lower()
             if language == ctl or (include_dialects and language in ctl):
-                start_indices.append((content.find_previous().text + '.', ctl))
+                start_indices.append((content.number, ctl))
+        return start_indices
+
+    def get_word_data(self, ctx, language, include_dialects=True, as_records=False):
+        ctx.language = language
+        contents = ctx.sections.toc
+        word_contents = []
+        json_obj_list = []
+        start_indices = self.get_language_sections(ctx, language, include_dialects=include_dialects)
                 
         if not start_indices:
             if contents:
                 return []
-            language_heading = self.soup.find_all(
+            language_heading = ctx.soup.find_all(
                 "span",
                 {"class": "mw-headline"},
                 string=lambda s: language in str(s).lower()
@@ -136,122 +248,82 @@ class WiktionaryParser(object):
             if not language_heading:
                 return []
         for start_index, dialect in start_indices:
-            for content in contents:
-                index = content.find_previous().text
-                content_text = self.remove_digits(content.text.lower())
-                if index.startswith(start_index) and content_text in self.INCLUDED_ITEMS:
+            for content in ctx.sections.subsections(start_index):
+                content_text = self.remove_digits(content.title.lower())
+                if content_text in self.INCLUDED_ITEMS:
                     word_contents.append(content)
-            word_data = {
-                'related': self.parse_related_words(word_contents),
-                'examples': self.parse_examples(word_contents),
-                'definitions': self.parse_definitions(word_contents),
-                'etymologies': self.parse_etymologies(word_contents),
-                'pronunciations': self.parse_pronunciations(word_contents),
-            }
-            json_obj_list_ = self.map_to_object(word_data)
-            for obj in json_obj_list_:
-                obj['categories'] = self.parse_categories()
-                obj['language'] = dialect
-            json_obj_list += json_obj_list_
+            word_data = self.extract_sections(ctx, word_contents)
+            with self.phase('parse_categories'):
+                categories = self.parse_categories(ctx) if ctx.wants('categories') else []
+            with self.phase('map_to_object'):
+                records = self.map_to_records(word_data)
+                for record in records:
+                    record.stamp(categories=categories, language=dialect)
+                json_obj_list += records if as_records else [record.to_json() for record in records]
             
         return json_obj_list
 
-    def parse_categories(self):
-        catlinks = self.soup.select('#mw-normal-catlinks>ul>li')
-        return sorted({link.text for link in catlinks})
-
-
-    def parse_examples(self, word_contents):
-        definition_id_list = self.get_id_list(word_contents, 'definitions')
-        example_list = []
-        for def_index, def_id, def_type in definition_id_list:
-            span_tag = self.soup.find_all('span', {'id': def_id})[0]
-            table = span_tag.parent
-            while table and table.name == 'ol':
-                table = table.find_next_sibling()
-            examples = []
-            while table and table.name == 'ol':
-                for element in table.find_all('dd'):
-                    example_text = re.sub(r'\([^)]*\)', '', element.text.strip())
-                    if example_text:
-                        example = {
-                            "quotation": element.select_one("*.e-quotation"),
-                            "transliteration": element.select_one("*.e-transliteration"),
-                            "translation": element.select_one("*.e-translation"),
-                        }
-                        example = {k: v.text if v is not None else v for k, v in example.items()}
-                        example.update({
-                            "example_text": example_text,
-                        })
-                        if example.get('quotation') is not None:
-                            examples.append(example)
-                    # element.clear()
-                example_list.append((def_index, examples, def_type))
-                # for quot_list in table.find_all(['ul', 'ol']):
-                #     quot_list.clear()
-                table = table.find_next_sibling()
-        return example_list
-
-    def parse_etymologies(self, word_contents):
-        etymology_id_list = self.get_id_list(word_contents, 'etymologies')
-        etymology_list = []
-        etymology_tag = None
-        for etymology_index, etymology_id, _ in etymology_id_list:
-            etymology_text = ''
-            span_tag = self.soup.find_all('span', {'id': etymology_id})[0]
-            next_tag = span_tag.parent.find_next_sibling()
-            while next_tag and next_tag.name not in ['h3', 'h4', 'div', 'h5']:
-                etymology_tag = next_tag
-                next_tag = next_tag.find_next_sibling()
-                if etymology_tag.name == 'p':
-                    etymology_text += etymology_tag.text
-                else:
-                    for list_tag in etymology_tag.find_all('li'):
-                        etymology_text += list_tag.text + '\n'
-            etymology_list.append((etymology_index, etymology_text))
-        return etymology_list
-    
-    def parse_pronunciations(self, word_contents):
-        pronunciation_id_list = self.get_id_list(word_contents, 'pronunciation')
-        pronunciation_list = []
-        audio_links = []
+    def parse_categories(self, ctx):
+        if ctx.categories is None:
+            catlinks = ctx.soup.find(id='mw-normal-catlinks')
+            links = [li for ul in catlinks.find_all('ul', recursive=False) for li in ul.find_all('li', recursive=False)] if catlinks else []
+            ctx.categories = sorted({intern_label(link.text) for link in links})
+        return list(ctx.categories)
+
+    def parse_etymology(self, ctx, etymology_index, section, title, word_data):
+        etymology_text = ''
+        if not ctx.wants('etymologies'):
+            # The index is still needed to group definitions by etymology.
+            word_data['etymologies'].append((etymology_index, etymology_text))
+            return
+        for etymology_tag in section.siblings(stop=['h3', 'h4', 'div', 'h5']):
+            if etymology_tag.name == 'p':
+                etymology_text += etymology_tag.text
+            else:
+                for list_tag in etymology_tag.find_all('li'):
+                    etymology_text += list_tag.text + '\n'
+        word_data['etymologies'].append((etymology_index, etymology_text))
+
+    def parse_pronunciation(self, ctx, pronunciation_index, section, title, word_data):
+        if not ctx.wants('pronunciations'):
+            return
+        # Audio links are collected across all the pronunciation sections of the language.
+        audio_links = word_data['pronunciations'][0][2] if word_data['pronunciations'] else []
         pronunciation_div_classes = ['mw-collapsible', 'vsSwitcher']
-        for pronunciation_index, pronunciation_id, _ in pronunciation_id_list:
-            pronunciation_text = []
-            span_tag = self.soup.find_all('span', {'id': pronunciation_id})[0]
-            list_tag = span_tag.parent
-            while list_tag.name != 'ul':
-                list_tag = list_tag.find_next_sibling()
-                if list_tag.name == 'p':
-                    pronunciation_text.append(list_tag.text)
-                    break
-                if list_tag.name == 'div' and any(_ in pronunciation_div_classes for _ in list_tag['class']):
-                    break
-            for super_tag in list_tag.find_all('sup'):
-                super_tag.clear()
-            for list_element in list_tag.find_all('li'):
-                for audio_tag in list_element.find_all('div', {'class': 'mediaContainer'}):
-                    audio_links.append(audio_tag.find('source')['src'])
-                    audio_tag.extract()
-                for nested_list_element in list_element.find_all('ul'):
-                    nested_list_element.extract()
-                if list_element.text and not list_element.find('table', {'class': 'audiotable'}):
-                    pronunciation_text.append(list_element.text.strip())
-            pronunciation_list.append((pronunciation_index, pronunciation_text, audio_links))
-        return pronunciation_list
+        pronunciation_text = []
+        siblings = section.siblings()
+        list_tag = section.heading
+        while list_tag.name != 'ul':
+            list_tag = next(siblings, None)
+            if list_tag.name == 'p':
+                pronunciation_text.append(list_tag.text)
+                break
+            if list_tag.name == 'div' and any(_ in pronunciation_div_classes for _ in list_tag['class']):
+                break
+        for super_tag in list_tag.find_all('sup'):
+            super_tag.clear()
+        for list_element in list_tag.find_all('li'):
+            for audio_tag in list_element.find_all('div', {'class': 'mediaContainer'}):
+                audio_links.append(audio_tag.find('source')['src'])
+                audio_tag.extract()
+            for nested_list_element in list_element.find_all('ul'):
+                nested_list_element.extract()
+            if list_element.text and not list_element.find('table', {'class': 'audiotable'}):
+                pronunciation_text.append(list_element.text.strip())
+        word_data['pronunciations'].append((pronunciation_index, pronunciation_text, audio_links))
     
-    def mine_element(self, element):
+    def mine_element(self, element, mine_examples=True):
         raw_text = element.text.strip()
         headword = element.find('strong', {"class": "headword"})
         headword = headword.text if headword else None
         if len(element.contents) == 1 and element.find('span', {"class": "headword-line"}, recursive=False):
             return None, headword
 
-        text = element.text.strip()
+        text = raw_text
         appendix = element.find_all("a", {"title": "Appendix:Glossary"})
         appendix += element.find_all("span", {"class": "ib-content"})
         appendix_removal = []
-        example_tags = element.select("div.citation-whole")
+        example_tags = element.select("div.citation-whole") if mine_examples else []
         examples = []
 
         for e in example_tags:
@@ -282,14 +354,14 @@ class WiktionaryParser(object):
 
         for a in appendix:
             if a.text not in self.EXCLUDED_APPENDICES:
-                appendix_removal.append(a.text)
+                appendix_removal.append(intern_label(a.text))
                 a.extract()
 
         mentions = []
         remaining_a = element.find_all('a')
         for m in remaining_a:
             m_href = m.get('href')
-            language = m.parent.get('lang')
+            language = intern_label(m.parent.get('lang'))
             if m_href is not None:
                 if m_href.startswith('/wiki'):
                     mentions.append({
@@ -299,11 +371,7 @@ class WiktionaryParser(object):
                     })
 
 
-        for k in appendix_removal:
-            src_regex = f'(\({k}\)|{k})'
-            src_regex = src_regex.replace('+', '\\+')
-            src_regex = re.compile(src_regex)
-            text = re.sub(src_regex, '', text).strip()
+        text = self.glossary.strip(text, appendix_removal)
         D = {
             "raw_text": raw_text,
             "text": text,
@@ -313,113 +381,96 @@ class WiktionaryParser(object):
         }
         return D, headword
     
-    def parse_definitions(self, word_contents):
-        definition_id_list = self.get_id_list(word_contents, 'definitions')
-        definition_list = []
-        definition_tag = None
-        for def_index, def_id, def_type in definition_id_list:
-            definition_text = []
-            definition_headword = None
-            span_tag = self.soup.find_all('span', {'id': def_id})[0]
-            table = span_tag.parent.find_next_sibling()
-            while table and table.name not in ['h3', 'h4', 'h5']:
-                definition_tag = table
-                table = table.find_next_sibling()
-                scrappable = []
-                if definition_tag.name == 'p':
-                    if definition_tag.text.strip():
-                        scrappable.append(definition_tag)
-                        
-                if definition_tag.name in ['ol', 'ul']:
-                    for element in definition_tag.find_all('li', recursive=False):
-                        if element.text:
-                            scrappable.append(element)
-                            for subelement in element.select('ol>li', recursive=False):
-                                if subelement.text:
-                                    scrappable.append(subelement)
-
-                for i_scrp, e in enumerate(scrappable):
-                    def_dt, hw = self.mine_element(e)
-                    if hw:
-                        definition_headword = hw
-                    if def_dt is None:
-                        continue
-                    def_dt['headword'] = definition_headword
-                    def_dt['def_k'] = (def_index, def_id, i_scrp)
-                    definition_text.append(def_dt)
-      
+    def parse_definition(self, ctx, def_index, section, def_type, word_data):
+        definition_text = []
+        definition_headword = None
+        def_id = section.id
+        # Without definitions the section still carries its part of speech and related words.
+        siblings = section.siblings(stop=['h3', 'h4', 'h5']) if ctx.wants('definitions') else []
+        mine_examples = ctx.wants('examples')
+        for definition_tag in siblings:
+            scrappable = []
+            if definition_tag.name == 'p':
+                if definition_tag.text.strip():
+                    scrappable.append(definition_tag)
                     
-            if def_type == 'definitions':
-                def_type = ''
-            definition_list.append((def_index, definition_text, def_type))
-        return definition_list
-
-    def parse_related_words(self, word_contents):
-        relation_id_list = self.get_id_list(word_contents, 'related')
-        id_list = {e.find_previous().text: {
-            "related_section" :e.parent.get('href').replace('#', '')
-        } for e in word_contents}
-        related_words_list = []
-        for related_index, related_id, relation_type in relation_id_list:
-            words = []
-            span_tag = self.soup.find_all('span', {'id': related_id})[0]
-            parent_tag = span_tag.parent
-            while parent_tag and not parent_tag.find_all('li'):
-                parent_tag = parent_tag.find_next_sibling()
-            if parent_tag:
-                for i_li, list_tag in enumerate(parent_tag.find_all('li')):
-                    prev_def = parent_tag
-                    def_text = None
-                    while True:
-                        prev_def_ = prev_def.find_previous_sibling()
-                        if prev_def_ is None:
-                            break
-                        prev_def = prev_def_
-                        if prev_def.name in ['p', 'ol', 'ul']:
-                            break
-                    if prev_def.name == "p":
-                        def_text = prev_def
-                    elif prev_def.name in ['ul', 'ol']:
-                        def_text = prev_def.find_all('li')[-1]
-                    if def_text is not None:
-                        def_text = def_text.get_text()
-                    else:
-                        def_text = ''
-                    rel = {
-                        "words": list_tag.text,
-                        "def_text": def_text,
-                        'def_k': (related_index, related_id, i_li)
-                    }
-
-                    words.append(rel)
-            related_words_list.append((related_index, words, relation_type))
-
-        #Pass 2
-        
-        # id_list = list(id_list.items())
-        for k in id_list:
-            def_id = id_list[k].get('related_section')
-            content = self.soup.find(True, {"id": def_id}).parent
-            while True:
-                content = content.find_next_sibling()
-                if content is None:
-                    break
-
-                elif content.name in ['h3', 'h4', 'h5']:
-                    break
-
-                elif content.name in ['ol', 'ul']:
-                    lis = content.find_all('li', recursive=False)
-                    for i_li, li in enumerate(lis):
-                        related_words_list += self.parse_related_words_from_nyms(li, k, def_text=li.text, def_k=(k, def_id, i_li))
-                elif content.name in ['p']:
-                    related_words_list += self.parse_related_words_from_nyms(content, k, def_text=content.text, def_k=(k, def_id, 0))
-                             
-        return related_words_list
+            if definition_tag.name in ['ol', 'ul']:
+                for element in definition_tag.find_all('li', recursive=False):
+                    if element.text:
+                        scrappable.append(element)
+                        for subelement in element.select('ol>li', recursive=False):
+                            if subelement.text:
+                                scrappable.append(subelement)
+
+            for i_scrp, e in enumerate(scrappable):
+                def_dt, hw = self.mine_element(e, mine_examples=mine_examples)
+                if hw:
+                    definition_headword = hw
+                if def_dt is None:
+                    continue
+                def_dt['headword'] = definition_headword
+                def_dt['def_k'] = (def_index, def_id, i_scrp)
+                definition_text.append(def_dt)
+  
+        if def_type == 'definitions':
+            def_type = ''
+        word_data['definitions'].append((def_index, definition_text, def_type))
+
+    def parse_related_section(self, ctx, related_index, section, relation_type, word_data):
+        if not ctx.wants('related'):
+            return
+        words = []
+        related_id = section.id
+        parent_tag = None
+        for tag in section.siblings():
+            if tag.find('li') is not None:
+                parent_tag = tag
+                break
+        if parent_tag:
+            # Every item of the list refers to the same definition, the last
+            # paragraph or list item before the list.
+            prev_def = ctx.sections.previous_sibling(parent_tag, ['p', 'ol', 'ul'])
+            def_text = None
+            if prev_def.name == "p":
+                def_text = prev_def
+            elif prev_def.name in ['ul', 'ol']:
+                def_text = prev_def.find_all('li')[-1]
+            if def_text is not None:
+                def_text = def_text.get_text()
+            else:
+                def_text = ''
+            for i_li, list_tag in enumerate(parent_tag.find_all('li')):
+                rel = {
+                    "words": list_tag.text,
+                    "def_text": def_text,
+                    'def_k': (related_index, related_id, i_li)
+                }
+
+                words.append(rel)
+        word_data['related'].append((related_index, words, relation_type))
+
+    def parse_nyms_section(self, ctx, k, section, title, word_data):
+        # Relation labels are taken out of the definitions here, so this also
+        # runs when only definitions are wanted.
+        if not (ctx.wants('related') or ctx.wants('definitions')):
+            return
+        def_id = section.id
+        for content in section.siblings(stop=['h3', 'h4', 'h5']):
+            if not ctx.sections.nyms(content):
+                continue
+            if content.name in ['ol', 'ul']:
+                lis = content.find_all('li', recursive=False)
+                for i_li, li in enumerate(lis):
+                    nyms = ctx.sections.nyms(li)
+                    if nyms:
+                        word_data['related'] += self.parse_related_words_from_nyms(li, k, nyms=nyms, def_text=li.text, def_k=(k, def_id, i_li))
+            elif content.name in ['p']:
+                word_data['related'] += self.parse_related_words_from_nyms(content, k, nyms=ctx.sections.nyms(content), def_text=content.text, def_k=(k, def_id, 0))
     
-    def parse_related_words_from_nyms(self, content, related_index, **kwargs):
+    def parse_related_words_from_nyms(self, content, related_index, nyms=None, **kwargs):
         nyms_list = []
-        nyms = content.select('.nyms')
+        if nyms is None:
+            nyms = content.select('.nyms')
         for nym in nyms:
             relation_type_span = nym.select_one('span.defdate')
             relation_type = relation_type_span.text if relation_type_span is not None else ""
@@ -440,70 +491,261 @@ class WiktionaryParser(object):
         return nyms_list
     
     def map_to_object(self, word_data):
-        json_obj_list = []
+        return [record.to_json() for record in self.map_to_records(word_data)]
+
+    def map_to_records(self, word_data):
+        """
+        Group the extracted sections into one `WordData` record per etymology.
+
+        Section numbers are parsed once into tuples of ints. Definitions are
+        placed under their etymology by bisecting the etymology numbers, and
+        relation lists are attached to the definitions whose number is a prefix
+        of theirs, through a map from number to definitions. Examples are not
+        grouped here: `mine_element` reads them along with each definition.
+        """
         if not word_data['etymologies']:
             word_data['etymologies'] = [('', '')]
-        for (current_etymology, next_etymology) in zip_longest(word_data['etymologies'], word_data['etymologies'][1:], fillvalue=('999', '')):
+        etymology_keys = [section_key(index) for index, _ in word_data['etymologies']]
+        bounds = etymology_keys[1:] + [(999,)]
+        data_objs = []
+        next_etymologies = [index for index, _ in word_data['etymologies'][1:]] + ['999']
+        for (etymology_index, etymology_text), next_etymology in zip(word_data['etymologies'], next_etymologies):
             data_obj = WordData()
-            data_obj.etymology = current_etymology[1]
+            data_obj.etymology = etymology_text
             for pronunciation_index, text, audio_links in word_data['pronunciations']:
-                if (self.count_digits(current_etymology[0]) == self.count_digits(pronunciation_index)) or (current_etymology[0] <= pronunciation_index < next_etymology[0]):
+                if (self.count_digits(etymology_index) == self.count_digits(pronunciation_index)) or (etymology_index <= pronunciation_index < next_etymology):
                     data_obj.pronunciations = text
                     data_obj.audio_links = audio_links
-            for definition_index, definition_text, definition_type in word_data['definitions']:
-                current_etymology_str = ".".join(f"{int(num):02d}" for num in current_etymology[0].split(".") if num)
-                definition_index_str = ".".join(f"{int(num):02d}" for num in definition_index.split(".") if num)
-                next_etymology_str = ".".join(f"{int(num):02d}" for num in next_etymology[0].split(".") if num)
-                if current_etymology_str <= definition_index_str < next_etymology_str \
-                        or is_subheading(current_etymology[0], definition_index):
-                    def_obj = Definition()
-                    def_obj.text = definition_text
-                    def_obj.part_of_speech = definition_type
-                    for example_index, examples, _ in word_data['examples']:
-                        if example_index.startswith(definition_index):
-                            def_obj.example_uses = examples
-                    for related_word_index, related_words, relation_type in word_data['related']:
-                        if related_word_index.startswith(definition_index):
-                            def_obj.related_words.append(RelatedWord(relation_type, related_words))
-                    data_obj.definition_list.append(def_obj)
-            json_obj_list.append(data_obj.to_json())
-        return json_obj_list
+            data_objs.append(data_obj)
 
-    def grab_from_url(self, url, old_id=None, lang=None, include_dialects=True):
+        definitions_by_key = {}
+        for definition_index, definition_text, definition_type in word_data['definitions']:
+            key = section_key(definition_index)
+            i = bisect.bisect_right(etymology_keys, key) - 1
+            if i < 0 or not key < bounds[i]:
+                continue
+            def_obj = Definition(part_of_speech=definition_type)
+            def_obj.text = definition_text
+            definitions_by_key.setdefault(key, []).append(def_obj)
+            data_objs[i].definition_list.append(def_obj)
+
+        for related_word_index, related_words, relation_type in word_data['related']:
+            key = section_key(related_word_index)
+            for length in range(len(key) + 1):
+                for def_obj in definitions_by_key.get(key[:length], []):
+                    def_obj.related_words.append(RelatedWord(relation_type, related_words))
+
+        return data_objs
+
+    def load_html(self, html, word=None, url=None, languages=None, include_dialects=True):
+        """
+        Build the tree of a page. With `languages`, only the sections of those
+        languages are parsed, unless the page layout is not the expected one.
+        """
+        if languages is not None and self.slice_languages:
+            with self.phase('slice'):
+                sliced = slice_languages(html, languages, include_dialects=include_dialects)
+            if sliced is not None:
+                ctx = self.__build_context(sliced, word, url)
+                if self.__has_sections(ctx, languages, include_dialects):
+                    return ctx
+        return self.__build_context(html, word, url)
+
+    def __build_context(self, html, word, url):
+        with self.phase('build'):
+            soup = self.engine.build(html.replace('>\n<', '><'))
+        with self.phase('clean'):
+            self.clean_html(soup)
+        with self.phase('index'):
+            sections = SectionIndex(soup)
+        return ParseContext(soup, sections, word=word, url=url)
+
+    def __has_sections(self, ctx, languages, include_dialects):
+        """
+        Whether every section the languages are read from made it into a sliced
+        tree. A language with no included subsection is read by looking its
+        sections up by title anywhere on the page, so it needs the full tree.
+        """
+        for language in languages:
+            for number, _ in self.get_language_sections(ctx, language.lower(), include_dialects=include_dialects):
+                subsections = ctx.sections.subsections(number)
+                if not all(section.id in ctx.sections for section in subsections):
+                    return False
+                if not any(self.remove_digits(section.title.lower()) in self.INCLUDED_ITEMS for section in subsections):
+                    return False
+        return True
+
+    def get_fields(self, fields=None):
+        if fields is None:
+            return None
+        fields = frozenset([fields] if isinstance(fields, str) else fields)
+        unknown = fields - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields {sorted(unknown)}, expected some of {FIELDS}")
+        return fields
+
+    def parse_html(self, html, lang=None, include_dialects=True, word=None, url=None, fields=None, as_records=False):
+        """
+        Extract the records of `lang` from a page.
+
+        `fields` restricts extraction to some of FIELDS; the parsers of the other
+        fields are skipped and their keys are left empty ('' for the etymology,
+        [] for everything else). Records and definitions keep the same structure.
+
+        With `as_records`, `WordData` records are returned instead of dicts;
+        `utils.write_ndjson` serializes them without going through `to_json`.
+        """
         if lang is None:
             lang = self.language
-        response = self.session.get(url, params={'oldid': old_id})
-        self.soup = BeautifulSoup(response.text.replace('>\n<', '><'), 'html.parser')
-        self.clean_html()
+        languages = [lang] if isinstance(lang, str) else lang
+        fields = self.get_fields(fields)
+        ctx = self.load_html(html, word=word, url=url, languages=languages, include_dialects=include_dialects)
+        ctx.fields = fields
+        res = []
+        parsed_sections = set()
+        for language in languages:
+            language = language.lower()
+            # Extraction edits the sections it reads, so a section shared by two
+            # requested languages (e.g. a dialect) is read again from a fresh tree.
+            sections = {number for number, _ in self.get_language_sections(ctx, language, include_dialects=include_dialects)}
+            if sections & parsed_sections:
+                ctx = self.load_html(html, word=word, url=url, languages=languages, include_dialects=include_dialects)
+                ctx.fields = fields
+                parsed_sections = set()
+            parsed_sections |= sections
+            res += self.get_word_data(ctx, language, include_dialects=include_dialects, as_records=as_records)
+        return res
 
-        return self.get_word_data(lang.lower(), include_dialects=include_dialects)
+    @staticmethod
+    def page_key(url):
+        parsed_url = parse.urlparse(url)
+        title = parse.unquote(parsed_url.path.split('/wiki/', 1)[-1])
+        printable = parse.parse_qs(parsed_url.query).get('printable', [None])[0]
+        return title, printable
+
+    def request(self, url, old_id=None):
+        with self.phase('fetch'):
+            response = self.session.get(url, params={'oldid': old_id})
+        with self.phase('decode'):
+            html = response.text
+        return response, html
+
+    def download(self, url, old_id=None):
+        if self.cache is None:
+            return self.request(url, old_id=old_id)[1]
+        title, printable = self.page_key(url)
+        with self.phase('cache'):
+            html = self.cache.get(title, old_id=old_id, printable=printable)
+        if html is None:
+            response, html = self.request(url, old_id=old_id)
+            if getattr(response, 'status_code', 200) in [200, 404]:
+                with self.phase('cache'):
+                    self.cache.put(title, html, old_id=old_id, printable=printable)
+        return html
+
+    def grab_from_url(self, url, old_id=None, lang=None, include_dialects=True, word=None, fields=None, as_records=False):
+        with self.page(word, url):
+            html = self.download(url, old_id=old_id)
+            return self.parse_html(html, lang=lang, include_dialects=include_dialects, word=word, url=url, fields=fields, as_records=as_records)
     
     def deorphanize(self, wikiUrl, language, **kwargs):
         url = self.__base_url + wikiUrl
-        res = self.grab_from_url(url, lang=language, include_dialects=False)
+        res = self.grab_from_url(url, lang=language, include_dialects=False, word=kwargs.get('word'),
+                                 fields=kwargs.get('fields'), as_records=kwargs.get('as_records', False))
         for i in range(len(res)):
+            if isinstance(res[i], WordData):
+                res[i].stamp(word=kwargs.get('word'), query=kwargs.get('query'))
+                continue
             res[i]['word'] = kwargs.get('word')
             res[i]['query'] = kwargs.get('query')
         return res
 
-    def fetch(self, word, language=None, old_id=None, query=None, include_dialects=True):
+    def get_languages(self, language=None):
         language = self.language if not language else language
-        languages = language if hasattr(language, '__iter__') and type(language) != str else [language]
-        self.current_url = self.url.format(word, self.use_printable)
-        self.current_word = word
-        res = []
-
-        for lang in languages:
-            res += self.grab_from_url(self.current_url, old_id=old_id, lang=lang, include_dialects=include_dialects)
+        return language if hasattr(language, '__iter__') and type(language) != str else [language]
 
+    def stamp_records(self, res, word, query=None):
         for i in range(len(res)):
+            if isinstance(res[i], WordData):
+                record = res[i]
+                record.stamp(query=(record.query if record.query is not None else word) if query is None else query,
+                             word=record.word if record.word is not None else word)
+                continue
             res[i]['query'] = res[i].get('query', word) if query is None else query
             res[i]['word'] = res[i].get('word', word)
-
         return res
-        
+
+    def fetch(self, word, language=None, old_id=None, query=None, include_dialects=True, fields=None, as_records=False):
+        languages = self.get_languages(language)
+        url = self.url.format(word, self.use_printable)
+        res = self.grab_from_url(url, old_id=old_id, lang=languages, include_dialects=include_dialects, word=word,
+                                 fields=fields, as_records=as_records)
+        return self.stamp_records(res, word, query)
+
+    def _parse_fetched(self, html, word, url, languages, query, include_dialects):
+        with self.page(word, url):
+            res = self.parse_html(html, lang=languages, include_dialects=include_dialects, word=word, url=url)
+        return self.stamp_records(res, word, query)
+
+    def _executors(self):
+        if self._io_executor is None:
+            self._io_executor = ThreadPoolExecutor(self.max_concurrency, thread_name_prefix="wiktionary-io")
+            # Parsing holds the GIL, extra parse threads would only compete with the downloads.
+            self._parse_executor = ThreadPoolExecutor(1, thread_name_prefix="wiktionary-parse")
+        return self._io_executor, self._parse_executor
+
+    async def afetch(self, word, language=None, old_id=None, query=None, include_dialects=True):
+        loop = asyncio.get_running_loop()
+        io_executor, parse_executor = self._executors()
+        languages = self.get_languages(language)
+        url = self.url.format(word, self.use_printable)
+        html = await loop.run_in_executor(io_executor, self.download, url, old_id)
+        return await loop.run_in_executor(parse_executor, self._parse_fetched, html, word, url, languages, query, include_dialects)
+
+    async def fetch_many(self, words, languages=None, include_dialects=True, concurrency=None):
+        """
+        Fetch every word in `words`, yielding (word, records) as each one completes.
+        Items of `words` are words or (word, old_id) pairs.
+
+        At most `concurrency` pages are downloaded at once, over the session's
+        keep-alive connection pool; parsing runs in an executor so the event
+        loop is never blocked.
+        """
+        concurrency = self.max_concurrency if concurrency is None else concurrency
+        words = iter(words)
+        pending = {}
+        while True:
+            while len(pending) < concurrency:
+                word = next(words, None)
+                if word is None:
+                    break
+                word, old_id = (word, None) if isinstance(word, str) else word
+                task = asyncio.ensure_future(self.afetch(word, language=languages, old_id=old_id, include_dialects=include_dialects))
+                pending[task] = word
+            if not pending:
+                return
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield pending.pop(task), task.result()
+
+    def close(self):
+        for executor in [self._io_executor, self._parse_executor]:
+            if executor is not None:
+                executor.shutdown()
+        self._io_executor = self._parse_executor = None
+        self.session.close()
+
 
     def fetch_all_potential(self, word, query=None, language=None, old_id=None, verbose=0, include_dialects=True):
+        return dict(self.iter_fetch_all_potential(word, query=query, language=language, old_id=old_id,
+                                                  verbose=verbose, include_dialects=include_dialects))
+
+    def iter_fetch_all_potential(self, word, query=None, language=None, old_id=None, verbose=0, include_dialects=True):
+        """
+        Yield (variant, records) for `word` and each of its spelling variants, as
+        soon as each page is parsed. `word` itself is always yielded first, other
+        variants only when they have records.
+        """
         def get_possible_altenrnatives(word):
             replacement_dict = {
                 "ا": ["ا", "أ", "إ", "آ"],
@@ -516,17 +758,52 @@ class WiktionaryParser(object):
 
             return list(exrex.generate(word_regex))
         
-        possible_altenrnatives = get_possible_altenrnatives(word)
-        res = {word: self.fetch(word, query=word, include_dialects=include_dialects)}
+        if self.variant_index is not None:
+            # Only the spellings that exist are returned, in one lookup.
+            possible_altenrnatives = self.variant_index.lookup(word)
+        else:
+            possible_altenrnatives = get_possible_altenrnatives(word)
+        if self.title_index is not None and self.variant_index is None:
+            # Variants missing from the title dump would only cost a 404 round-trip.
+            possible_altenrnatives = self.title_index.filter(possible_altenrnatives)
+        if self.variant_index is not None and self.variant_index.complete:
+            word_exists = self.variant_index.exists(word)
+        else:
+            # An index of the pages collected so far only picks variants: the word itself may be new.
+            word_exists = self.title_index is None or self.title_index.exists(word)
+        if word_exists:
+            yield word, self.fetch(word, query=word, include_dialects=include_dialects)
+        else:
+            yield word, []
         if query is None:
             query = word
         if verbose > 0:
-            possible_altenrnatives = tqdm.tqdm(possible_altenrnatives, desc="Fetching potential forms", leave=False)
+            desc = "Fetching potential forms"
+            if self.title_index is not None:
+                desc += f" ({self.title_index.stats['pruned']} requests saved so far)"
+            possible_altenrnatives = tqdm.tqdm(possible_altenrnatives, desc=desc, leave=False)
         for w in possible_altenrnatives:
             if verbose > 0:
                 possible_altenrnatives.set_postfix(w)
 
             fetch_res = self.fetch(w, language=language, old_id=old_id, query=query)
             if fetch_res:
-                res[w] = fetch_res
-        return res
\ No newline at end of file
+                yield w, fetch_res
+
+    def iter_fetch(self, words, language=None, query=None, include_dialects=True, fields=None, as_records=False):
+        """
+        Fetch `words` one after the other, yielding (word, records) as soon as
+        each page is parsed. Items of `words` are words or (word, old_id) pairs.
+        """
+        for item in words:
+            word, old_id = (item, None) if isinstance(item, str) else item
+            yield word, self.fetch(word, language=language, old_id=old_id, query=query, include_dialects=include_dialects,
+                                   fields=fields, as_records=as_records)
+
+    def iter_deorphanize(self, orphans, **kwargs):
+        """
+        Yield (orphan, records) for every orphan node, as soon as its page is parsed.
+        Orphans are dicts of `deorphanize` arguments (wikiUrl, language, word, query).
+        """
+        for orphan in orphans:
+            yield orphan, self.deorphanize(**{**orphan, **kwargs})
@@ -1,7 +1,34 @@
+import os
 import re
+import tempfile
+from contextlib import contextmanager
+
 import pymysql
 
 
+# Escapes of the default LOAD DATA format: fields separated by tabs, rows by
+# newlines, backslash as the escape character and \N for NULL.
+TSV_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\0": "\\0"})
+
+
+def tsv_field(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, bytes):
+        # Loaded through UNHEX(), see `MySQLClient.bulk_load`.
+        return value.hex()
+    return str(value).translate(TSV_ESCAPES)
+
+
+def write_tsv(rows, columns, f):
+    """Write `rows` (dicts) to `f` in the default LOAD DATA format, one line per row."""
+    for row in rows:
+        f.write("\t".join([tsv_field(row.get(column)) for column in columns]))
+        f.write("\n")
+
+
 class DatabaseClient:
     def __init__(self, host, user, password, db):
         self.host = host
@@ -36,6 +63,11 @@ class DatabaseClient:
         # Implementation for the CREATE operation
         pass
 
+    def upsert(self, collection_name, data, merge={}, default_merge='replace', **kwargs):
+        # Implementation for the INSERT-or-UPDATE operation
+        data = self.validate_data(collection_name, data)
+        pass
+
     def read(self, collection_name, conditions={}, joins=[], fields='*', order_by=None, limit=None):
         # Implementation for the READ operation
         pass
@@ -54,13 +86,36 @@ class DatabaseClient:
 
 
 class MySQLClient(DatabaseClient):
-    def __init__(self, host, user, password, db):
+    # How `upsert` merges a column of a row whose key already exists, as the
+    # assignment of its ON DUPLICATE KEY UPDATE clause. `None` keeps the stored
+    # value. NULL never wins over a value in `min`, `max`, `coalesce` and `fill`.
+    MERGE_RULES = {
+        "replace": "{column}=VALUES({column})",
+        "keep": None,
+        "coalesce": "{column}=COALESCE(VALUES({column}), {column})",
+        "fill": "{column}=COALESCE({column}, VALUES({column}))",
+        "min": "{column}=LEAST(COALESCE({column}, VALUES({column})), COALESCE(VALUES({column}), {column}))",
+        "max": "{column}=GREATEST(COALESCE({column}, VALUES({column})), COALESCE(VALUES({column}), {column}))",
+    }
+
+    def __init__(self, host, user, password, db, local_infile=False):
         super().__init__(host, user, password, db)
         self.query = ""
-        self.conn = pymysql.connect(host=self.host, user=self.user, password=self.password, database=self.db)
+        self.local_infile = local_infile
+        # Columns of BINARY/VARBINARY type, per table, filled with `schema_info`.
+        self.binary_columns = {}
+        self.conn = pymysql.connect(host=self.host, user=self.user, password=self.password, database=self.db,
+                                    local_infile=local_infile)
         self.conn.autocommit(True)
 
         
+    @staticmethod
+    def _literal(value):
+        """Quote a condition value; bytes (binary ids) become hex literals."""
+        if isinstance(value, bytes):
+            return f"X'{value.hex()}'"
+        return f"'{value}'"
+
     def _build_conditions(self, conditions={}):
         """ Helper method to build the WHERE clause from a dictionary of conditions. """
         if not conditions:
@@ -68,13 +123,13 @@ class MySQLClient(DatabaseClient):
         C = []
         for key, value in conditions.items():
             if isinstance(value, (list, tuple, set)) and len(value) > 0:
-                value = ", ".join([f"'{e}'" for e in value])
+                value = ", ".join([self._literal(e) for e in value])
                 C.append(f"{key} IN ({value})")
             elif str(value).upper() in ['IS NULL', 'IS NOT NULL']:
                 C.append(f"{key} {value}")
             else:
                 if not re.fullmatch(r'%\(\w+\)s', str(value)):
-                    value = f"'{value}'"
+                    value = self._literal(value)
                 C.append(f"{key}={value}")
         return " WHERE " + " AND ".join(C)
 
@@ -84,8 +139,11 @@ class MySQLClient(DatabaseClient):
         return keys
     
     def lookup_collection_info(self, collection_name):
-        query = f"SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = '{collection_name}'"
-        self.schema_info[collection_name] = [e['COLUMN_NAME'] for e in self.execute(query)]
+        query = f"SELECT COLUMN_NAME, DATA_TYPE FROM INFORMATION_SCHEMA.COLUMNS " \
+                f"WHERE TABLE_SCHEMA = '{self.db}' AND TABLE_NAME = '{collection_name}' ORDER BY ORDINAL_POSITION"
+        columns = self.execute(query)
+        self.schema_info[collection_name] = [e['COLUMN_NAME'] for e in columns]
+        self.binary_columns[collection_name] = {e['COLUMN_NAME'] for e in columns if e['DATA_TYPE'].lower() in ('binary', 'varbinary')}
 
     
     def insert(self, collection_name, data, ignore=False, **kwargs):
@@ -104,6 +162,152 @@ class MySQLClient(DatabaseClient):
         return self.execute(data=data, **kwargs)
         # Execute the query or return it
     
+    def _build_assignments(self, columns, merge={}, default_merge='replace', table=None):
+        """
+        ON DUPLICATE KEY UPDATE assignments of `columns`, following their merge
+        rules. Columns are qualified with `table` when given (INSERT ... SELECT
+        reads a table with the same column names).
+        """
+        assignments = []
+        for k in columns:
+            rule = merge.get(k, default_merge)
+            assignment = self.MERGE_RULES[rule] if rule in self.MERGE_RULES else rule
+            if assignment is not None:
+                assignments.append(assignment.format(column=f"{table}.{k}" if table else k))
+        return assignments
+
+    def upsert(self, collection_name, data, merge={}, default_merge='replace', **kwargs):
+        """
+        Insert rows, and merge those whose primary or unique key already exists
+        in a single statement (INSERT ... ON DUPLICATE KEY UPDATE).
+
+        :param merge: Dictionary of column -> rule, a name of MERGE_RULES or an
+            assignment with a `{column}` placeholder, e.g. "{column}=VALUES({column})".
+        :param default_merge: Rule of the columns missing from `merge`.
+        :return: Affected rows (1 per inserted row, 2 per updated row).
+        """
+        if not data:
+            return []
+
+        data = self.validate_data(collection_name, data)
+        keys = list(self._build_columns(data))
+        columns = ', '.join(keys)
+        placeholders = ', '.join([f"%({k})s" for k in keys])
+        assignments = self._build_assignments(keys, merge, default_merge)
+        if not assignments:
+            return self.insert(collection_name, data, ignore=True, **kwargs)
+        self.query = f"INSERT INTO {collection_name} ({columns}) VALUES ({placeholders}) ON DUPLICATE KEY UPDATE {', '.join(assignments)}"
+        return self.execute(data=data, **kwargs)
+
+    def bulk_load(self, collection_name, data, merge=None, default_merge='replace', tmp_dir=None):
+        """
+        Load rows with LOAD DATA LOCAL INFILE, through a temporary TSV file.
+        The connection must be opened with `local_infile=True`.
+
+        Without `merge`, rows whose key already exists are skipped, like
+        `insert(..., ignore=True)`. With `merge`, rows are loaded into a
+        temporary copy of the table and merged into it with the rules of
+        `upsert`, in one INSERT ... SELECT.
+
+        :return: Affected rows.
+        """
+        if not data:
+            return []
+
+        data = self.validate_data(collection_name, data)
+        columns = self.schema_info[collection_name]
+        binary_columns = self.binary_columns.get(collection_name, set())
+        with tempfile.NamedTemporaryFile('w', encoding='utf8', newline='\n', suffix='.tsv', dir=tmp_dir, delete=False) as f:
+            write_tsv(data, columns, f)
+            path = f.name
+        try:
+            if merge is None:
+                return self.execute(self._load_data_query(path, collection_name, columns, binary_columns))
+            staging = f"{collection_name}_load"
+            assignments = self._build_assignments(columns, merge, default_merge, table=collection_name)
+            column_list = ', '.join(columns)
+            self.execute(f"DROP TEMPORARY TABLE IF EXISTS {staging}")
+            self.execute(f"CREATE TEMPORARY TABLE {staging} LIKE {collection_name}")
+            try:
+                self.execute(self._load_data_query(path, staging, columns, binary_columns))
+                on_duplicate = f" ON DUPLICATE KEY UPDATE {', '.join(assignments)}" if assignments else ""
+                instruction = "INSERT" if assignments else "INSERT IGNORE"
+                return self.execute(f"{instruction} INTO {collection_name} ({column_list}) SELECT {column_list} FROM {staging}{on_duplicate}")
+            finally:
+                self.execute(f"DROP TEMPORARY TABLE IF EXISTS {staging}")
+        finally:
+            os.remove(path)
+
+    @staticmethod
+    def _load_data_query(path, collection_name, columns, binary_columns=()):
+        path = path.replace('\\', '/').replace("'", "\\'")
+        # Binary columns are written in hex (see `tsv_field`), read into variables and decoded.
+        fields = ', '.join([f"@{k}" if k in binary_columns else k for k in columns])
+        decode = ', '.join([f"{k}=UNHEX(@{k})" for k in columns if k in binary_columns])
+        return f"LOAD DATA LOCAL INFILE '{path}' IGNORE INTO TABLE {collection_name} CHARACTER SET utf8mb4 " \
+               f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' ({fields})" + \
+               (f" SET {decode}" if decode else "")
+
+    def set_checks(self, enabled=True):
+        """Turn foreign key and unique checks of this connection's session on or off."""
+        value = 1 if enabled else 0
+        self.execute(f"SET FOREIGN_KEY_CHECKS = {value}")
+        self.execute(f"SET UNIQUE_CHECKS = {value}")
+
+    @contextmanager
+    def checks_disabled(self):
+        """Run a bulk load without foreign key and unique checks; run `validate_constraints` afterwards."""
+        self.set_checks(False)
+        try:
+            yield self
+        finally:
+            self.set_checks(True)
+
+    def validate_constraints(self, tables=None, delete=False):
+        """
+        Look for the rows that foreign key and unique checks would have
+        rejected, e.g. after a load run in `checks_disabled`.
+
+        :param tables: Tables to check, defaults to every table of the database.
+        :param delete: Delete rows whose foreign key points to no row, as
+            INSERT IGNORE would have skipped them.
+        :return: Dictionary of constraint -> number of offending rows, for the
+            constraints that have some.
+        """
+        violations = {}
+        foreign_keys = self.execute(
+            "SELECT CONSTRAINT_NAME, TABLE_NAME, COLUMN_NAME, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME "
+            f"FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE WHERE TABLE_SCHEMA = '{self.db}' AND REFERENCED_TABLE_NAME IS NOT NULL"
+        )
+        for fk in foreign_keys:
+            table, column = fk['TABLE_NAME'], fk['COLUMN_NAME']
+            if tables is not None and table not in tables:
+                continue
+            parent, parent_column = fk['REFERENCED_TABLE_NAME'], fk['REFERENCED_COLUMN_NAME']
+            dangling = f"FROM {table} c LEFT JOIN {parent} p ON c.{column} = p.{parent_column} " \
+                       f"WHERE c.{column} IS NOT NULL AND p.{parent_column} IS NULL"
+            count = self.execute(f"SELECT COUNT(*) AS n {dangling}")[0]['n']
+            if count:
+                violations[f"{table}.{fk['CONSTRAINT_NAME']}"] = count
+                if delete:
+                    self.execute(f"DELETE c {dangling}")
+
+        unique_keys = self.execute(
+            "SELECT TABLE_NAME, INDEX_NAME, GROUP_CONCAT(COLUMN_NAME ORDER BY SEQ_IN_INDEX) AS COLUMNS "
+            f"FROM INFORMATION_SCHEMA.STATISTICS WHERE TABLE_SCHEMA = '{self.db}' AND NON_UNIQUE = 0 "
+            "GROUP BY TABLE_NAME, INDEX_NAME"
+        )
+        for key in unique_keys:
+            table = key['TABLE_NAME']
+            if tables is not None and table not in tables:
+                continue
+            count = self.execute(
+                f"SELECT COUNT(*) AS n FROM (SELECT 1 FROM {table} GROUP BY {key['COLUMNS']} HAVING COUNT(*) > 1) duplicates"
+            )[0]['n']
+            if count:
+                violations[f"{table}.{key['INDEX_NAME']}"] = count
+        return violations
+
     def read(self, collection_name, conditions={}, joins=[], fields='*', order_by=None, limit=None, distinct=False):
         """
         Read method that can handle complex queries including joins.
@@ -0,0 +1,214 @@
+import bz2
+import gzip
+import html
+import json
+import os
+import re
+import tarfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from urllib import parse
+
+import tqdm
+
+from .core import WiktionaryParser
+from .pipeline import init_worker, parse_page, parser_config
+
+
+def open_dump(path):
+    """Open a dump file, transparently decompressing bz2 and gzip."""
+    path = str(path)
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def iter_ndjson_pages(stream):
+    """
+    Yield (title, html, revision_id) from an HTML dump with one JSON page per line.
+
+    Both flat records ({"title", "html", "oldid"}) and Wikimedia Enterprise
+    records ({"name", "article_body": {"html"}, "version": {"identifier"}})
+    are understood. Only the current line is held in memory.
+    """
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        page = json.loads(line)
+        namespace = (page.get('namespace') or {}).get('identifier', 0)
+        if namespace != 0:
+            continue
+        title = page.get('title', page.get('name'))
+        page_html = page.get('html')
+        if page_html is None:
+            page_html = (page.get('article_body') or {}).get('html')
+        revision_id = page.get('oldid', (page.get('version') or {}).get('identifier'))
+        yield title, page_html, revision_id
+
+
+def iter_tar_pages(path):
+    with tarfile.open(path, 'r|*') as archive:
+        for member in archive:
+            if member.isfile() and member.name.endswith(('.ndjson', '.json')):
+                yield from iter_ndjson_pages(archive.extractfile(member))
+
+
+def iter_dump_pages(path):
+    """Yield (title, html, revision_id) for every article page in the HTML dump at `path`."""
+    path = str(path)
+    name = os.path.basename(path)
+    if '.xml' in name:
+        # XML and multistream dumps hold wikitext, which only MediaWiki can render.
+        raise ValueError(f"{name} is an XML dump: its pages are wikitext, use an HTML (NDJSON) dump instead")
+    if '.tar' in name:
+        yield from iter_tar_pages(path)
+    else:
+        with open_dump(path) as stream:
+            yield from iter_ndjson_pages(stream)
+
+
+SECTION_TAG = re.compile(r'</?section\b[^>]*>')
+HEADING = re.compile(r'<h([2-6])\b([^>]*)>(.*?)</h\1>', re.S)
+HEADING_ID = re.compile(r'\s+id="([^"]*)"')
+FIRST_HEADING = re.compile(r'<h[2-6]\b')
+CATEGORY_LINK = re.compile(r'<link\b[^>]*\brel="mw:PageProp/Category"[^>]*>')
+HREF = re.compile(r'\bhref="([^"]*)"')
+MARKUP = re.compile(r'<[^>]+>')
+
+
+def toc_numbers(levels):
+    """TOC numbers ('1', '1.1', ...) of headings of the given levels, numbered like MediaWiki does."""
+    numbers, open_levels, counters = [], [], []
+    for level in levels:
+        while open_levels and open_levels[-1] >= level:
+            open_levels.pop()
+        depth = len(open_levels)
+        open_levels.append(level)
+        counters = counters[:depth + 1]
+        if len(counters) == depth + 1:
+            counters[depth] += 1
+        else:
+            counters.append(1)
+        numbers.append('.'.join(map(str, counters)))
+    return numbers
+
+
+def legacy_layout(markup):
+    """
+    Lay a Parsoid page (Wikimedia Enterprise HTML dumps, REST API) out like
+    the rendered pages the extractor reads.
+
+    Parsoid nests each section in a <section> and puts the anchor on the
+    heading itself, has no table of contents, and lists categories as
+    `mw:PageProp/Category` links. Sections are flattened, each heading gets
+    its `mw-headline` span, a table of contents is built from the headings,
+    and the category links become a `mw-normal-catlinks` block. Pages that
+    already have headline spans are returned unchanged.
+    """
+    if 'class="mw-headline"' in markup:
+        return markup
+    markup = SECTION_TAG.sub('', markup)
+    toc = []
+
+    def headline(match):
+        level, attributes, inner = match.groups()
+        section_id = HEADING_ID.search(attributes)
+        if section_id is None:
+            return match.group(0)
+        toc.append((int(level), section_id.group(1), html.unescape(MARKUP.sub('', inner)).strip()))
+        attributes = HEADING_ID.sub('', attributes, count=1)
+        return f'<h{level}{attributes}><span class="mw-headline" id="{section_id.group(1)}">{inner}</span></h{level}>'
+    markup = HEADING.sub(headline, markup)
+
+    if toc:
+        entries = ''.join(
+            f'<li><a href="#{section_id}"><span class="tocnumber">{number}</span> '
+            f'<span class="toctext">{html.escape(title)}</span></a></li>'
+            for number, (_, section_id, title) in zip(toc_numbers([level for level, _, _ in toc]), toc)
+        )
+        start = FIRST_HEADING.search(markup).start()
+        markup = f'{markup[:start]}<div id="toc" class="toc"><ul>{entries}</ul></div>{markup[start:]}'
+
+    categories = {}
+    for link in CATEGORY_LINK.findall(markup):
+        href = HREF.search(link)
+        if href is not None and 'Category:' in href.group(1):
+            name = parse.unquote(html.unescape(href.group(1)).split('Category:', 1)[1].split('#')[0]).replace('_', ' ')
+            categories.setdefault(name, None)
+    if categories:
+        items = ''.join(f'<li><a href="/wiki/Category:{parse.quote(name.replace(" ", "_"))}">{html.escape(name)}</a></li>'
+                        for name in categories)
+        catlinks = f'<div id="mw-normal-catlinks" class="mw-normal-catlinks"><ul>{items}</ul></div>'
+        end = markup.rfind('</body>')
+        markup = markup + catlinks if end == -1 else markup[:end] + catlinks + markup[end:]
+    return markup
+
+
+def parse_dump_page(page_html, word, languages=None):
+    """`parse_page` for a dump page, in whichever layout the dump uses."""
+    return parse_page(legacy_layout(page_html), word, languages)
+
+
+class DumpIngestor(object):
+    """
+    Runs the extraction and `Collector.save_word` over a Wiktionary HTML dump, without network access.
+
+    Pages are read lazily from the dump and parsed by a pool of worker processes.
+    At most `max_pending` pages are in flight at once, so memory stays bounded
+    whatever the size of the dump. A page whose extraction raises is counted
+    in `stats['failed']`, its title kept in `failed`, and ingestion goes on.
+    """
+    def __init__(self, collector=None, languages=None, titles=None, workers=None, max_pending=None, parser_kwargs=None, **save_kwargs):
+        self.collector = collector
+        self.languages = languages
+        self.titles = set(titles) if titles is not None else None
+        self.workers = workers if workers else os.cpu_count()
+        self.max_pending = max_pending if max_pending else 4 * self.workers
+        self.parser_kwargs = parser_kwargs if parser_kwargs else {}
+        self.save_kwargs = save_kwargs
+        self.stats = {}
+        self.failed = []
+
+    def pages(self, path):
+        for title, page_html, revision_id in iter_dump_pages(path):
+            self.stats['read'] += 1
+            if self.titles is not None and title not in self.titles:
+                continue
+            if not page_html:
+                self.stats['skipped'] += 1
+                continue
+            yield title, page_html
+
+    def ingest(self, path, verbose=0):
+        self.stats = {"read": 0, "skipped": 0, "parsed": 0, "failed": 0, "records": 0}
+        self.failed = []
+        pending = deque()
+        pbar = tqdm.tqdm(desc="Ingesting dump", disable=verbose <= 0)
+        config = parser_config(WiktionaryParser(**self.parser_kwargs))
+        with ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=(config,)) as pool:
+            for title, page_html in self.pages(path):
+                pending.append((title, pool.submit(parse_dump_page, page_html, title, self.languages)))
+                if len(pending) >= self.max_pending:
+                    self.__save(*pending.popleft(), pbar)
+                while pending and pending[0][1].done():
+                    self.__save(*pending.popleft(), pbar)
+            while pending:
+                self.__save(*pending.popleft(), pbar)
+        pbar.close()
+        return self.stats
+
+    def __save(self, title, future, pbar):
+        pbar.update(1)
+        try:
+            records = future.result()
+        except Exception:
+            self.stats['failed'] += 1
+            self.failed.append(title)
+            return
+        self.stats['parsed'] += 1
+        self.stats['records'] += len(records)
+        if self.collector is not None and records:
+            self.collector.save_word(records, **self.save_kwargs)
@@ -0,0 +1,64 @@
+from bs4 import BeautifulSoup
+
+
+class ParserEngine(object):
+    """
+    Builds the BeautifulSoup tree the extraction logic runs on.
+
+    Engines only differ in how the markup is tokenized; every engine hands
+    back the same kind of tree so `WiktionaryParser` does not care which one
+    produced it.
+    """
+    name = None
+    features = 'html.parser'
+
+    def build(self, markup):
+        return BeautifulSoup(markup, self.features)
+
+
+class HtmlParserEngine(ParserEngine):
+    name = 'html.parser'
+    features = 'html.parser'
+
+
+class LxmlEngine(ParserEngine):
+    name = 'lxml'
+    features = 'lxml'
+
+
+class SelectolaxEngine(ParserEngine):
+    """
+    Tokenizes the page with lexbor and keeps only the article body and the
+    category links, so BeautifulSoup only builds the part that is parsed.
+    """
+    name = 'selectolax'
+    features = 'lxml'
+    kept_selectors = ['#mw-content-text', '#catlinks']
+
+    def build(self, markup):
+        from selectolax.lexbor import LexborHTMLParser
+
+        tree = LexborHTMLParser(markup)
+        kept = []
+        for selector in self.kept_selectors:
+            node = tree.css_first(selector)
+            if node is not None:
+                kept.append(node.html)
+        if not kept:
+            return super().build(markup)
+        return super().build('<html><body>' + ''.join(kept) + '</body></html>')
+
+
+ENGINES = {
+    engine.name: engine for engine in [HtmlParserEngine, LxmlEngine, SelectolaxEngine]
+}
+
+
+def get_engine(engine=None):
+    if engine is None:
+        return HtmlParserEngine()
+    if isinstance(engine, ParserEngine):
+        return engine
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown parser engine '{engine}', expected one of {sorted(ENGINES)}")
+    return ENGINES[engine]()
@@ -0,0 +1,86 @@
+import functools
+import json
+import os
+import re
+
+
+APPENDIX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'appendix.json')
+
+
+class GlossaryMatcher(object):
+    """
+    Strips glossary labels, such as "(transitive)", out of definition text.
+
+    The known labels (from `appendix.json` or the `appendix` table) are
+    compiled up front and kept in `patterns`. Other labels, mostly free-text
+    qualifier spans, go through a process-wide LRU cache of `OTHER_LABELS`
+    patterns, so a long crawl does not keep every one it meets. A label
+    removes "(label)" and "label" wherever they occur.
+
+    The labels of a line are applied one after the other, in the order they
+    appear on the line, rather than through a single alternation. Labels
+    overlap (e.g. "transitive" and "intransitive", or the ", " separators of
+    qualifier spans), and the order decides what is left of the text.
+    """
+    _default = None
+    OTHER_LABELS = 4096
+
+    def __init__(self, labels=()):
+        self.patterns = {}
+        for label in labels:
+            self.add(label)
+
+    @staticmethod
+    def compile(label):
+        return re.compile(f'(\\({label}\\)|{label})'.replace('+', '\\+'))
+
+    def add(self, label):
+        if label not in self.patterns:
+            self.patterns[label] = self.compile(label)
+
+    def pattern(self, label):
+        pattern = self.patterns.get(label)
+        if pattern is None:
+            pattern = compile_other(label)
+        return pattern
+
+    def strip(self, text, labels):
+        for label in labels:
+            text = self.pattern(label).sub('', text).strip()
+        return text
+
+    def __len__(self):
+        return len(self.patterns)
+
+    @staticmethod
+    def compilable(label):
+        try:
+            GlossaryMatcher.compile(label)
+        except re.error:
+            return False
+        return True
+
+    @classmethod
+    def from_labels(cls, labels):
+        return cls([label for label in labels if label and cls.compilable(label)])
+
+    @classmethod
+    def from_json(cls, path=APPENDIX_PATH):
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'r', encoding='utf8') as f:
+            return cls.from_labels(appendix['label'] for appendix in json.load(f))
+
+    @classmethod
+    def default(cls):
+        """The matcher of the labels in `appendix.json`, loaded once per process."""
+        if cls._default is None:
+            cls._default = cls.from_json()
+        return cls._default
+
+    @classmethod
+    def from_database(cls, conn, appendix_table="appendix"):
+        return cls.from_labels(row.get('label') for row in conn.read(collection_name=appendix_table, fields="label"))
+
+
+compile_other = functools.lru_cache(maxsize=GlossaryMatcher.OTHER_LABELS)(GlossaryMatcher.compile)
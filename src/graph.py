@@ -8,6 +8,8 @@ import re
 import os
 from nltk.stem import *
 
+from .utils import hex_id
+
 
 class GraphBuilder:
     def __init__(self, conn, 
@@ -252,6 +254,9 @@ class GraphBuilder:
                 apx['word'] = apx['label']
                 vocab.append(apx)
         
+        # Binary ids are turned into their hex form, so vocab keys and node ids are strings in both id formats.
+        for w in vocab:
+            w['id'] = hex_id(w['id'])
         self.vocab = {w['id']: w for w in vocab}
         return category_rels, appendix_rels
 
@@ -307,6 +312,7 @@ class GraphBuilder:
         self.node_ids = {}
         
         for e in graph_edges:        
+            e['headId'], e['tailId'] = hex_id(e['headId']), hex_id(e['tailId'])
             reltype = e['relationshipType']
             k = (e["headType"], reltype, e["tailType"])
             #If this node type doesn't exist, create an empty list
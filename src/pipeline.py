@@ -0,0 +1,90 @@
+import heapq
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .core import WiktionaryParser
+
+
+_worker_parser = None
+
+
+def parser_config(parser):
+    """Return what a worker process needs to rebuild an equivalent parser."""
+    return parser.config()
+
+
+def init_worker(config):
+    global _worker_parser
+    _worker_parser = WiktionaryParser.from_config(config)
+
+
+def parse_page(html, word, languages=None, include_dialects=True, query=None, url=None):
+    """
+    Extract the records of one page inside a worker process.
+
+    With `languages=None` every language section of the page is extracted.
+    """
+    parser = _worker_parser
+    if languages is None:
+        ctx = parser.load_html(html, word=word, url=url)
+        records = []
+        for language in ctx.sections.languages:
+            records += parser.get_word_data(ctx, language.lower(), include_dialects=False)
+    else:
+        records = parser.parse_html(html, lang=languages, include_dialects=include_dialects, word=word, url=url)
+    return parser.stamp_records(records, word, query)
+
+
+class ParsePipeline(object):
+    """
+    Downloads pages in the main process and parses them in a pool of worker processes.
+
+    Downloaded pages wait in a buffer of at most `queue_depth` pages; when it is
+    full, no new download starts until a worker frees a slot. Among buffered
+    pages the largest is handed to the next free worker, so the slowest pages
+    start early instead of trailing at the end of the run.
+    """
+    def __init__(self, parser=None, workers=None, queue_depth=None, download_threads=None):
+        self.parser = parser if parser is not None else WiktionaryParser()
+        self.workers = workers if workers else os.cpu_count()
+        self.queue_depth = queue_depth if queue_depth else 4 * self.workers
+        self.download_threads = download_threads if download_threads else self.parser.max_concurrency
+
+    def run(self, words, languages=None, include_dialects=True):
+        """
+        Yield (word, records) for every item of `words` as soon as it is parsed.
+        Items of `words` are words or (word, old_id) pairs.
+        """
+        languages = self.parser.get_languages(languages)
+        words = iter(words)
+        sequence = itertools.count()
+        downloading = {}
+        ready = []
+        parsing = {}
+        with ThreadPoolExecutor(self.download_threads) as download_pool, \
+                ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=(parser_config(self.parser),)) as parse_pool:
+            while True:
+                while len(downloading) + len(ready) < self.queue_depth:
+                    item = next(words, None)
+                    if item is None:
+                        break
+                    word, old_id = (item, None) if isinstance(item, str) else item
+                    url = self.parser.url.format(word, self.parser.use_printable)
+                    downloading[download_pool.submit(self.parser.download, url, old_id)] = (word, url)
+
+                while ready and len(parsing) < self.workers:
+                    _, _, word, url, html = heapq.heappop(ready)
+                    future = parse_pool.submit(parse_page, html, word, languages, include_dialects, None, url)
+                    parsing[future] = word
+
+                if not downloading and not parsing:
+                    return
+                done, _ = wait(list(downloading) + list(parsing), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in downloading:
+                        word, url = downloading.pop(future)
+                        html = future.result()
+                        heapq.heappush(ready, (-len(html), next(sequence), word, url, html))
+                    else:
+                        yield parsing.pop(future), future.result()
@@ -0,0 +1,144 @@
+import cProfile
+import heapq
+import io
+import itertools
+import pstats
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+
+NO_PHASE = nullcontext()
+
+
+class PageTiming(object):
+    """The time spent in each phase while one page was fetched and parsed."""
+    __slots__ = ('word', 'url', 'phases', 'total', 'profile')
+
+    def __init__(self, word=None, url=None):
+        self.word = word
+        self.url = url
+        self.phases = {}
+        self.total = 0.0
+        self.profile = None
+
+    def add(self, phase, elapsed):
+        self.phases[phase] = self.phases.get(phase, 0.0) + elapsed
+
+    def to_json(self):
+        return {"word": self.word, "url": self.url, "total": self.total, "phases": dict(self.phases)}
+
+
+class ParseProfiler(object):
+    """
+    Times the phases of `WiktionaryParser` and keeps the slowest pages.
+
+    Phases are `fetch` (HTTP request), `decode` (response body to text),
+    `cache`, `slice`, `build` (tree building), `clean`, `index` (section
+    index), one phase per section handler (`parse_definition`, ...),
+    `parse_categories` and `map_to_object`. `totals` holds the seconds and
+    calls of each phase over the whole run, and `callback(phase, elapsed, page)`
+    is called after every phase.
+
+    A page spans one `grab_from_url` call. Phases run outside a page (e.g. the
+    downloads of `afetch`, which happen on another thread) are counted in
+    `totals` only. With `sample_rate`, that share of the pages also runs
+    under cProfile; their stats are merged into `stats` and kept with the
+    page when it is among the `top_n` slowest.
+    """
+    def __init__(self, top_n=10, sample_rate=0.0, callback=None):
+        self.top_n = top_n
+        self.sample_rate = sample_rate
+        self.callback = callback
+        self.totals = {}
+        self.pages = 0
+        self.stats = None
+        self.__slowest = []
+        self.__sequence = itertools.count()
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+
+    @property
+    def current(self):
+        return getattr(self.__local, 'page', None)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            page = self.current
+            if page is not None:
+                page.add(name, elapsed)
+            with self.__lock:
+                seconds, calls = self.totals.get(name, (0.0, 0))
+                self.totals[name] = (seconds + elapsed, calls + 1)
+            if self.callback is not None:
+                self.callback(name, elapsed, page)
+
+    @contextmanager
+    def page(self, word=None, url=None):
+        if self.current is not None:
+            # Nested calls (e.g. a parse inside a fetch) belong to the outer page.
+            yield self.current
+            return
+        page = self.__local.page = PageTiming(word, url)
+        profile = cProfile.Profile() if self.sample_rate and random.random() < self.sample_rate else None
+        start = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield page
+        finally:
+            if profile is not None:
+                profile.disable()
+            page.total = time.perf_counter() - start
+            self.__local.page = None
+            self.__record(page, profile)
+
+    def __record(self, page, profile):
+        with self.__lock:
+            self.pages += 1
+            if profile is not None:
+                page.profile = profile
+                if self.stats is None:
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+            entry = (page.total, next(self.__sequence), page)
+            if len(self.__slowest) < self.top_n:
+                heapq.heappush(self.__slowest, entry)
+            elif self.__slowest and entry[0] > self.__slowest[0][0]:
+                heapq.heapreplace(self.__slowest, entry)
+
+    def slowest(self):
+        """The `top_n` slowest pages, slowest first."""
+        with self.__lock:
+            return [page for _, _, page in sorted(self.__slowest, key=lambda entry: -entry[0])]
+
+    def report(self, profile_lines=15):
+        lines = [f"{self.pages} pages"]
+        for name, (seconds, calls) in sorted(self.totals.items(), key=lambda item: -item[1][0]):
+            lines.append(f"{name:>24}: {seconds:9.3f} s in {calls} calls")
+        lines.append(f"Slowest {self.top_n} pages:")
+        for page in self.slowest():
+            phases = ', '.join(f"{name} {1000 * seconds:.1f}" for name, seconds in
+                               sorted(page.phases.items(), key=lambda item: -item[1]))
+            lines.append(f"{1000 * page.total:10.1f} ms  {page.word} ({page.url}) - ms: {phases}")
+            if page.profile is not None and profile_lines:
+                out = io.StringIO()
+                pstats.Stats(page.profile, stream=out).sort_stats('cumulative').print_stats(profile_lines)
+                lines.append(out.getvalue())
+        return '\n'.join(lines)
+
+    def dump(self, path=None, profile_lines=15):
+        """Write `report` to `path`, or to stdout."""
+        if path is None:
+            print(self.report(profile_lines=profile_lines), file=sys.stdout)
+            return
+        with open(path, 'w', encoding='utf8') as f:
+            f.write(self.report(profile_lines=profile_lines))
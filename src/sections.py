@@ -0,0 +1,175 @@
+import html
+import re
+
+
+HEADING_TAGS = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']
+
+
+class Section(object):
+    def __init__(self, number, title, id, anchor=None):
+        self.number = number
+        self.title = title
+        self.id = id
+        self.anchor = anchor
+        self._siblings = None
+        self._start = 0
+
+    @property
+    def heading(self):
+        return self.anchor.parent if self.anchor is not None else None
+
+    def siblings(self, stop=None):
+        """Yield the tags following the heading, up to the first tag whose name is in `stop`."""
+        for tag in self._siblings[self._start:]:
+            if stop is not None and tag.name in stop:
+                return
+            yield tag
+
+    @property
+    def nodes(self):
+        return list(self.siblings(HEADING_TAGS))
+
+
+class SectionIndex(object):
+    """
+    Index of the headings of a page, built in a single pass over the soup.
+
+    Sections are reachable by TOC number (`by_number`) or by heading id (`get`),
+    and each one knows the sibling range that follows its heading.
+    """
+    def __init__(self, soup):
+        self.soup = soup
+        self.anchors = {}
+        for span in soup.find_all('span', id=True):
+            self.anchors.setdefault(span['id'], span)
+
+        self.toc = []
+        self.by_number = {}
+        self._by_id = {}
+        self._positions = {}
+        self._children = {}
+        self._previous = {}
+        self._nyms = None
+        for toc_tag in soup.find_all('span', {'class': 'toctext'}):
+            number = toc_tag.find_previous().text
+            section_id = (toc_tag.parent.get('href') or '').replace('#', '')
+            section = Section(number, toc_tag.text, section_id)
+            self._positions[number] = len(self.toc)
+            self.toc.append(section)
+            self.by_number[number] = section
+            self._by_id.setdefault(section_id, section)
+
+    @property
+    def languages(self):
+        return [section.title for section in self.toc if '.' not in section.number]
+
+    def __contains__(self, section_id):
+        return section_id in self.anchors
+
+    def get(self, section_id):
+        section = self._by_id.get(section_id)
+        if section is None:
+            section = Section(None, section_id, section_id)
+            self._by_id[section_id] = section
+        if section._siblings is None:
+            self._attach(section)
+        return section
+
+    def subsections(self, number):
+        """Return the TOC entries nested under `number`, which are contiguous in document order."""
+        prefix = number + '.'
+        position = self._positions.get(number)
+        if position is None:
+            return []
+        result = []
+        for section in self.toc[position + 1:]:
+            if not section.number.startswith(prefix):
+                break
+            result.append(section)
+        return result
+
+    def children(self, parent):
+        """Return the child tags of `parent` and their positions, computed once per parent."""
+        key = id(parent)
+        if key not in self._children:
+            children = parent.find_all(True, recursive=False)
+            self._children[key] = (children, {id(tag): i for i, tag in enumerate(children)})
+        return self._children[key]
+
+    def previous_sibling(self, tag, names):
+        """
+        Return the closest sibling before `tag` whose name is in `names`. When
+        there is none, the first sibling is returned, or `tag` itself if it is
+        the first one, like walking back with `find_previous_sibling` would.
+        """
+        children, positions = self.children(tag.parent)
+        key = (id(tag.parent), tuple(names))
+        if key not in self._previous:
+            previous = []
+            last = None
+            for i, child in enumerate(children):
+                previous.append(last if last is not None else (0 if i else None))
+                if child.name in names:
+                    last = i
+            self._previous[key] = previous
+        position = self._previous[key][positions[id(tag)]]
+        return tag if position is None else children[position]
+
+    def nyms(self, block):
+        """Return the `.nyms` elements inside `block`, looked up in a map of the page built on first use."""
+        if self._nyms is None:
+            self._nyms = {}
+            for nym in self.soup.find_all(class_='nyms'):
+                for parent in nym.parents:
+                    self._nyms.setdefault(id(parent), []).append(nym)
+        return self._nyms.get(id(block), [])
+
+    def _attach(self, section):
+        section.anchor = self.anchors.get(section.id)
+        heading = section.heading
+        if heading is None or heading.parent is None:
+            section._siblings = []
+            return
+        children, positions = self.children(heading.parent)
+        section._siblings = children
+        section._start = positions[id(heading)] + 1
+
+
+H2_TAG = re.compile(r'<h2\b[^>]*>')
+LANGUAGE_HEADLINE = re.compile(r'<h2\b[^>]*>\s*<span class="mw-headline"[^>]*>(.*?)</span>', re.S)
+MARKUP = re.compile(r'<[^>]+>')
+
+
+def slice_languages(markup, languages, include_dialects=True):
+    """
+    Cut the sections of `languages` out of a rendered page, before any tree is built.
+
+    The slice keeps everything up to the first language heading (head, table of
+    contents), the requested language sections, and everything after the article
+    body (category links), so it parses like the full page restricted to those
+    languages. Returns None when the page is not laid out as expected, in which
+    case the full page should be parsed.
+    """
+    languages = [language.lower() for language in languages]
+    body_end = markup.find('<div class="printfooter"')
+    if body_end == -1:
+        return None
+    body_end = markup.rfind('</div>', 0, body_end)
+    headings = [match.start() for match in H2_TAG.finditer(markup, 0, body_end)]
+    starts = []
+    for i, start in enumerate(headings):
+        match = LANGUAGE_HEADLINE.match(markup, start)
+        if match is None:
+            continue
+        title = html.unescape(MARKUP.sub('', match.group(1))).strip().lower()
+        starts.append((start, headings[i + 1] if i + 1 < len(headings) else body_end, title))
+    if not starts:
+        return None
+    kept = [markup[:starts[0][0]]]
+    for start, end, title in starts:
+        if any(language == title or (include_dialects and language in title) for language in languages):
+            kept.append(markup[start:end])
+    if len(kept) == 1:
+        return None
+    kept.append(markup[body_end:])
+    return ''.join(kept)
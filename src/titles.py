@@ -0,0 +1,180 @@
+import gzip
+import hashlib
+import math
+import mmap
+import re
+import struct
+from urllib import parse
+
+from .preprocessing import Normalizer
+
+
+ARABIC_SCRIPT = re.compile(r'[\u0600-\u06FF]')
+
+
+class BloomFilter(object):
+    """
+    Fixed-size Bloom filter over strings.
+
+    Lookups never give false negatives; false positives happen at roughly
+    `error_rate` and only cost the request the filter would have saved.
+    """
+    header = struct.Struct('<8sQQQ')
+    magic = b'WKTBLOOM'
+
+    def __init__(self, capacity, error_rate=0.01, bits=None, num_hashes=None, size=None):
+        capacity = max(int(capacity), 1)
+        self.size = size if size else max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.num_hashes = num_hashes if num_hashes else max(1, int(round(self.size / capacity * math.log(2))))
+        self.capacity = capacity
+        self.bits = bits if bits is not None else bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.num_hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.header.pack(self.magic, self.size, self.num_hashes, self.capacity))
+            f.write(self.bits)
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map a filter written by `save`, so its bits are paged in from disk on demand."""
+        with open(path, 'rb') as f:
+            magic, size, num_hashes, capacity = cls.header.unpack(f.read(cls.header.size))
+            if magic != cls.magic:
+                raise ValueError(f"{path} is not a saved Bloom filter")
+            bits = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        bits = memoryview(bits)[cls.header.size:]
+        return cls(capacity, bits=bits, num_hashes=num_hashes, size=size)
+
+
+class TitleIndex(object):
+    """
+    Tells whether a Wiktionary page exists before any request is made.
+
+    Built from the `all-titles-in-ns0` dump file (one title per line, spaces
+    written as underscores). `stats` counts how many lookups were made and how
+    many requests were avoided because the title does not exist.
+    """
+    def __init__(self, bloom):
+        self.bloom = bloom
+        self.stats = {"checked": 0, "pruned": 0}
+
+    @staticmethod
+    def normalize(title):
+        return title.strip().replace(' ', '_')
+
+    @staticmethod
+    def read_titles(path):
+        opener = gzip.open if str(path).endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for i, line in enumerate(f):
+                title = line.rstrip('\n')
+                if title and not (i == 0 and title == 'page_title'):
+                    yield title
+
+    @classmethod
+    def from_titles(cls, titles, error_rate=0.01):
+        titles = [cls.normalize(t) for t in titles]
+        bloom = BloomFilter(len(titles), error_rate=error_rate)
+        for title in titles:
+            bloom.add(title)
+        return cls(bloom)
+
+    @classmethod
+    def from_titles_file(cls, path, error_rate=0.01):
+        capacity = sum(1 for _ in cls.read_titles(path))
+        bloom = BloomFilter(capacity, error_rate=error_rate)
+        for title in cls.read_titles(path):
+            bloom.add(cls.normalize(title))
+        return cls(bloom)
+
+    @classmethod
+    def load(cls, path):
+        return cls(BloomFilter.load(path))
+
+    def save(self, path):
+        self.bloom.save(path)
+
+    def __contains__(self, title):
+        return self.normalize(title) in self.bloom
+
+    def exists(self, title):
+        self.stats['checked'] += 1
+        if title in self:
+            return True
+        self.stats['pruned'] += 1
+        return False
+
+    def filter(self, titles):
+        return [title for title in titles if self.exists(title)]
+
+
+class VariantIndex(object):
+    """
+    Maps a normalized form to the titles that actually exist under it.
+
+    Titles are keyed with `Normalizer` semantics (by default every alef form
+    folds to a bare alef), so all the hamza/alef spellings of a word resolve
+    in a single dictionary lookup instead of being enumerated and fetched.
+
+    `complete` tells whether the index holds every title of the wiki (a
+    title dump). Only then does a missing title mean the page does not exist.
+    """
+    def __init__(self, normalizer=None, complete=False):
+        self.normalizer = normalizer if normalizer is not None else Normalizer(alef_norm='ا')
+        self.complete = complete
+        self.forms = {}
+
+    def key(self, title):
+        return self.normalizer(TitleIndex.normalize(title))
+
+    def add(self, title):
+        title = TitleIndex.normalize(title)
+        self.forms.setdefault(self.key(title), set()).add(title)
+
+    def lookup(self, word):
+        return sorted(self.forms.get(self.key(word), ()))
+
+    def exists(self, word):
+        return TitleIndex.normalize(word) in self.forms.get(self.key(word), ())
+
+    def __len__(self):
+        return len(self.forms)
+
+    @classmethod
+    def from_titles(cls, titles, normalizer=None, pattern=None, complete=False):
+        index = cls(normalizer=normalizer, complete=complete)
+        for title in titles:
+            if pattern is None or pattern.search(title):
+                index.add(title)
+        return index
+
+    @classmethod
+    def from_titles_file(cls, path, normalizer=None, pattern=ARABIC_SCRIPT):
+        return cls.from_titles(TitleIndex.read_titles(path), normalizer=normalizer, pattern=pattern, complete=True)
+
+    @classmethod
+    def from_database(cls, conn, word_table="words", normalizer=None, pattern=None):
+        """
+        Index the pages already collected in `word_table`, using their wikiUrl
+        as the title. The index is not complete: words missing from it are still fetched.
+        """
+        titles = []
+        for row in conn.read(collection_name=word_table, fields="wikiUrl"):
+            wiki_url = row.get('wikiUrl')
+            if wiki_url and wiki_url.startswith('/wiki/'):
+                titles.append(parse.unquote(wiki_url[len('/wiki/'):].split('#')[0]))
+        return cls.from_titles(titles, normalizer=normalizer, pattern=pattern)
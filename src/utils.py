@@ -1,17 +1,52 @@
+import functools
+import hashlib
 import itertools
 import json
+import sys
 from pathlib import Path
 import langcodes
 
 from matplotlib import pyplot as plt
 import numpy as np
+def intern_label(label):
+    """Intern the small, endlessly repeated labels (POS, relation type, language) so records share one copy."""
+    return sys.intern(label) if isinstance(label, str) else label
+
+
+_dumps = json.JSONEncoder(ensure_ascii=False).encode
+
+
+@functools.lru_cache(maxsize=1 << 17)
+def hash_id(text, binary=False):
+    """
+    SHA-256 id of `text`: the 32-byte digest with `binary`, else its 64 hex digits.
+    Memoized, since the same words, categories and labels are hashed again and again.
+    """
+    digest = hashlib.sha256(text.encode())
+    return digest.digest() if binary else digest.hexdigest()
+
+
+def hex_id(id_):
+    """The 64 hex digits of an id, whether it is binary or already hex."""
+    return id_.hex() if isinstance(id_, bytes) else id_
+
+
 class WordData(object):
+    __slots__ = ['etymology', '_definition_list', 'pronunciations', 'audio_links',
+                 'categories', 'language', 'word', 'query']
+    # Filled in after extraction, and only serialized once set.
+    stamps = ['categories', 'language', 'query', 'word']
+
     def __init__(self, etymology=None, definitions=None, pronunciations=None,
                  audio_links=None):
         self.etymology = etymology if etymology else ''
         self.definition_list = definitions
         self.pronunciations = pronunciations if pronunciations else []
         self.audio_links = audio_links if audio_links else []
+        self.categories = None
+        self.language = None
+        self.word = None
+        self.query = None
 
     @property
     def definition_list(self):
@@ -30,8 +65,12 @@ class WordData(object):
                     raise TypeError('Invalid type for definition')
             self._definition_list = definitions
 
+    def stamp(self, **stamps):
+        for k, v in stamps.items():
+            setattr(self, k, intern_label(v) if k == 'language' else v)
+
     def to_json(self):
-        return {
+        res = {
             'etymology': self.etymology,
             'definitions': [definition.to_json() for definition in self._definition_list],
             'pronunciations': {
@@ -39,11 +78,39 @@ class WordData(object):
                 'audio': self.audio_links
             }
         }
+        for k in self.stamps:
+            v = getattr(self, k)
+            if v is not None:
+                res[k] = v
+        return res
+
+    def write_json(self, write):
+        """Write the JSON of `to_json` piece by piece, without building it as a dict first."""
+        write('{"etymology": ')
+        write(_dumps(self.etymology))
+        write(', "definitions": [')
+        for i, definition in enumerate(self._definition_list):
+            if i:
+                write(', ')
+            definition.write_json(write)
+        write('], "pronunciations": {"text": ')
+        write(_dumps(self.pronunciations))
+        write(', "audio": ')
+        write(_dumps(self.audio_links))
+        write('}')
+        for k in self.stamps:
+            v = getattr(self, k)
+            if v is not None:
+                write(f', "{k}": ')
+                write(_dumps(v))
+        write('}')
 
 
 class Definition(object):
+    __slots__ = ['part_of_speech', 'text', '_related_words', 'example_uses']
+
     def __init__(self, part_of_speech = None, text = None, related_words = None, example_uses = None):
-        self.part_of_speech = part_of_speech if part_of_speech else ''
+        self.part_of_speech = intern_label(part_of_speech) if part_of_speech else ''
         self.text = text if text else ''
         self.related_words = related_words if related_words else []
         self.example_uses = example_uses if example_uses else []
@@ -73,10 +140,26 @@ class Definition(object):
             'examples': self.example_uses 
         }
 
+    def write_json(self, write):
+        write('{"partOfSpeech": ')
+        write(_dumps(self.part_of_speech))
+        write(', "text": ')
+        write(_dumps(self.text))
+        write(', "relatedWords": [')
+        for i, related_word in enumerate(self._related_words):
+            if i:
+                write(', ')
+            related_word.write_json(write)
+        write('], "examples": ')
+        write(_dumps(self.example_uses))
+        write('}')
+
 
 class RelatedWord(object):
+    __slots__ = ['relationship_type', 'words']
+
     def __init__(self, relationship_type=None, words=None):
-        self.relationship_type = relationship_type if relationship_type else ''
+        self.relationship_type = intern_label(relationship_type) if relationship_type else ''
         self.words = words if words else []
 
     def to_json(self):
@@ -84,10 +167,36 @@ class RelatedWord(object):
             'relationshipType': self.relationship_type,
             'words': self.words
         }
+
+    def write_json(self, write):
+        write('{"relationshipType": ')
+        write(_dumps(self.relationship_type))
+        write(', "words": ')
+        write(_dumps(self.words))
+        write('}')
     
 
+def write_ndjson(records, f):
+    """
+    Write one JSON document per line for each record, as records come.
+
+    `WordData` records are serialized straight from their attributes; plain
+    dicts (e.g. records already converted with `to_json`) are dumped as they are.
+    Returns the number of records written.
+    """
+    count = 0
+    for record in records:
+        if isinstance(record, WordData):
+            record.write_json(f.write)
+        else:
+            f.write(_dumps(record))
+        f.write('\n')
+        count += 1
+    return count
+
+
 def flatten_dict(dictionary):
-    dictionary = {k: v if hasattr(v, '__iter__') and type(v) != str else [v] for k, v in dictionary.items()}
+    dictionary = {k: v if hasattr(v, '__iter__') and not isinstance(v, (str, bytes)) else [v] for k, v in dictionary.items()}
     keys, values = zip(*dictionary.items())
     dictionary = [dict(zip(keys, v)) for v in itertools.product(*values)]
     return dictionary
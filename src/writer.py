@@ -0,0 +1,109 @@
+import queue
+import threading
+import time
+from collections import deque
+
+
+class BackgroundWriter(object):
+    """
+    Writes batches of rows on one thread, so crawling goes on while the
+    database works.
+
+    `write(rows)` is called on the writer thread for every submitted batch,
+    in order. At most `max_queue` batches wait to be written; `submit` blocks
+    when the queue is full, so a slow database slows the crawl down instead
+    of letting memory grow.
+
+    If a write fails, the writer stops writing: the failed batch and every
+    batch after it, including those `submit` refuses, are kept in
+    `unwritten`, and the error is raised by every later `submit` and by `close`.
+    """
+    def __init__(self, write, max_queue=4, name="collector-writer"):
+        self.write = write
+        self.queue = queue.Queue(max_queue)
+        self.error = None
+        self.unwritten = []
+        self.stats = {"batches": 0, "rows": 0, "write_seconds": 0.0, "blocked_seconds": 0.0}
+        self.__pending = deque()
+        self.__lock = threading.Lock()
+        self.__closed = False
+        self.__thread = threading.Thread(target=self.__run, name=name, daemon=True)
+        self.__thread.start()
+
+    @property
+    def depth(self):
+        """Batches waiting to be written, not counting the one being written."""
+        return self.queue.qsize()
+
+    @property
+    def lag(self):
+        """Seconds since the oldest batch that is not written yet was submitted."""
+        with self.__lock:
+            return time.monotonic() - self.__pending[0] if self.__pending else 0.0
+
+    def submit(self, rows):
+        if self.error is not None:
+            self.__refuse(rows)
+        if self.__closed:
+            raise RuntimeError("The writer is closed")
+        with self.__lock:
+            self.__pending.append(time.monotonic())
+        start = time.perf_counter()
+        while True:
+            try:
+                self.queue.put(rows, timeout=.1)
+                break
+            except queue.Full:
+                # Wake up now and then, in case the writer stopped on an error.
+                if self.error is not None:
+                    with self.__lock:
+                        self.__pending.pop()
+                    self.__refuse(rows)
+        self.stats['blocked_seconds'] += time.perf_counter() - start
+
+    def wait(self):
+        """Block until every submitted batch is written."""
+        self.queue.join()
+        self.__raise_error()
+
+    def close(self):
+        """Write every queued batch and stop the thread."""
+        if not self.__closed:
+            self.__closed = True
+            self.queue.put(None)
+            self.__thread.join()
+        self.__raise_error()
+
+    def __refuse(self, rows):
+        with self.__lock:
+            self.unwritten.append(rows)
+        self.__raise_error()
+
+    def __raise_error(self):
+        if self.error is not None:
+            raise RuntimeError(f"Writing to the database failed, {len(self.unwritten)} batches were not written") from self.error
+
+    def __run(self):
+        while True:
+            rows = self.queue.get()
+            if rows is None:
+                self.queue.task_done()
+                return
+            start = time.perf_counter()
+            try:
+                if self.error is None:
+                    self.write(rows)
+                    self.stats['batches'] += 1
+                    self.stats['rows'] += sum(len(table) for table in rows.values())
+                    self.stats['write_seconds'] += time.perf_counter() - start
+                else:
+                    with self.__lock:
+                        self.unwritten.append(rows)
+            except Exception as e:
+                with self.__lock:
+                    self.unwritten.append(rows)
+                self.error = e
+            finally:
+                with self.__lock:
+                    self.__pending.popleft()
+                self.queue.task_done()
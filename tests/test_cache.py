@@ -0,0 +1,63 @@
+import os
+import tempfile
+import time
+import unittest
+import zlib
+
+from wiktionaryparser.cache import PageCache
+
+
+class TestPageCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'pages.sqlite')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_hit_and_miss_counters(self):
+        cache = PageCache(self.path)
+        self.assertIsNone(cache.get('house', printable='yes'))
+        cache.put('house', '<html>house</html>', printable='yes')
+        self.assertEqual(cache.get('house', printable='yes'), '<html>house</html>')
+        self.assertIsNone(cache.get('house'))
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertEqual(cache.stats['misses'], 2)
+        self.assertEqual(cache.stats['bytes_read'], cache.stored_bytes)
+        cache.close()
+
+    def test_ttl_does_not_expire_pinned_revisions(self):
+        cache = PageCache(self.path, ttl=0)
+        cache.put('house', 'latest')
+        cache.put('house', 'pinned', old_id=50356446)
+        time.sleep(0.01)
+        self.assertIsNone(cache.get('house'))
+        self.assertEqual(cache.get('house', old_id=50356446), 'pinned')
+        self.assertEqual(cache.stats['expired'], 1)
+        cache.close()
+
+    def test_lru_eviction_keeps_size_under_cap(self):
+        page_size = len(zlib.compress(b'x' * 100, 0))
+        cache = PageCache(self.path, max_bytes=2 * page_size, compression_level=0)
+        for title in ['a', 'b']:
+            cache.put(title, 'x' * 100)
+            time.sleep(0.01)
+        cache.get('a')
+        time.sleep(0.01)
+        cache.put('c', 'x' * 100)
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertLessEqual(cache.stored_bytes, cache.max_bytes)
+        self.assertEqual(cache.stats['evictions'], 1)
+        cache.close()
+
+    def test_counters_survive_reopening(self):
+        cache = PageCache(self.path)
+        cache.put('house', 'x' * 100)
+        stored_bytes = cache.stored_bytes
+        cache.close()
+        self.assertEqual(PageCache(self.path).stored_bytes, stored_bytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
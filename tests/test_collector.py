@@ -0,0 +1,249 @@
+import json
+import os
+import threading
+import unittest
+
+import mock
+
+from wiktionaryparser import WiktionaryParser
+from wiktionaryparser.collector import Collector, BatchBuffer
+from wiktionaryparser.utils import hash_id, hex_id
+from wiktionaryparser.writer import BackgroundWriter
+
+
+tests_dir = os.path.dirname(__file__)
+html_test_files_dir = os.path.join(tests_dir, 'html_test_files')
+
+
+def parse_test_file(word, old_id, language='english'):
+    with open(os.path.join(html_test_files_dir, f'{word}-{old_id}.html'), 'r', encoding='utf-8') as f:
+        html = f.read()
+    parser = WiktionaryParser()
+    return parser.stamp_records(parser.parse_html(html, lang=language, word=word), word)
+
+
+class TestSaveWord(unittest.TestCase):
+    def test_records_save_like_dicts(self):
+        html_path = os.path.join(html_test_files_dir, 'house-50356446.html')
+        with open(html_path, 'r', encoding='utf-8') as f:
+            html = f.read()
+        parser = WiktionaryParser()
+        records = parser.stamp_records(parser.parse_html(html, lang='english', word='house', as_records=True), 'house')
+        serialized = json.dumps([record.to_json() for record in records])
+        collector = Collector(None)
+        self.assertEqual(collector.save_word(records), collector.save_word(parse_test_file('house', 50356446)))
+        # The records are read, not modified.
+        self.assertEqual(json.dumps([record.to_json() for record in records]), serialized)
+
+
+class TestBatchBuffer(unittest.TestCase):
+    def test_duplicate_keys_are_dropped(self):
+        buffer = BatchBuffer()
+        buffer.add({"words": [{"id": "a", "word": "x"}], "related_words": [{"wordId": "a"}]})
+        buffer.add({"words": [{"id": "a", "word": "y"}, {"id": "b"}], "related_words": [{"wordId": "a"}]})
+        self.assertEqual(len(buffer), 2)
+        self.assertEqual(buffer.tables['words'].duplicates, 1)
+        rows = buffer.drain()
+        self.assertEqual(rows['words'], [{"id": "a", "word": "x"}, {"id": "b"}])
+        self.assertEqual(len(rows['related_words']), 2)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(buffer.drain(), {})
+
+    def test_row_and_byte_budgets(self):
+        buffer = BatchBuffer(max_rows=3)
+        buffer.add({"examples": [{"text": "a"}, {"text": "b"}]})
+        self.assertFalse(buffer.full())
+        buffer.add({"examples": [{"text": "c"}]})
+        self.assertTrue(buffer.full())
+
+        buffer = BatchBuffer(max_bytes=10)
+        buffer.add({"examples": [{"text": "12345"}]})
+        self.assertFalse(buffer.full())
+        buffer.add({"examples": [{"text": "67890"}]})
+        self.assertTrue(buffer.full())
+
+
+class TestCollectorFlush(unittest.TestCase):
+    def setUp(self):
+        self.records = parse_test_file('house', 50356446)
+
+    def test_flush_after_words(self):
+        conn = mock.MagicMock()
+        collector = Collector(conn, auto_flush_after=2)
+        collector.save_word(parse_test_file('house', 50356446), save_to_db=True)
+        conn.insert.assert_not_called()
+        collector.save_word(parse_test_file('house', 50356446), save_to_db=True)
+        # words, then orphan nodes, are upserted into the words table.
+        words, orph_nodes = [call.args[1] for call in conn.upsert.call_args_list if call.args[0] == 'words']
+        # The second save of the same page only repeats keys that are already buffered.
+        result = collector.save_word(parse_test_file('house', 50356446))
+        word_ids = {word['id'] for word in result['words']}
+        self.assertEqual(len(words), len(word_ids))
+        self.assertEqual(len(orph_nodes), len({node['id'] for node in result['orph_nodes']} - word_ids))
+        self.assertEqual(len(collector.batch), 0)
+
+    def test_words_are_written_once(self):
+        conn = mock.MagicMock()
+        collector = Collector(conn, auto_flush_after=1)
+        collector.save_word(self.records, save_to_db=True)
+        conn.update.assert_not_called()
+        self.assertNotIn('words', [call.args[0] for call in conn.insert.call_args_list if call.args[1]])
+        merges = {call.kwargs['merge']['etymology'] if 'etymology' in call.kwargs['merge'] else 'replace'
+                  for call in conn.upsert.call_args_list}
+        self.assertEqual(merges, {'replace', 'fill'})
+        self.assertTrue(all(node['isDerived'] == 1 for node in conn.upsert.call_args_list[1].args[1]))
+
+    def test_update_then_insert(self):
+        conn = mock.MagicMock()
+        collector = Collector(conn, auto_flush_after=1, upsert=False)
+        collector.save_word(self.records, save_to_db=True)
+        conn.upsert.assert_not_called()
+        self.assertEqual(conn.update.call_count, 2)
+
+    def test_flush_on_row_budget(self):
+        conn = mock.MagicMock()
+        collector = Collector(conn, auto_flush_after=100, max_rows=1)
+        collector.save_word(self.records, save_to_db=True)
+        self.assertTrue(conn.insert.called)
+        self.assertEqual(len(collector.batch), 0)
+        self.assertIsNone(collector.flush())
+
+    def test_bulk_mode(self):
+        conn = mock.MagicMock()
+        conn.validate_constraints.return_value = {"definitions.fk_wordId": 2}
+        collector = Collector(conn, auto_flush_after=1)
+        with collector.bulk_mode():
+            collector.save_word(self.records, save_to_db=True)
+        conn.upsert.assert_not_called()
+        conn.insert.assert_not_called()
+        loaded = [call.args[0] for call in conn.bulk_load.call_args_list]
+        self.assertEqual(loaded[:3], ['words', 'words', 'definitions'])
+        self.assertEqual(conn.bulk_load.call_args_list[0].kwargs['merge'], Collector.WORD_MERGE)
+        self.assertTrue(conn.checks_disabled.called)
+        self.assertEqual(collector.bulk_report, {"definitions.fk_wordId": 2})
+        self.assertFalse(collector.bulk)
+
+
+class TestBinaryIds(unittest.TestCase):
+    def test_binary_ids_match_hex_ids(self):
+        hex_rows = Collector(None).save_word(parse_test_file('house', 50356446), save_to_db=False)
+        binary_rows = Collector(None, binary_ids=True).save_word(parse_test_file('house', 50356446), save_to_db=False)
+        self.assertEqual({table: len(rows) for table, rows in binary_rows.items()},
+                         {table: len(rows) for table, rows in hex_rows.items()})
+        for table in ['words', 'definitions', 'orph_nodes', 'related_words']:
+            for binary_row, hex_row in zip(binary_rows[table], hex_rows[table]):
+                self.assertEqual(len(binary_row['id' if 'id' in binary_row else 'wordId']), 32)
+                self.assertEqual({k: hex_id(v) for k, v in binary_row.items()}, hex_row)
+
+    def test_hashing_is_cached(self):
+        hash_id.cache_clear()
+        self.assertEqual(hash_id("house"), hash_id("house", True).hex())
+        hash_id("house")
+        self.assertEqual(hash_id.cache_info().hits, 1)
+
+    def test_migrate_ids(self):
+        conn = mock.MagicMock()
+        conn.db = "knowledge_graph"
+        columns = [
+            {"TABLE_NAME": "words", "COLUMN_NAME": "id", "IS_NULLABLE": "NO", "COLUMN_KEY": "PRI",
+             "DATA_TYPE": "varchar", "CHARACTER_MAXIMUM_LENGTH": 64},
+            {"TABLE_NAME": "definitions", "COLUMN_NAME": "wordId", "IS_NULLABLE": "YES", "COLUMN_KEY": "MUL",
+             "DATA_TYPE": "varchar", "CHARACTER_MAXIMUM_LENGTH": 64},
+            {"TABLE_NAME": "examples", "COLUMN_NAME": "id", "IS_NULLABLE": "NO", "COLUMN_KEY": "PRI",
+             "DATA_TYPE": "int", "CHARACTER_MAXIMUM_LENGTH": None},
+        ]
+        foreign_keys = [{"CONSTRAINT_NAME": "fk_wordId", "TABLE_NAME": "definitions", "COLUMN_NAME": "wordId",
+                         "REFERENCED_TABLE_NAME": "words", "REFERENCED_COLUMN_NAME": "id",
+                         "UPDATE_RULE": "CASCADE", "DELETE_RULE": "CASCADE"}]
+        conn.execute.side_effect = lambda query: (columns if "INFORMATION_SCHEMA.COLUMNS" in query else
+                                                  foreign_keys if "KEY_COLUMN_USAGE" in query else
+                                                  [{"n": 0}] if "REGEXP" in query else [])
+        collector = Collector(conn)
+        self.assertEqual(collector.migrate_ids(), ["words.id", "definitions.wordId"])
+        queries = [call.args[0] for call in conn.execute.call_args_list]
+        self.assertIn("ALTER TABLE definitions DROP FOREIGN KEY fk_wordId", queries)
+        self.assertIn("UPDATE words SET id = UNHEX(id) WHERE id IS NOT NULL", queries)
+        self.assertIn("ALTER TABLE words DROP PRIMARY KEY, MODIFY id BINARY(32) NOT NULL, ADD PRIMARY KEY (id)", queries)
+        self.assertIn("ALTER TABLE definitions MODIFY wordId BINARY(32) NULL", queries)
+        self.assertTrue(queries[-1].startswith("ALTER TABLE definitions ADD CONSTRAINT fk_wordId FOREIGN KEY (wordId)"))
+        self.assertTrue(collector.binary_ids)
+
+        conn.execute.side_effect = lambda query: columns if "INFORMATION_SCHEMA.COLUMNS" in query else [{"n": 2}]
+        with self.assertRaises(ValueError):
+            Collector(conn).migrate_ids()
+
+
+class TestBackgroundWriter(unittest.TestCase):
+    def test_collector_writes_on_its_own_connection(self):
+        conn, writer_conn = mock.MagicMock(), mock.MagicMock()
+        collector = Collector(conn, auto_flush_after=1)
+        writer = collector.start_writer(connect=lambda: writer_conn)
+        collector.save_word(parse_test_file('house', 50356446), save_to_db=True)
+        collector.save_word(parse_test_file('test', 50342756), save_to_db=True)
+        collector.close()
+        conn.insert.assert_not_called()
+        self.assertTrue(writer_conn.insert.called)
+        self.assertEqual(writer.stats['batches'], 2)
+        self.assertEqual((writer.depth, writer.lag), (0, 0.0))
+        self.assertIsNone(collector.writer)
+
+    def test_submit_blocks_when_the_queue_is_full(self):
+        release = threading.Event()
+        written = []
+        writer = BackgroundWriter(lambda rows: (release.wait(), written.append(rows)), max_queue=1)
+        writer.submit({"words": [1]})
+        writer.submit({"words": [2]})
+        blocked = threading.Thread(target=writer.submit, args=({"words": [3]},))
+        blocked.start()
+        blocked.join(.3)
+        self.assertTrue(blocked.is_alive())
+        self.assertGreater(writer.lag, 0)
+        release.set()
+        blocked.join()
+        writer.wait()
+        self.assertEqual(writer.depth, 0)
+        writer.close()
+        self.assertEqual(written, [{"words": [1]}, {"words": [2]}, {"words": [3]}])
+        self.assertEqual(writer.stats['rows'], 3)
+
+    def test_error_stops_the_writer(self):
+        def write(rows):
+            if rows['words'] == [2]:
+                raise ValueError('lost connection')
+        writer = BackgroundWriter(write, max_queue=4)
+        for i in range(1, 5):
+            try:
+                writer.submit({"words": [i]})
+            except RuntimeError:
+                pass
+        with self.assertRaises(RuntimeError):
+            writer.close()
+        self.assertEqual(writer.stats['batches'], 1)
+        # Batches submitted after the failure are kept too, whether or not submit raised for them.
+        self.assertEqual(writer.unwritten[0], {"words": [2]})
+        self.assertCountEqual(writer.unwritten, [{"words": [2]}, {"words": [3]}, {"words": [4]}])
+        self.assertIsInstance(writer.error, ValueError)
+
+    def test_flush_after_a_failed_write_keeps_the_rows(self):
+        collector = Collector(mock.MagicMock(), auto_flush_after=100)
+        failed = threading.Event()
+
+        def write(res):
+            failed.set()
+            raise ValueError('lost connection')
+        collector.writer = writer = BackgroundWriter(write)
+        collector.batch.add({"words": [{"id": "a"}]})
+        collector.flush()
+        failed.wait()
+        writer.queue.join()
+        collector.batch.add({"words": [{"id": "b"}]})
+        with self.assertRaises(RuntimeError):
+            collector.flush()
+        self.assertEqual(writer.unwritten, [{"words": [{"id": "a"}]}, {"words": [{"id": "b"}]}])
+        with self.assertRaises(RuntimeError):
+            collector.close()
+        self.assertIsNone(collector.writer)
+
+
+if __name__ == '__main__':
+    unittest.main()
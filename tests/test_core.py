@@ -1,7 +1,18 @@
 from parameterized import parameterized
+import asyncio
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+import io
 import json
-from wiktionaryparser import WiktionaryParser
+import pickle
+from wiktionaryparser import WiktionaryParser, PARTS_OF_SPEECH
+from wiktionaryparser.sections import SectionIndex, slice_languages
+from wiktionaryparser import pipeline
+from wiktionaryparser.glossary import GlossaryMatcher
+from wiktionaryparser.pipeline import ParsePipeline, init_worker, parser_config
+from wiktionaryparser.profiling import ParseProfiler
+from wiktionaryparser.utils import WordData, write_ndjson
+from bs4 import BeautifulSoup
 from deepdiff import DeepDiff
 from typing import Dict, List
 import mock
@@ -104,5 +115,313 @@ class TestParser(unittest.TestCase):
         self.assertEqual(diff, {})
 
 
+class TestParserEngines(unittest.TestCase):
+    @parameterized.expand([('lxml',), ('selectolax',)])
+    @mock.patch("requests.Session.get", side_effect=mocked_requests_get)
+    def test_engine_output_matches_html_parser(self, engine: str, mock_get):
+        reference = WiktionaryParser()
+        candidate = WiktionaryParser(engine=engine)
+        for lang, word, old_id in get_test_words_table():
+            reference.set_default_language(lang)
+            candidate.set_default_language(lang)
+            self.assertEqual(candidate.fetch(word, old_id=old_id),
+                             reference.fetch(word, old_id=old_id))
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            WiktionaryParser(engine='regex')
+
+
+class TestMultiLanguageFetch(unittest.TestCase):
+    @parameterized.expand([
+        ('house', 50356446, ['English', 'Swedish']),
+        ('by', 50399022, ['Norwegian', 'Norwegian Bokmål']),
+    ])
+    @mock.patch("requests.Session.get", side_effect=mocked_requests_get)
+    def test_page_is_fetched_once(self, word: str, old_id: int, languages: List[str], mock_get):
+        expected = []
+        for language in languages:
+            expected += WiktionaryParser().fetch(word, language=language, old_id=old_id)
+        mock_get.reset_mock()
+
+        fetched = WiktionaryParser().fetch(word, language=languages, old_id=old_id)
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(fetched, expected)
+
+
+class TestFetchMany(unittest.TestCase):
+    @mock.patch("requests.Session.get", side_effect=mocked_requests_get)
+    def test_fetch_many_matches_fetch(self, mock_get):
+        words = [(word, old_id) for word, old_id, languages in test_words if 'English' in languages]
+        async_parser = WiktionaryParser(max_concurrency=3)
+
+        async def collect():
+            return {word: records async for word, records in async_parser.fetch_many(words, languages='English')}
+
+        fetched = asyncio.run(collect())
+        async_parser.close()
+        for word, old_id in words:
+            self.assertEqual(fetched[word], WiktionaryParser().fetch(word, language='English', old_id=old_id))
+
+
+class TestIterFetch(unittest.TestCase):
+    @mock.patch("requests.Session.get", side_effect=mocked_requests_get)
+    def test_iter_fetch_is_lazy(self, mock_get):
+        words = [(word, old_id) for word, old_id, languages in test_words if 'English' in languages]
+        fetched = WiktionaryParser().iter_fetch(words, language='English')
+        self.assertEqual(mock_get.call_count, 0)
+        word, records = next(fetched)
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(word, words[0][0])
+        self.assertEqual(records, WiktionaryParser().fetch(word, language='English', old_id=words[0][1]))
+
+    @mock.patch("requests.Session.get", side_effect=lambda url, params: mocked_requests_get(url, params={'oldid': 50356446}))
+    def test_iter_deorphanize_matches_deorphanize(self, mock_get):
+        orphans = [{"wikiUrl": "/wiki/house", "language": "english", "word": "house"}]
+        fetched = list(WiktionaryParser().iter_deorphanize(orphans, query='house'))
+        self.assertEqual(len(fetched), 1)
+        self.assertIs(fetched[0][0], orphans[0])
+        self.assertEqual(fetched[0][1], WiktionaryParser().deorphanize(**orphans[0], query='house'))
+
+
+class TestParsePipeline(unittest.TestCase):
+    @mock.patch("requests.Session.get", side_effect=mocked_requests_get)
+    def test_pipeline_matches_fetch(self, mock_get):
+        words = [(word, old_id) for word, old_id, languages in test_words if 'English' in languages]
+        pipeline = ParsePipeline(WiktionaryParser(), workers=2, queue_depth=3)
+        fetched = dict(pipeline.run(words, languages='English'))
+        for word, old_id in words:
+            self.assertEqual(fetched[word], WiktionaryParser().fetch(word, language='English', old_id=old_id))
+
+    def test_workers_rebuild_the_configured_parser(self):
+        parser = WiktionaryParser(slice_languages=False, glossary=GlossaryMatcher(['archaic']))
+        parser.set_default_language('swedish')
+        parser.include_part_of_speech('classifier')
+        parser.exclude_relation('synonyms')
+        config = pickle.loads(pickle.dumps(parser_config(parser)))
+        init_worker(config)
+        rebuilt = pipeline._worker_parser
+        self.assertFalse(rebuilt.slice_languages)
+        self.assertEqual(list(rebuilt.glossary.patterns), ['archaic'])
+        self.assertEqual(rebuilt.config().keys(), parser.config().keys())
+        for name in WiktionaryParser.SETTINGS:
+            self.assertEqual(getattr(rebuilt, name), getattr(parser, name))
+
+
+class TestSharedParser(unittest.TestCase):
+    @mock.patch("requests.Session.get", side_effect=mocked_requests_get)
+    def test_concurrent_fetches_match_sequential(self, mock_get):
+        shared_parser = WiktionaryParser()
+        table = get_test_words_table()
+        expected = [shared_parser.fetch(word, language=lang, old_id=old_id) for lang, word, old_id in table]
+        with ThreadPoolExecutor(4) as executor:
+            fetched = list(executor.map(lambda args: shared_parser.fetch(args[1], language=args[0], old_id=args[2]), table))
+        self.assertEqual(fetched, expected)
+
+    @mock.patch("requests.Session.get", side_effect=mocked_requests_get)
+    def test_chinese_does_not_grow_parts_of_speech(self, mock_get):
+        shared_parser = WiktionaryParser()
+        parts_of_speech = shared_parser.PARTS_OF_SPEECH
+        shared_parser.fetch('house', language='chinese', old_id=50356446)
+        self.assertEqual(shared_parser.PARTS_OF_SPEECH, parts_of_speech)
+        self.assertEqual(len(PARTS_OF_SPEECH), len(set(PARTS_OF_SPEECH)))
+
+    def test_include_exclude(self):
+        shared_parser = WiktionaryParser()
+        shared_parser.include_relation('Alternative forms')
+        shared_parser.exclude_part_of_speech('noun')
+        self.assertIn('alternative forms', shared_parser.INCLUDED_ITEMS)
+        self.assertNotIn('noun', shared_parser.INCLUDED_ITEMS)
+        with self.assertRaises(ValueError):
+            shared_parser.exclude_part_of_speech('noun')
+
+
+class TestSectionIndex(unittest.TestCase):
+    def setUp(self):
+        filepath = os.path.join(html_test_files_dir, 'house-50356446.html')
+        with open(filepath, 'r', encoding='utf-8') as f:
+            self.soup = BeautifulSoup(f.read().replace('>\n<', '><'), 'html.parser')
+        self.sections = SectionIndex(self.soup)
+
+    def test_toc_numbers_map_to_heading_ids(self):
+        for section in self.sections.toc:
+            self.assertIs(self.sections.by_number[section.number], section)
+            self.assertEqual(self.sections.get(section.id).anchor,
+                             self.soup.find_all('span', {'id': section.id})[0])
+
+    def test_subsections_are_nested_under_number(self):
+        english = self.sections.toc[0]
+        subsections = self.sections.subsections(english.number)
+        self.assertTrue(subsections)
+        for section in subsections:
+            self.assertTrue(section.number.startswith(english.number + '.'))
+
+    def test_sibling_range_stops_at_next_heading(self):
+        section = self.sections.get('Noun')
+        expected = []
+        tag = section.heading.find_next_sibling()
+        while tag is not None and tag.name not in ['h2', 'h3', 'h4', 'h5']:
+            expected.append(tag)
+            tag = tag.find_next_sibling()
+        self.assertEqual(section.nodes, expected)
+
+    def test_previous_sibling_matches_find_previous_sibling(self):
+        for tag in self.sections.get('Noun').nodes:
+            expected = tag
+            while expected.find_previous_sibling() is not None:
+                expected = expected.find_previous_sibling()
+                if expected.name in ['p', 'ol', 'ul']:
+                    break
+            self.assertIs(self.sections.previous_sibling(tag, ['p', 'ol', 'ul']), expected)
+
+    def test_nyms_map_matches_select(self):
+        for li in self.soup.find_all('li'):
+            self.assertEqual(self.sections.nyms(li), li.select('.nyms'))
+
+
+class TestSectionDispatch(unittest.TestCase):
+    def setUp(self):
+        self.parser = WiktionaryParser()
+        filepath = os.path.join(html_test_files_dir, 'house-50356446.html')
+        with open(filepath, 'r', encoding='utf-8') as f:
+            self.ctx = self.parser.load_html(f.read(), word='house')
+        self.ctx.language = 'english'
+        english = self.ctx.sections.toc[0]
+        self.word_contents = self.ctx.sections.subsections(english.number)
+
+    def test_sections_are_queued_by_kind_in_document_order(self):
+        queues = self.parser.dispatch_sections(self.ctx, self.word_contents)
+        self.assertTrue(queues['etymologies'])
+        self.assertEqual({title for _, _, title in queues['etymologies']}, {'etymology'})
+        self.assertIn('noun', [title for _, _, title in queues['definitions']])
+        self.assertEqual([index for index, _, _ in queues['nyms']],
+                         [section.number for section in self.word_contents])
+
+    def test_sections_found_by_title_follow_the_configured_order(self):
+        with open(os.path.join(html_test_files_dir, 'song-60388804.html'), 'r', encoding='utf-8') as f:
+            ctx = self.parser.load_html(f.read(), word='song')
+        ctx.language = 'mandarin'
+        self.parser.include_part_of_speech('Classifier')
+        titles = [title for _, _, title in self.parser.dispatch_sections(ctx, [])['definitions']]
+        self.assertEqual(titles, ['noun', 'verb', 'adjective', 'adverb', 'numeral'])
+        self.assertEqual(max(self.parser.SECTION_ORDER.values()), self.parser.SECTION_ORDER['classifier'])
+
+    def test_categories_are_computed_once_per_page(self):
+        categories = self.parser.parse_categories(self.ctx)
+        self.assertTrue(categories)
+        self.assertEqual(categories, sorted({li.text for li in self.ctx.soup.select('#mw-normal-catlinks>ul>li')}))
+        self.ctx.soup.find(id='mw-normal-catlinks').decompose()
+        self.assertEqual(self.parser.parse_categories(self.ctx), categories)
+
+
+class TestLanguageSlicing(unittest.TestCase):
+    def setUp(self):
+        with open(os.path.join(html_test_files_dir, 'by-50399022.html'), 'r', encoding='utf-8') as f:
+            self.html = f.read()
+
+    def test_slice_keeps_requested_language_and_categories(self):
+        sliced = slice_languages(self.html, ['swedish'])
+        self.assertLess(len(sliced), len(self.html))
+        sections = SectionIndex(BeautifulSoup(sliced, 'html.parser'))
+        self.assertIn('Swedish', sections)
+        self.assertNotIn('English', sections)
+        self.assertIn('id="mw-normal-catlinks"', sliced)
+
+    def test_unexpected_layout_is_not_sliced(self):
+        self.assertIsNone(slice_languages('<html><body><h2>Swedish</h2></body></html>', ['swedish']))
+        self.assertIsNone(slice_languages(self.html, ['klingon']))
+
+    @mock.patch("requests.Session.get", side_effect=mocked_requests_get)
+    def test_sliced_parse_matches_full_parse(self, mock_get):
+        for word, old_id, languages in [('by', 50399022, ['swedish', 'norwegian']), ('house', 50356446, ['english'])]:
+            expected = WiktionaryParser(slice_languages=False).fetch(word, language=languages, old_id=old_id)
+            self.assertEqual(WiktionaryParser().fetch(word, language=languages, old_id=old_id), expected)
+
+    @mock.patch("requests.Session.get", side_effect=mocked_requests_get)
+    def test_language_without_included_sections_is_read_from_the_full_page(self, mock_get):
+        # The Mandarin section of "song" only has a Romanization subsection.
+        expected = WiktionaryParser(slice_languages=False).fetch('song', language='mandarin', old_id=60388804)
+        self.assertTrue(expected[0]['definitions'])
+        self.assertEqual(WiktionaryParser().fetch('song', language='mandarin', old_id=60388804), expected)
+
+
+class TestFieldProjection(unittest.TestCase):
+    @mock.patch("requests.Session.get", side_effect=mocked_requests_get)
+    def test_projection_matches_full_parse(self, mock_get):
+        full = WiktionaryParser().fetch('house', old_id=50356446)
+        projected = WiktionaryParser().fetch('house', old_id=50356446, fields={'definitions', 'related'})
+        self.assertEqual(len(projected), len(full))
+        for full_record, record in zip(full, projected):
+            self.assertEqual(record['etymology'], '')
+            self.assertEqual(record['pronunciations'], {'text': [], 'audio': []})
+            self.assertEqual(record['categories'], [])
+            for full_definition, definition in zip(full_record['definitions'], record['definitions']):
+                self.assertEqual(definition['relatedWords'], full_definition['relatedWords'])
+                for text in full_definition['text']:
+                    text['examples'] = []
+                self.assertEqual(definition['text'], full_definition['text'])
+
+    def test_unknown_field(self):
+        with self.assertRaises(ValueError):
+            WiktionaryParser().get_fields({'definitions', 'translations'})
+
+
+class TestMapToObject(unittest.TestCase):
+    def test_sections_are_grouped_by_numeric_index(self):
+        word_data = {
+            'etymologies': [('1.2', 'first'), ('1.9', 'second')],
+            'pronunciations': [],
+            'definitions': [('1.1', ['orphan'], 'noun'), ('1.3', ['a'], 'noun'), ('1.10', ['b'], 'verb'), ('1.10.1', ['c'], 'noun')],
+            'related': [('1.10.1', [{'words': 'x'}], 'synonyms'), ('1.3.1', [{'words': 'y'}], 'antonyms')],
+        }
+        first, second = WiktionaryParser().map_to_object(word_data)
+        self.assertEqual([d['text'] for d in first['definitions']], [['a']])
+        self.assertEqual([d['text'] for d in second['definitions']], [['b'], ['c']])
+        self.assertEqual([r['relationshipType'] for r in first['definitions'][0]['relatedWords']], ['antonyms'])
+        self.assertEqual([[r['relationshipType'] for r in d['relatedWords']] for d in second['definitions']],
+                         [['synonyms'], ['synonyms']])
+
+
+class TestRecords(unittest.TestCase):
+    @mock.patch("requests.Session.get", side_effect=mocked_requests_get)
+    def test_records_serialize_like_dicts(self, mock_get):
+        expected = WiktionaryParser().fetch('house', old_id=50356446)
+        records = WiktionaryParser().fetch('house', old_id=50356446, as_records=True)
+        self.assertTrue(all(isinstance(record, WordData) for record in records))
+        self.assertEqual([record.to_json() for record in records], expected)
+        f = io.StringIO()
+        self.assertEqual(write_ndjson(records, f), len(records))
+        self.assertEqual([json.loads(line) for line in f.getvalue().splitlines()], json.loads(json.dumps(expected)))
+
+    @mock.patch("requests.Session.get", side_effect=mocked_requests_get)
+    def test_labels_are_interned(self, mock_get):
+        first = WiktionaryParser().fetch('house', old_id=50356446, as_records=True)
+        second = WiktionaryParser().fetch('house', old_id=50356446, as_records=True)
+        self.assertIs(first[0].definition_list[0].part_of_speech, second[0].definition_list[0].part_of_speech)
+        self.assertIs(first[0].categories[0], second[0].categories[0])
+        self.assertFalse(hasattr(first[0], '__dict__'))
+
+
+class TestProfiler(unittest.TestCase):
+    @mock.patch("requests.Session.get", side_effect=mocked_requests_get)
+    def test_phases_and_slowest_pages(self, mock_get):
+        calls = []
+        profiler = ParseProfiler(top_n=2, sample_rate=1.0, callback=lambda phase, elapsed, page: calls.append(phase))
+        profiled = WiktionaryParser(profiler=profiler)
+        for word, old_id, languages in test_words[:4]:
+            self.assertEqual(profiled.fetch(word, language=languages, old_id=old_id),
+                             WiktionaryParser().fetch(word, language=languages, old_id=old_id))
+        self.assertEqual(profiler.pages, 4)
+        for phase in ['fetch', 'decode', 'build', 'clean', 'index', 'parse_definition', 'parse_categories', 'map_to_object']:
+            self.assertIn(phase, profiler.totals)
+            self.assertIn(phase, calls)
+        slowest = profiler.slowest()
+        self.assertEqual(len(slowest), 2)
+        self.assertGreaterEqual(slowest[0].total, slowest[1].total)
+        self.assertLessEqual(sum(slowest[0].phases.values()), slowest[0].total)
+        self.assertIsNotNone(slowest[0].profile)
+        self.assertIn(slowest[0].word, profiler.report())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,114 @@
+import io
+import os
+import unittest
+
+import mock
+
+from wiktionaryparser.database import MySQLClient, write_tsv
+
+
+def offline_client(schema, binary_columns=None):
+    """A MySQLClient that knows `schema` and records its queries instead of connecting."""
+    client = MySQLClient.__new__(MySQLClient)
+    client.db = "knowledge_graph"
+    client.schema_info = dict(schema)
+    client.binary_columns = dict(binary_columns or {})
+    client.query = ""
+    client.execute = mock.MagicMock(side_effect=lambda data=None, **kwargs: [len(data)])
+    return client
+
+
+class TestUpsert(unittest.TestCase):
+    def setUp(self):
+        self.client = offline_client({"words": ["id", "word", "isDerived"]})
+
+    def test_merge_rules(self):
+        rows = [{"id": "a", "word": "x", "isDerived": 1}]
+        self.assertEqual(self.client.upsert("words", rows, merge={"id": "keep", "isDerived": "min"}), [1])
+        insert, assignments = self.client.query.split(" ON DUPLICATE KEY UPDATE ")
+        self.assertTrue(insert.startswith("INSERT INTO words ("))
+        self.assertIn("word=VALUES(word)", assignments)
+        self.assertIn("isDerived=LEAST(COALESCE(isDerived, VALUES(isDerived)), COALESCE(VALUES(isDerived), isDerived))", assignments)
+        self.assertFalse(assignments.startswith("id=") or ", id=" in assignments)
+
+    def test_custom_rule_and_keep_everything(self):
+        self.client.upsert("words", [{"id": "a", "word": "x"}], merge={"word": "{column}=CONCAT({column}, VALUES({column}))"},
+                           default_merge="keep")
+        self.assertTrue(self.client.query.endswith("ON DUPLICATE KEY UPDATE word=CONCAT(word, VALUES(word))"))
+        self.client.upsert("words", [{"id": "a"}], default_merge="keep")
+        self.assertTrue(self.client.query.startswith("INSERT IGNORE INTO words"))
+
+    def test_schema_lookup(self):
+        client = offline_client({})
+        client.execute = mock.MagicMock(return_value=[{"COLUMN_NAME": "id", "DATA_TYPE": "binary"},
+                                                      {"COLUMN_NAME": "word", "DATA_TYPE": "varchar"}])
+        self.assertEqual(client.validate_data("words", [{"id": b"a", "other": 1}]), [{"id": b"a", "word": None}])
+        self.assertEqual(client.binary_columns, {"words": {"id"}})
+        self.assertIn("TABLE_SCHEMA = 'knowledge_graph'", client.execute.call_args.args[0])
+
+    def test_no_rows(self):
+        self.assertEqual(self.client.upsert("words", []), [])
+        self.client.execute.assert_not_called()
+
+
+class TestBulkLoad(unittest.TestCase):
+    def setUp(self):
+        self.client = offline_client({"words": ["id", "word", "isDerived"]})
+        self.files = []
+
+        def execute(query=None, data=None, **kwargs):
+            if query.startswith("LOAD DATA"):
+                path = query.split("'")[1]
+                with open(path, 'r', encoding='utf8') as f:
+                    self.files.append((path, f.read()))
+            return [1]
+        self.client.execute = mock.MagicMock(side_effect=execute)
+
+    def test_tsv_escaping(self):
+        f = io.StringIO()
+        write_tsv([{"id": "a", "word": "tab\there\nnew \\ line", "isDerived": True}, {"id": "b"}], ["id", "word", "isDerived"], f)
+        self.assertEqual(f.getvalue(), "a\ttab\\there\\nnew \\\\ line\t1\nb\t\\N\t\\N\n")
+
+    def test_load_ignores_duplicates(self):
+        self.client.bulk_load("words", [{"id": "a", "word": "x"}])
+        query = self.client.execute.call_args_list[0].args[0]
+        self.assertIn("IGNORE INTO TABLE words", query)
+        self.assertTrue(query.endswith("(id, word, isDerived)"))
+        path, content = self.files[0]
+        self.assertEqual(content, "a\tx\t\\N\n")
+        self.assertFalse(os.path.exists(path))
+
+    def test_load_with_merge_goes_through_a_staging_table(self):
+        self.client.bulk_load("words", [{"id": "a", "word": "x", "isDerived": 0}], merge={"id": "keep", "isDerived": "min"})
+        queries = [call.args[0] for call in self.client.execute.call_args_list]
+        self.assertEqual(queries[1], "CREATE TEMPORARY TABLE words_load LIKE words")
+        self.assertIn("INTO TABLE words_load", queries[2])
+        self.assertTrue(queries[3].startswith("INSERT INTO words (id, word, isDerived) SELECT id, word, isDerived FROM words_load "
+                                              "ON DUPLICATE KEY UPDATE words.word=VALUES(words.word), words.isDerived=LEAST("))
+        self.assertEqual(queries[-1], "DROP TEMPORARY TABLE IF EXISTS words_load")
+
+    def test_binary_ids_are_loaded_through_unhex(self):
+        self.client.binary_columns = {"words": {"id"}}
+        # The column type decides, whatever the first rows hold.
+        self.client.bulk_load("words", [{"id": None, "word": "x"}] * 150 + [{"id": b"\x00\xff", "word": "y"}])
+        query = self.client.execute.call_args_list[0].args[0]
+        self.assertTrue(query.endswith("(@id, word, isDerived) SET id=UNHEX(@id)"))
+        self.assertTrue(self.files[0][1].endswith("\\N\tx\t\\N\n00ff\ty\t\\N\n"))
+        self.assertEqual(self.client._build_conditions({"id": [b"\x0a", "b"]}), " WHERE id IN (X'0a', 'b')")
+
+    def test_validate_constraints(self):
+        results = {
+            "KEY_COLUMN_USAGE": [{"CONSTRAINT_NAME": "fk_wordId", "TABLE_NAME": "definitions", "COLUMN_NAME": "wordId",
+                                  "REFERENCED_TABLE_NAME": "words", "REFERENCED_COLUMN_NAME": "id"}],
+            "STATISTICS": [{"TABLE_NAME": "words", "INDEX_NAME": "PRIMARY", "COLUMNS": "id"}],
+            "LEFT JOIN": [{"n": 3}],
+            "HAVING": [{"n": 0}],
+        }
+        self.client.execute = mock.MagicMock(side_effect=lambda query, **kwargs: next(
+            (v for k, v in results.items() if k in query), [3]))
+        self.assertEqual(self.client.validate_constraints(delete=True), {"definitions.fk_wordId": 3})
+        self.assertTrue(self.client.execute.call_args_list[2].args[0].startswith("DELETE c FROM definitions c LEFT JOIN words p"))
+
+
+if __name__ == '__main__':
+    unittest.main()
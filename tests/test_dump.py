@@ -0,0 +1,132 @@
+import bz2
+import io
+import json
+import os
+import re
+import tarfile
+import tempfile
+import unittest
+
+import mock
+from bs4 import BeautifulSoup
+
+from wiktionaryparser import WiktionaryParser
+from wiktionaryparser.dump import DumpIngestor, iter_dump_pages, iter_ndjson_pages, legacy_layout, toc_numbers
+
+
+tests_dir = os.path.dirname(__file__)
+html_test_files_dir = os.path.join(tests_dir, 'html_test_files')
+
+
+def read_test_file(name):
+    with open(os.path.join(html_test_files_dir, name), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def to_parsoid(html):
+    """Lay a rendered test page out like Parsoid HTML: nested sections, ids on headings, category links, no TOC."""
+    soup = BeautifulSoup(html, 'html.parser')
+    soup.find(id='toc').decompose()
+    for span in soup.find_all('span', class_='mw-headline'):
+        span.parent['id'] = span['id']
+        span.unwrap()
+    catlinks = soup.find(id='catlinks')
+    links = ''.join(f'<link rel="mw:PageProp/Category" href="./{a["href"][len("/wiki/"):]}#Sortkey"/>'
+                    for a in catlinks.find(id='mw-normal-catlinks').find_all('a')[1:])
+    catlinks.decompose()
+    markup, open_levels, parts, position = str(soup), [], [], 0
+    for match in re.finditer(r'<h([2-6])\b', markup):
+        level = int(match.group(1))
+        parts.append(markup[position:match.start()])
+        while open_levels and open_levels[-1] >= level:
+            parts.append('</section>')
+            open_levels.pop()
+        parts.append(f'<section data-mw-section-id="{len(parts)}">')
+        open_levels.append(level)
+        position = match.start()
+    end = markup.find('<div class="printfooter"')
+    parts.append(markup[position:end] + '</section>' * len(open_levels) + links + markup[end:])
+    return ''.join(parts)
+
+
+def enterprise_record(name, html, revision=1, namespace=0):
+    return {"name": name, "namespace": {"identifier": namespace}, "version": {"identifier": revision},
+            "article_body": {"html": html}}
+
+
+class TestReaders(unittest.TestCase):
+    def test_ndjson_pages(self):
+        lines = [
+            json.dumps({"title": "house", "html": "<p>house</p>", "oldid": 50356446}),
+            "",
+            json.dumps(enterprise_record("test", "<p>test</p>", revision=7)),
+            json.dumps(enterprise_record("Category:English nouns", "<p></p>", namespace=14)),
+        ]
+        pages = list(iter_ndjson_pages(io.BytesIO('\n'.join(lines).encode())))
+        self.assertEqual(pages, [("house", "<p>house</p>", 50356446), ("test", "<p>test</p>", 7)])
+
+    def test_compressed_and_tar_dumps(self):
+        content = (json.dumps(enterprise_record("test", "<p>test</p>")) + '\n').encode()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'pages.ndjson.bz2')
+            with bz2.open(path, 'wb') as f:
+                f.write(content)
+            self.assertEqual(list(iter_dump_pages(path)), [("test", "<p>test</p>", 1)])
+
+            path = os.path.join(tmp, 'pages.json.tar.gz')
+            with tarfile.open(path, 'w:gz') as archive:
+                member = tarfile.TarInfo('enwiktionary_0.ndjson')
+                member.size = len(content)
+                archive.addfile(member, io.BytesIO(content))
+            self.assertEqual(list(iter_dump_pages(path)), [("test", "<p>test</p>", 1)])
+
+    def test_xml_dumps_are_refused(self):
+        with self.assertRaises(ValueError):
+            list(iter_dump_pages('enwiktionary-pages-articles-multistream.xml.bz2'))
+
+
+class TestLegacyLayout(unittest.TestCase):
+    def test_toc_numbers(self):
+        self.assertEqual(toc_numbers([2, 3, 3, 4, 2, 4, 3]), ['1', '1.1', '1.2', '1.2.1', '2', '2.1', '2.2'])
+
+    def test_parsoid_page_parses_like_the_rendered_page(self):
+        html = read_test_file('house-50356446.html')
+        parsoid = to_parsoid(html)
+        self.assertNotIn('mw-headline', parsoid)
+        parser = WiktionaryParser()
+        self.assertEqual(parser.parse_html(parsoid, lang='english', word='house'), [])
+        expected = parser.parse_html(html, lang=['english', 'dutch'], word='house')
+        self.assertEqual(parser.parse_html(legacy_layout(parsoid), lang=['english', 'dutch'], word='house'), expected)
+        self.assertTrue(expected[0]['categories'])
+
+    def test_rendered_pages_are_unchanged(self):
+        html = read_test_file('test-50342756.html')
+        self.assertIs(legacy_layout(html), html)
+
+
+class TestDumpIngestor(unittest.TestCase):
+    def test_ingest(self):
+        pages = [
+            enterprise_record("house", to_parsoid(read_test_file('house-50356446.html'))),
+            # A page the extractor fails on must not stop the ingestion.
+            {"title": "broken", "html": ["not", "markup"]},
+            {"title": "empty", "html": None},
+            enterprise_record("test", to_parsoid(read_test_file('test-50342756.html'))),
+        ]
+        collector = mock.MagicMock()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'pages.ndjson')
+            with open(path, 'w', encoding='utf8') as f:
+                f.write('\n'.join(json.dumps(page) for page in pages))
+            ingestor = DumpIngestor(collector, languages=['english'], workers=1, max_pending=2)
+            stats = ingestor.ingest(path)
+        self.assertEqual(stats['read'], 4)
+        self.assertEqual((stats['parsed'], stats['failed'], stats['skipped']), (2, 1, 1))
+        self.assertEqual(ingestor.failed, ['broken'])
+        self.assertGreater(stats['records'], 0)
+        saved = [call.args[0] for call in collector.save_word.call_args_list]
+        self.assertEqual(sorted({record['query'] for records in saved for record in records}), ['house', 'test'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import json
+import os
+import tempfile
+import unittest
+
+from wiktionaryparser.glossary import GlossaryMatcher, compile_other
+
+
+class TestGlossaryMatcher(unittest.TestCase):
+    def test_known_labels_are_compiled_up_front(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'appendix.json')
+            with open(path, 'w', encoding='utf8') as f:
+                json.dump([{"label": "transitive"}, {"label": "obsolete"}, {"label": "*"}], f)
+            matcher = GlossaryMatcher.from_json(path)
+        self.assertEqual(sorted(matcher.patterns), ['obsolete', 'transitive'])
+
+    def test_strip_removes_labels_in_order(self):
+        matcher = GlossaryMatcher(['transitive'])
+        self.assertEqual(matcher.strip('(transitive) To hit.', ['transitive']), 'To hit.')
+        self.assertEqual(matcher.strip('(transitive, intransitive) To go.', ['transitive', 'intransitive']), '(, in) To go.')
+        # Labels that are not known are cached apart, in a bounded cache.
+        self.assertEqual(sorted(matcher.patterns), ['transitive'])
+
+    def test_other_labels_cache_is_bounded(self):
+        matcher = GlossaryMatcher(['transitive'])
+        for i in range(GlossaryMatcher.OTHER_LABELS + 10):
+            matcher.strip(f'(qualifier {i}) text', [f'qualifier {i}'])
+        self.assertEqual(len(matcher), 1)
+        self.assertEqual(compile_other.cache_info().currsize, GlossaryMatcher.OTHER_LABELS)
+
+    def test_missing_appendix_file(self):
+        self.assertEqual(len(GlossaryMatcher.from_json('/nonexistent/appendix.json')), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
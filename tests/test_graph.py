@@ -0,0 +1,44 @@
+import hashlib
+import unittest
+
+import mock
+
+try:
+    from wiktionaryparser.graph import GraphBuilder
+except ImportError:  # dgl and torch are optional
+    GraphBuilder = None
+
+
+def binary_id(text):
+    return hashlib.sha256(text.encode()).digest()
+
+
+@unittest.skipIf(GraphBuilder is None, "dgl and torch are not installed")
+class TestGraphBuilder(unittest.TestCase):
+    def test_binary_ids_become_hex_node_ids(self):
+        house, home, noun = binary_id("house"), binary_id("home"), binary_id("Category:en:Nouns")
+        tables = {
+            "words w": [{"id": house, "word": "house", "language": "english", "wikiUrl": "/wiki/house", "partOfSpeech": "noun"},
+                        {"id": home, "word": "home", "language": "english", "wikiUrl": "/wiki/home", "partOfSpeech": "noun"}],
+            "relationships": [{"headId": house, "headPOS": "noun", "head": "house", "relationshipType": "synonyms",
+                               "tail": "home", "tailPOS": "noun", "tailId": home}],
+            "word_categories": [{"headId": house, "headPOS": "noun", "head": "house", "tailId": noun, "tail": "en:Nouns",
+                                 "relationshipType": "categoryOf"}],
+            "categories": [{"id": noun, "text": "en:Nouns", "title": "Category:en:Nouns"}],
+        }
+        conn = mock.MagicMock()
+        conn.read.side_effect = lambda collection_name, **kwargs: [dict(row) for row in tables[collection_name]]
+        builder = GraphBuilder(conn)
+        builder.build_graph("d2w", category_info=True)
+        self.assertEqual(sorted(builder.vocab), sorted([house.hex(), home.hex(), noun.hex()]))
+        self.assertEqual(builder.node_ids["category"], [noun.hex()])
+        for node_ids in builder.node_ids.values():
+            for node_id in node_ids:
+                self.assertEqual(builder.vocab[node_id]['id'], node_id)
+        # Category ids are looked up with the ids the database returned.
+        self.assertIn(noun, [call.kwargs['conditions']['id'] for call in conn.read.call_args_list
+                             if call.kwargs.get('collection_name') == 'categories'][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
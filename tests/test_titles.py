@@ -0,0 +1,90 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+import mock
+
+from wiktionaryparser import WiktionaryParser
+from wiktionaryparser.titles import BloomFilter, TitleIndex, VariantIndex
+
+
+class TestTitleIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.titles_path = os.path.join(self.tmp_dir.name, 'all-titles-in-ns0.gz')
+        self.titles = [f'word_{i}' for i in range(2000)] + ['سماء', 'أسماء', 'البيت_الأبيض']
+        with gzip.open(self.titles_path, 'wt', encoding='utf-8') as f:
+            f.write('page_title\n' + '\n'.join(self.titles) + '\n')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_no_false_negatives(self):
+        index = TitleIndex.from_titles_file(self.titles_path)
+        for title in self.titles:
+            self.assertIn(title, index)
+        self.assertIn('البيت الأبيض', index)
+        self.assertNotIn('page_title', index)
+
+    def test_false_positive_rate(self):
+        index = TitleIndex.from_titles(self.titles, error_rate=0.01)
+        false_positives = sum(f'missing_{i}' in index for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_saved_filter_is_memory_mapped(self):
+        index = TitleIndex.from_titles_file(self.titles_path)
+        path = os.path.join(self.tmp_dir.name, 'titles.bloom')
+        index.save(path)
+        loaded = TitleIndex.load(path)
+        self.assertIsInstance(loaded.bloom.bits, memoryview)
+        for title in self.titles:
+            self.assertIn(title, loaded)
+        with open(path, 'wb') as f:
+            f.write(b'x' * BloomFilter.header.size)
+        with self.assertRaises(ValueError):
+            TitleIndex.load(path)
+
+    def test_fetch_all_potential_skips_missing_titles(self):
+        index = TitleIndex.from_titles(self.titles, error_rate=0.0001)
+        parser = WiktionaryParser(title_index=index)
+        with mock.patch.object(parser, 'fetch', return_value=[{}]) as fetch:
+            result = parser.fetch_all_potential('اسماء')
+        self.assertEqual(sorted(call.args[0] for call in fetch.call_args_list), ['أسماء'])
+        self.assertEqual(result['اسماء'], [])
+        self.assertEqual(index.stats, {"checked": 17, "pruned": 16})
+
+
+class TestVariantIndex(unittest.TestCase):
+    titles = ['سماء', 'أسماء', 'إسماء', 'البيت_الأبيض', 'house']
+
+    def test_lookup_returns_existing_spellings(self):
+        index = VariantIndex.from_titles(self.titles)
+        self.assertEqual(index.lookup('اسماء'), ['أسماء', 'إسماء'])
+        self.assertEqual(index.lookup('البيت الابيض'), ['البيت_الأبيض'])
+        self.assertEqual(index.lookup('ارض'), [])
+        self.assertFalse(index.exists('اسماء'))
+        self.assertTrue(index.exists('أسماء'))
+
+    def test_fetch_all_potential_uses_lookup(self):
+        parser = WiktionaryParser(variant_index=VariantIndex.from_titles(self.titles, complete=True))
+        with mock.patch.object(parser, 'fetch', return_value=[{}]) as fetch:
+            result = parser.fetch_all_potential('اسماء')
+        self.assertEqual([call.args[0] for call in fetch.call_args_list], ['أسماء', 'إسماء'])
+        self.assertEqual(sorted(result), ['أسماء', 'إسماء', 'اسماء'])
+
+    def test_database_index_does_not_prune_the_word(self):
+        conn = mock.MagicMock()
+        conn.read.return_value = [{"wikiUrl": "/wiki/%D8%A3%D8%B3%D9%85%D8%A7%D8%A1#Arabic"}, {"wikiUrl": None}]
+        index = VariantIndex.from_database(conn)
+        self.assertFalse(index.complete)
+        self.assertEqual(index.lookup('اسماء'), ['أسماء'])
+        parser = WiktionaryParser(variant_index=index)
+        with mock.patch.object(parser, 'fetch', return_value=[{}]) as fetch:
+            result = parser.fetch_all_potential('كتاب')
+        self.assertEqual([call.args[0] for call in fetch.call_args_list], ['كتاب'])
+        self.assertEqual(result, {'كتاب': [{}]})
+
+
+if __name__ == '__main__':
+    unittest.main()